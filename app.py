@@ -1,19 +1,25 @@
 # app.py 
 import streamlit as st
-from mood_analyzer import MoodAnalyzer
 from music_parameters import MusicParameters
-from music_generator import MusicGenerator
-from audio_visualizer import AudioVisualizer
 from config import Config
 from auth import AuthSystem, UserHistory
-import tempfile
+from model_warmup import ModelWarmer
+from generation_worker import AdmissionRejected, InlineWorker, JobQueue, WorkerPool
+from audio_pool import AudioPool
+import audio_storage
+import media_server
+import scratch_space
+import tracing
 import os
 import warnings
-import time
 import json
 from datetime import datetime
 import base64
 
+# NOTE: mood_analyzer, music_generator and audio_visualizer pull in torch,
+# transformers, librosa, scipy and matplotlib. They are imported lazily in
+# show_composer() so the login, history and profile pages start without them.
+
 # Suppress pydub warnings if any
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="pydub.utils")
 
@@ -38,6 +44,140 @@ else:
 auth_system = AuthSystem()
 user_history = UserHistory()
 
+@st.cache_resource(show_spinner=False)
+def get_model_warmer():
+    """Process-wide model preloader shared by every session"""
+    # With generation workers the music model lives in the worker processes
+    return ModelWarmer(load_music_generator=not Config.USE_GENERATION_WORKERS).start()
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_server():
+    """Prometheus text endpoint for the stage metrics of this process and its workers"""
+    # Queue gauges are read from the shared job table, so they cover every worker process
+    tracing.metrics.add_collector(JobQueue().export_metrics)
+    # Stage histograms and counters recorded in worker processes
+    tracing.metrics.add_collector(tracing.collect_process_metrics)
+    return tracing.start_metrics_server(Config.METRICS_PORT)
+
+@st.cache_resource(show_spinner=False)
+def get_worker_pool():
+    """Generation worker processes owned by this app process"""
+    return WorkerPool().start()
+
+@st.cache_resource(show_spinner=False)
+def get_media_server():
+    """HTTP endpoint streaming history audio by URL (see media_server.py)"""
+    return media_server.start_media_server(db_path=user_history.db_path)
+
+@st.cache_resource(show_spinner=False)
+def get_storage_compactor():
+    """Background re-encoding and quota enforcement for history audio"""
+    return audio_storage.StorageCompactor(user_history.db_path).start()
+
+@st.cache_resource(show_spinner=False)
+def get_inline_worker():
+    """Job runner thread in this process when generation workers are disabled"""
+    return InlineWorker(get_model_warmer()).start()
+
+def get_job_queue():
+    """Generation job queue; starts whatever runs its jobs on first use if the app owns it"""
+    if not Config.USE_GENERATION_WORKERS:
+        get_inline_worker()
+    elif Config.SPAWN_WORKERS_WITH_APP:
+        get_worker_pool()
+    return JobQueue()
+
+@st.cache_resource(show_spinner=False)
+def get_scratch_sweeper():
+    """Background cleanup of job audio directories in the scratch space"""
+    return scratch_space.ScratchSweeper(Config.JOBS_DB_PATH).start()
+
+@st.cache_resource(show_spinner=False)
+def get_audio_pool():
+    """Pre-generated clips for the common moods, refilled while the workers are idle"""
+    pool = AudioPool(get_job_queue()).start()
+    tracing.metrics.add_collector(pool.export_metrics)
+    return pool
+
+def history_expander(label, key, expanded=False):
+    """
+    st.expander that tracks whether it is open, so closed history entries
+    skip their body. Read `.open` with getattr: it is missing on Streamlit
+    versions without expander state, and None when Config.HISTORY_LAZY_ENTRIES
+    is off; both mean render everything.
+    """
+    if Config.HISTORY_LAZY_ENTRIES:
+        try:
+            return st.expander(label, expanded=expanded, key=key, on_change="rerun")
+        except TypeError:
+            pass
+    return st.expander(label, expanded=expanded)
+
+def describe_progress(progress):
+    """Progress bar fraction and label from a MusicGenerator progress report"""
+    fraction = progress['tokens'] / max(progress['total_tokens'], 1)
+    label = f"🎼 Composing... {progress['tokens']}/{progress['total_tokens']} tokens"
+    if progress['tokens_per_second']:
+        label += f" · {progress['tokens_per_second']:.0f} tokens/s"
+    if progress['eta_seconds'] is not None:
+        label += f" · about {progress['eta_seconds']:.0f}s left"
+    return min(fraction, 1.0), label
+
+def finish_generation_job(job):
+    """Move a finished job's result into the session (the worker already saved it to history)"""
+    st.session_state.generation_job_id = None
+    if job is None or job['status'] == 'cancelled':
+        st.session_state.generation_notice = ('warning', "Generation cancelled.")
+        return
+    is_preview = job['params'].get('preview')
+    if job['status'] == 'failed':
+        st.session_state.generation_notice = (
+            'error', f"{'Preview' if is_preview else 'Music generation'} failed: {job['error']}"
+        )
+        return
+    if is_preview:
+        st.session_state.preview = {'prompt': job['prompt'], 'wav_path': job['wav_path'], 'job_id': job['id']}
+        return
+
+    import soundfile as sf
+    st.session_state.generated_audio, st.session_state.generated_sample_rate = sf.read(
+        job['wav_path'], dtype='float32'
+    )
+    st.session_state.wav_file_path = job['wav_path']
+    st.session_state.mp3_file_path = job['mp3_path']
+    st.session_state.generation_time = job['generation_time']
+    st.session_state.preview = None
+    get_storage_compactor().request(st.session_state.user_email)
+    # Navigate to history and autoplay the latest once
+    st.session_state.autoplay_latest_once = True
+    st.session_state.current_page = 'history'
+
+@st.fragment(run_every=Config.JOB_POLL_INTERVAL)
+def show_generation_job():
+    """
+    Status of the session's background job. Only this fragment reruns while
+    polling, so the rest of the page stays usable; the whole app reruns
+    once the job finishes.
+    """
+    job_id = st.session_state.get('generation_job_id')
+    if not job_id:
+        return
+    job_queue = get_job_queue()
+    job = job_queue.get_job(job_id)
+    if job is None or job['status'] in ('done', 'failed', 'cancelled'):
+        finish_generation_job(job)
+        st.rerun()
+
+    what = "preview" if job['params'].get('preview') else "music"
+    if job['status'] == 'queued':
+        st.caption(f"⏳ Your {what} is waiting for a free worker ({job_queue.queue_depth()} job(s) queued)")
+    elif job['progress']:
+        st.progress(*describe_progress(job['progress']))
+    else:
+        st.caption(f"🎼 A worker is composing your {what}...")
+    if st.button("🛑 Cancel generation", key="cancel_generation"):
+        job_queue.cancel(job_id)
+
 def show_login_page():
     """Display login/signup page with Login and Sign up tabs"""
     st.markdown("""
@@ -195,6 +335,8 @@ def show_dashboard():
             'history': '📜 Generation History',
             'profile': '👤 Profile Settings'
         }
+        if st.session_state.user_email in Config.ADMIN_EMAILS:
+            page_options['admin'] = '🛠️ Admin'
         
         selected_page = st.radio(
             "Navigation",
@@ -220,20 +362,29 @@ def show_dashboard():
         show_history()
     elif st.session_state.current_page == 'profile':
         show_profile()
+    elif st.session_state.current_page == 'admin':
+        show_admin()
 
 def show_composer():
     """Main music composition interface"""
+    # Use the shared, preloaded models once the warm-up has finished
+    models_warming = False
+    if Config.PRELOAD_MODELS:
+        warmer = get_model_warmer()
+        if warmer.ready:
+            st.session_state.mood_analyzer = warmer.mood_analyzer
+        elif not warmer.failed:
+            models_warming = True
+
     # Initialize components in session_state (once)
-    if 'mood_analyzer' not in st.session_state:
+    if not models_warming and 'mood_analyzer' not in st.session_state:
         with st.spinner("Loading Mood Analysis models..."):
+            from mood_analyzer import MoodAnalyzer
             st.session_state.mood_analyzer = MoodAnalyzer()
     if 'music_params' not in st.session_state:
         st.session_state.music_params = MusicParameters()
-    if 'music_generator' not in st.session_state:
-        with st.spinner("Loading Music Generation models..."):
-            # Use cached or persistent generator; heavy model load only once
-            st.session_state.music_generator = MusicGenerator()
     if 'audio_visualizer' not in st.session_state:
+        from audio_visualizer import AudioVisualizer
         st.session_state.audio_visualizer = AudioVisualizer()
 
     # initialize other session keys
@@ -251,6 +402,13 @@ def show_composer():
         st.session_state.mp3_file_path = None
     if 'generation_time' not in st.session_state:
         st.session_state.generation_time = None
+    if 'preview' not in st.session_state:
+        st.session_state.preview = None
+    # A background job outlives reruns via the session, and reconnects via SQLite
+    if not st.session_state.get('generation_job_id'):
+        active_job = get_job_queue().active_job(st.session_state.user_email)
+        st.session_state.generation_job_id = active_job['id'] if active_job else None
+    job_running = bool(st.session_state.generation_job_id)
 
     # --- Header Section ---
     st.markdown("""
@@ -262,6 +420,15 @@ def show_composer():
     </div>
     """, unsafe_allow_html=True)
 
+    if models_warming:
+        col_warm, col_check = st.columns([4, 1])
+        with col_warm:
+            st.info(f"🔥 MelodAI is warming up its AI models ({warmer.message}). "
+                    "You can start typing; analysis and generation unlock when ready.")
+        with col_check:
+            if st.button("🔄 Check again", use_container_width=True):
+                st.rerun()
+
     # --- Input Section ---
     st.markdown("""
     <div class="input-section">
@@ -319,26 +486,37 @@ def show_composer():
                 st.session_state.generated_audio = None
                 st.session_state.wav_file_path = None
                 st.session_state.mp3_file_path = None
+                st.session_state.preview = None
                 st.rerun()
 
     # No manual session_state update needed; the widget manages it via key
 
-    # Buttons for analyze and generate
-    col_analyze, col_generate = st.columns(2)
+    # Buttons for analyze, preview and generate
+    col_analyze, col_preview, col_generate = st.columns(3)
 
     with col_analyze:
         analyze_btn = st.button(
             "🎶 ANALYZE MOOD & PARAMETERS",
             use_container_width=True,
-            disabled=not user_text.strip(),
+            disabled=models_warming or not user_text.strip(),
             help="Analyze your text to determine mood and generate music parameters"
         )
 
+    with col_preview:
+        preview_btn = st.button(
+            "⚡ QUICK PREVIEW",
+            use_container_width=True,
+            disabled=models_warming or job_running
+                     or not (st.session_state.mood_analysis and st.session_state.music_params_result),
+            help=f"Hear a {Config.PREVIEW_DURATION}-second preview first, then continue it to full length"
+        )
+
     with col_generate:
         generate_music_btn = st.button(
             "🎹 GENERATE MUSIC",
             use_container_width=True,
-            disabled=not (st.session_state.mood_analysis and st.session_state.music_params_result),
+            disabled=models_warming or job_running
+                     or not (st.session_state.mood_analysis and st.session_state.music_params_result),
             type="primary",
             help="Generate actual music based on your mood analysis (may take 1-2 minutes)"
         )
@@ -347,60 +525,88 @@ def show_composer():
 
     # --- Analyze Button Logic ---
     if analyze_btn and user_text:
-        with st.spinner("🎵 Analyzing your mood and generating music parameters..."):
+        with tracing.trace("analyze", user=st.session_state.user_email), \
+                st.spinner("🎵 Analyzing your mood and generating music parameters..."):
             st.session_state.mood_analysis = st.session_state.mood_analyzer.analyze_mood(user_text)
             st.session_state.music_params_result = st.session_state.music_params.get_music_parameters(st.session_state.mood_analysis)
             # Clear any previous generated audio
             st.session_state.generated_audio = None
             st.session_state.wav_file_path = None
             st.session_state.mp3_file_path = None
+            st.session_state.preview = None
+
+    # --- Preview Button Logic ---
+    if preview_btn and user_text:
+        with tracing.trace("preview", user=st.session_state.user_email):
+            prompt = st.session_state.music_params_result.get('musicgen_prompt', user_text)
+            st.session_state.preview = None
+            try:
+                job_id = get_job_queue().submit(prompt, user_email=st.session_state.user_email,
+                                                duration=Config.PREVIEW_DURATION, preview=True)
+                tracing.set_attribute("job_id", job_id)
+                st.session_state.generation_job_id = job_id
+            except AdmissionRejected as e:
+                st.warning(f"⏳ {e}")
+
+    continue_btn = False
+    if st.session_state.preview and os.path.exists(st.session_state.preview['wav_path']):
+        st.markdown(f"**⚡ Preview ({Config.PREVIEW_DURATION} seconds)**")
+        with open(st.session_state.preview['wav_path'], "rb") as f:
+            st.audio(f.read(), format="audio/wav")
+        continue_btn = st.button(
+            "▶️ Continue to full length",
+            disabled=models_warming or bool(st.session_state.generation_job_id),
+            help="Extends this preview instead of composing from scratch"
+        )
 
     # --- Generate Button Logic ---
-    if generate_music_btn and user_text:
-        start_time = time.time()
-        with st.spinner("🎵 Composing your personalized music (this may take 1-2 minutes)..."):
+    if (generate_music_btn or continue_btn) and user_text and not st.session_state.generation_job_id:
+        with tracing.trace("compose", user=st.session_state.user_email):
             # Ensure mood analysis present
             if not st.session_state.mood_analysis:
                 st.session_state.mood_analysis = st.session_state.mood_analyzer.analyze_mood(user_text)
                 st.session_state.music_params_result = st.session_state.music_params.get_music_parameters(st.session_state.mood_analysis)
 
-            # Build prompt and generate
+            # Build prompt and queue the job; the worker saves the result to the user's history
             prompt = st.session_state.music_params_result.get('musicgen_prompt', user_text)
-            # generate_music should return a numpy array with audio samples
-            generated_audio = st.session_state.music_generator.generate_music(prompt)
-            st.session_state.generated_audio = generated_audio
-
-            # Save audio to temp directory (returns wav_path, mp3_path)
-            if st.session_state.generated_audio is not None:
-                temp_dir = tempfile.mkdtemp()
-                base_wav_path = os.path.join(temp_dir, "generated_music.wav")
-                wav_path, mp3_path = st.session_state.music_generator.save_audio(
-                    st.session_state.generated_audio,
-                    base_wav_path
-                )
-                st.session_state.wav_file_path = wav_path
-                st.session_state.mp3_file_path = mp3_path
-
-        st.session_state.generation_time = time.time() - start_time
-        
-        # Save to user history
-        if st.session_state.generated_audio is not None:
-            # Read audio file for saving
-            with open(st.session_state.mp3_file_path or st.session_state.wav_file_path, "rb") as f:
-                audio_data = f.read()
-                
-            user_history.save_generation(
-                st.session_state.user_email,
-                user_text,
-                st.session_state.mood_analysis,
-                st.session_state.music_params_result,
-                audio_data,
-                st.session_state.generation_time
-            )
-            # After saving, navigate to history and autoplay the latest once
-            st.session_state.autoplay_latest_once = True
-            st.session_state.current_page = 'history'
-            st.rerun()
+            preview = st.session_state.preview if continue_btn else None
+            if preview:
+                # Continue the preview's audio codes rather than starting over
+                prompt = preview['prompt']
+            st.session_state.generated_audio = None
+            history = {
+                'input_text': user_text,
+                'mood_analysis': st.session_state.mood_analysis,
+                'music_params': st.session_state.music_params_result.to_dict(),
+            }
+            try:
+                job = None
+                if not preview and Config.POOL_CLIPS_PER_KEY:
+                    # A pooled clip comes back as an already finished job
+                    with tracing.span("pool_serve"):
+                        job = get_audio_pool().serve(st.session_state.music_params_result,
+                                                     st.session_state.user_email, history)
+                    tracing.set_attribute("pool_hit", job is not None)
+                if job is not None:
+                    job_id = job['id']
+                else:
+                    job_id = get_job_queue().submit(
+                        prompt,
+                        user_email=st.session_state.user_email,
+                        continue_from=preview['job_id'] if preview else None,
+                        history=history
+                    )
+                tracing.set_attribute("job_id", job_id)
+                st.session_state.generation_job_id = job_id
+            except AdmissionRejected as e:
+                tracing.set_attribute("rejected", e.reason)
+                st.warning(f"⏳ {e}")
+
+    if st.session_state.generation_job_id:
+        show_generation_job()
+    notice = st.session_state.pop('generation_notice', None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
 
     # --- Display Results (Mood analysis, music parameters, audio, visualizations) ---
     if st.session_state.mood_analysis and st.session_state.music_params_result:
@@ -542,10 +748,10 @@ def show_composer():
                     <h3 style='color: #4E342E; font-size: 1.5rem; margin-bottom: 1.5rem; text-align: center;'>📊 AUDIO VISUALIZATIONS</h3>
                 """, unsafe_allow_html=True)
 
-                # show visualizations (expects numpy audio array and Config.MUSICGEN_SAMPLING_RATE)
+                # show visualizations (expects numpy audio array and its sample rate)
                 st.session_state.audio_visualizer.display_audio_visualizations(
                     st.session_state.generated_audio,
-                    Config.MUSICGEN_SAMPLING_RATE,
+                    st.session_state.get('generated_sample_rate', Config.MUSICGEN_SAMPLING_RATE),
                     st.session_state.mood_analysis.get('mood', 'neutral'),
                     "Your Generated Music"
                 )
@@ -607,8 +813,9 @@ def show_history():
     </div>
     """, unsafe_allow_html=True)
     
-    # Get user history
-    history = user_history.get_user_history(st.session_state.user_email)
+    # Metadata only; an entry's audio is loaded when it is opened
+    history = user_history.get_user_history(st.session_state.user_email, limit=Config.HISTORY_MAX_ENTRIES,
+                                            include_audio=False)
     
     if not history:
         st.info("You haven't generated any music yet. Go to the Compose page to create your first composition!")
@@ -669,8 +876,18 @@ def show_history():
     for i, entry in enumerate(entries_to_show):
         # Create a unique key for each entry
         entry_key = f"entry_{entry.get('timestamp', str(i))}"
+        autoplay = not autoplay_done and st.session_state.get('autoplay_latest_once')
+        favorite_mark = "❤️ " if entry.get('favorite') else ""
         
-        with st.expander(f"🎵 {entry.get('input_text', 'Unknown')[:50]}... - {entry.get('timestamp', 'Unknown date')}"):
+        expander = history_expander(
+            f"🎵 {favorite_mark}{entry.get('input_text', 'Unknown')[:50]}... - {entry.get('timestamp', 'Unknown date')}",
+            key=f"open_{entry_key}", expanded=bool(autoplay)
+        )
+        with expander:
+            # Older Streamlit returns a plain container without .open
+            if getattr(expander, "open", None) is False:
+                # Collapsed: only the header above is sent
+                continue
             col1, col2 = st.columns(2)
             
             with col1:
@@ -703,18 +920,26 @@ def show_history():
                 st.write(f"▶️ Played: {entry.get('play_count', 0)} times")
             
             # Audio player with enhanced controls
-            if 'audio_data' in entry and entry['audio_data']:
+            if entry.get('audio_size'):
                 st.markdown("**🎧 Audio Preview**")
+                # Served by media_server when it runs, so the bytes skip the websocket
+                audio_url = media_server.audio_url(entry['id'], st.session_state.user_email)
+                audio_data = None if audio_url else user_history.get_audio(entry['id'], st.session_state.user_email)
+                audio_mime = audio_storage.mime_type(entry.get('audio_codec'), audio_data)
                 # Standard player
-                st.audio(entry['audio_data'], format="audio/mp3")
+                st.audio(audio_url or audio_data, format=audio_mime)
 
                 # One-time autoplay for the newest entry after generation
-                if not autoplay_done and st.session_state.get('autoplay_latest_once'):
+                if autoplay:
                     try:
-                        audio_b64 = base64.b64encode(entry['audio_data']).decode('utf-8')
+                        if audio_url:
+                            audio_src = audio_url
+                        else:
+                            audio_b64 = base64.b64encode(audio_data).decode('utf-8')
+                            audio_src = f"data:{audio_mime};base64,{audio_b64}"
                         st.markdown(f"""
                         <audio autoplay>
-                            <source src="data:audio/mp3;base64,{audio_b64}" type="audio/mp3">
+                            <source src="{audio_src}" type="{audio_mime}">
                         </audio>
                         """, unsafe_allow_html=True)
                         autoplay_done = True
@@ -725,13 +950,20 @@ def show_history():
                 col_download, col_regenerate, col_delete = st.columns(3)
                 
                 with col_download:
-                    st.download_button(
-                        label="📥 Download",
-                        data=entry['audio_data'],
-                        file_name=f"melodai_{entry.get('timestamp', 'unknown').replace(':', '-').replace(' ', '_')}.mp3",
-                        mime="audio/mp3",
-                        key=f"download_{entry_key}"
-                    )
+                    if audio_url:
+                        st.link_button(
+                            "📥 Download",
+                            media_server.audio_url(entry['id'], st.session_state.user_email, download=True)
+                        )
+                    else:
+                        st.download_button(
+                            label="📥 Download",
+                            data=audio_data,
+                            file_name=f"melodai_{entry.get('timestamp', 'unknown').replace(':', '-').replace(' ', '_')}."
+                                      f"{audio_storage.file_extension(entry.get('audio_codec'), audio_data)}",
+                            mime=audio_mime,
+                            key=f"download_{entry_key}"
+                        )
                 
                 with col_regenerate:
                     if st.button("🔄 Regenerate", key=f"regenerate_{entry_key}"):
@@ -832,6 +1064,15 @@ def show_profile():
     with col4:
         st.write(f"**Last Login:** {user_data.get('last_login', 'Unknown')}")
     
+    storage_used = user_history.storage_usage(st.session_state.user_email)
+    storage_quota = audio_storage.quota_bytes()
+    if storage_quota:
+        st.progress(min(1.0, storage_used / storage_quota),
+                    text=f"💾 Storage: {storage_used / 2**20:.1f} MB of {storage_quota / 2**20:.0f} MB "
+                         "(oldest non-favorite tracks are removed past the limit)")
+    else:
+        st.write(f"**💾 Storage:** {storage_used / 2**20:.1f} MB")
+    
     # Save changes if in edit mode
     if st.session_state.edit_mode:
         if st.button("💾 Save Changes", use_container_width=True):
@@ -871,6 +1112,87 @@ def show_profile():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+def show_admin():
+    """Per-request stage breakdown from the trace log (admins only)"""
+    if st.session_state.user_email not in Config.ADMIN_EMAILS:
+        st.error("You don't have access to this page.")
+        return
+
+    st.markdown("""
+    <div class="main-header">
+        <h1 style='font-size: 2.8rem; margin: 0;'>🛠️ Admin: Request Traces</h1>
+        <h3 style='font-size: 1.4rem; margin: 0; font-weight: 400;'>
+            Where the time goes in each generation request
+        </h3>
+    </div>
+    """, unsafe_allow_html=True)
+
+    st.markdown("**Generation queue** (last hour)")
+    st.dataframe([
+        {
+            "priority": name,
+            "queued": stats["queued"],
+            "started": stats["started"],
+            "mean wait s": round(stats["mean_wait"], 1),
+            "p95 wait s": round(stats["p95_wait"], 1),
+        }
+        for name, stats in get_job_queue().queue_stats().items()
+    ], use_container_width=True)
+
+    sweep = get_scratch_sweeper().last_result
+    if sweep:
+        st.caption(f"📁 Scratch space {sweep['root']}: {sweep['bytes'] / 2**20:.1f} MB in {sweep['job_dirs']} job "
+                   f"directories, {sweep['free_bytes'] / 2**30:.1f} GB free (last sweep {sweep['time']})")
+
+    if Config.POOL_CLIPS_PER_KEY:
+        st.markdown("**Audio pool**")
+        pool_rows = get_audio_pool().stats()
+        if pool_rows:
+            st.dataframe(pool_rows, use_container_width=True)
+        else:
+            st.caption("No pooled clips or pool requests yet.")
+
+    limit = st.selectbox("Recent requests", [20, 50, 200], index=0)
+    traces = tracing.read_recent_traces(limit=limit)
+    if not traces:
+        st.info("No traces recorded yet. Generate some music first.")
+        return
+
+    # Average time per stage across the loaded traces
+    stage_times = {}
+    for entry in traces:
+        for span in entry['spans']:
+            stage_times.setdefault(span['name'], []).append(span['duration_ms'])
+    st.markdown("**Stage summary**")
+    st.dataframe([
+        {
+            "stage": stage,
+            "count": len(times),
+            "mean ms": round(sum(times) / len(times), 1),
+            "max ms": round(max(times), 1),
+        }
+        for stage, times in sorted(stage_times.items(), key=lambda item: -sum(item[1]))
+    ], use_container_width=True)
+
+    st.markdown("**Requests**")
+    for entry in traces:
+        attributes = entry.get('attributes', {})
+        label = f"{entry['name']} · {entry['timestamp']} · {entry['duration_ms'] / 1000:.2f}s"
+        if 'job_id' in attributes:
+            label += f" · job {attributes['job_id']}"
+        with st.expander(label):
+            st.caption(", ".join(f"{key}: {value}" for key, value in attributes.items()) or "No attributes")
+            st.dataframe([
+                {
+                    "stage": span['name'],
+                    "parent": span.get('parent') or "",
+                    "start ms": span.get('offset_ms'),
+                    "duration ms": span['duration_ms'],
+                }
+                for span in sorted(entry['spans'], key=lambda s: s.get('offset_ms') or 0)
+            ], use_container_width=True)
+
+
 def main():
     st.set_page_config(
         page_title="MelodAI - AI Music Composer",
@@ -1038,6 +1360,19 @@ def main():
     </style>
     """, unsafe_allow_html=True)
 
+    if Config.METRICS_PORT:
+        get_metrics_server()
+    get_storage_compactor()
+    get_scratch_sweeper()
+    if Config.POOL_CLIPS_PER_KEY:
+        get_audio_pool()
+    if Config.MEDIA_PORT:
+        get_media_server()
+
+    # Start loading the shared models in the background while the user logs in
+    if Config.PRELOAD_MODELS:
+        get_model_warmer()
+
     # Check if user is logged in
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
@@ -0,0 +1,336 @@
+# audio_pool.py
+"""
+Warm pool of pre-generated clips for the common moods.
+
+Most compositions use one of the few prompts MusicParameters derives from
+its seven moods. AudioPool keeps Config.POOL_CLIPS_PER_KEY ready clips
+per (mood, energy bucket); an energy bucket is the nearest level in
+Config.POOL_ENERGY_BUCKETS. A request without an explicit seed, at the
+default duration, is answered with a pooled clip straight away instead
+of waiting for a worker. Each clip is served once. Serving counts against
+the user's concurrency cap and rate limit like a queued job, so pool hits
+cannot be used to drain the pool and keep the workers refilling it.
+
+A daemon thread refills the pool through the generation job queue at
+"bulk" priority and only while no job is waiting, so refills use idle
+worker time. Clips that stay unused for Config.POOL_MAX_AGE_HOURS, or
+were made with a different model or prompt, are discarded and generated
+again. Requests most often missed are refilled first. Hits and misses
+are counted per key and exported as metrics.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from config import Config
+from generation_worker import AdmissionRejected, job_output_path, save_to_history
+from music_parameters import MusicParameters
+import scratch_space
+import tracing
+
+
+def energy_bucket(energy_level):
+    """Nearest Config.POOL_ENERGY_BUCKETS level (the lower one on ties)"""
+    return min(Config.POOL_ENERGY_BUCKETS, key=lambda bucket: (abs(bucket - energy_level), bucket))
+
+
+def pool_key(music_params):
+    return music_params.mood, energy_bucket(music_params.energy_level)
+
+
+def pool_dir():
+    return scratch_space.path("pool")
+
+
+class AudioPool:
+    """
+    Pre-generated clips stored in the job database.
+
+    serve() hands a ready clip to a user as a finished job; start() runs
+    the refill loop every Config.POOL_REFILL_INTERVAL seconds.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.db_path = queue.db_path
+        self._thread = None
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        # Autocommit mode so take() can hold an explicit write lock
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _init_db(self):
+        """Initialize the pool tables"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audio_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mood TEXT NOT NULL,
+            energy_level REAL NOT NULL,
+            prompt TEXT NOT NULL,
+            model TEXT NOT NULL,
+            duration REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            job_id INTEGER,
+            wav_path TEXT,
+            mp3_path TEXT,
+            generation_time REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_audio_pool_key ON audio_pool (mood, energy_level, status)"
+        )
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audio_pool_stats (
+            mood TEXT NOT NULL,
+            energy_level REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (mood, energy_level)
+        )
+        ''')
+        conn.close()
+
+    def start(self):
+        """Start the background refill thread (no-op if already started)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audio-pool", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(Config.POOL_REFILL_INTERVAL)
+            try:
+                self.refill()
+            except Exception as e:
+                print(f"⚠️ Audio pool refill failed: {e}")
+
+    def take(self, music_params, duration=Config.MUSICGEN_DURATION, seed=None, user_email=None, params=None):
+        """
+        Remove and return the oldest fresh clip for these parameters as a
+        dict, or None. Requests with a seed or a non-default duration never
+        use the pool and are not counted.
+
+        With `params`, the clip is handed to `user_email` as a running job
+        (JobQueue.start_job) in the same transaction; its id is returned as
+        "served_job_id". AdmissionRejected leaves the clip in the pool.
+        """
+        if not Config.POOL_CLIPS_PER_KEY or seed is not None or duration != Config.MUSICGEN_DURATION:
+            return None
+        mood, bucket = pool_key(music_params)
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            row = cursor.execute(
+                "SELECT * FROM audio_pool WHERE mood = ? AND energy_level = ? AND status = 'ready' "
+                "AND model = ? AND duration = ? AND created_at >= datetime('now', ?) ORDER BY id LIMIT 1",
+                (mood, bucket, Config.MUSICGEN_MODEL, duration, f"-{Config.POOL_MAX_AGE_HOURS} hours")
+            ).fetchone()
+            if row is not None and not os.path.exists(row["wav_path"]):
+                # Audio removed from the scratch space: drop the entry and count a miss
+                cursor.execute("DELETE FROM audio_pool WHERE id = ?", (row["id"],))
+                row = None
+            served_job_id = None
+            if row is not None:
+                if params is not None:
+                    served_job_id = self.queue.start_job(row["prompt"], user_email, {**params, "pool": row["id"]},
+                                                         cursor=cursor)
+                cursor.execute("DELETE FROM audio_pool WHERE id = ?", (row["id"],))
+            column = "hits" if row is not None else "misses"
+            cursor.execute(
+                f"INSERT INTO audio_pool_stats (mood, energy_level, {column}) VALUES (?, ?, 1) "
+                f"ON CONFLICT (mood, energy_level) DO UPDATE SET {column} = {column} + 1",
+                (mood, bucket)
+            )
+            cursor.execute("COMMIT")
+        except (AdmissionRejected, sqlite3.Error):
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        tracing.metrics.inc("pool_hits" if row is not None else "pool_misses")
+        return {**dict(row), "served_job_id": served_job_id} if row is not None else None
+
+    def serve(self, music_params, user_email=None, history=None, duration=Config.MUSICGEN_DURATION, seed=None):
+        """
+        Answer a composition from the pool. Returns the finished job (saved
+        to the user's history like a worker would), or None on a miss.
+        Raises AdmissionRejected when the user is over their limits.
+
+        If handing the clip over fails, its job is marked failed (so it does
+        not hold one of the user's job slots) and None is returned, so the
+        caller queues a normal generation instead.
+        """
+        params = {"duration": duration, "temperature": Config.TEMPERATURE, "seed": None}
+        if history is not None:
+            params["history"] = history
+        clip = self.take(music_params, duration, seed, user_email, params)
+        if clip is None:
+            return None
+        job_id = clip["served_job_id"]
+
+        try:
+            job = self.queue.get_job(job_id)
+            scratch_space.allocate(job_id)
+            wav_path = job_output_path(job_id)
+            shutil.move(clip["wav_path"], wav_path)
+            mp3_path = None
+            if clip["mp3_path"] and os.path.exists(clip["mp3_path"]):
+                mp3_path = wav_path[:-len(".wav")] + ".mp3"
+                shutil.move(clip["mp3_path"], mp3_path)
+            if history is not None and user_email:
+                save_to_history(job, wav_path, clip["generation_time"] or 0.0)
+            self.queue.complete(job_id, wav_path, mp3_path, clip["generation_time"] or 0.0)
+        except Exception as e:
+            print(f"⚠️ Could not serve pooled clip {clip['id']}: {e}")
+            self.queue.fail(job_id, f"pooled clip could not be served: {e}")
+            scratch_space.release(job_id)
+            for leftover in (clip["wav_path"], clip["mp3_path"]):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
+            return None
+        return self.queue.get_job(job_id)
+
+    def refill(self):
+        """
+        One refill pass: collect finished refill jobs, drop stale clips, and
+        queue one more clip for the neediest key if the queue is idle.
+        """
+        self._collect()
+        self._expire()
+        if not Config.POOL_CLIPS_PER_KEY:
+            return None
+
+        conn = self._connect()
+        pending = conn.execute("SELECT COUNT(*) FROM audio_pool WHERE status = 'pending'").fetchone()[0]
+        counts = {
+            (mood, energy_level): count for mood, energy_level, count in conn.execute(
+                "SELECT mood, energy_level, COUNT(*) FROM audio_pool GROUP BY mood, energy_level"
+            )
+        }
+        misses = {
+            (mood, energy_level): count for mood, energy_level, count in conn.execute(
+                "SELECT mood, energy_level, misses FROM audio_pool_stats"
+            )
+        }
+        conn.close()
+        if pending or self.queue.queue_depth():
+            return None
+
+        # Emptiest key first, then the one users miss most
+        keys = [(mood, bucket) for mood in MusicParameters.mood_mappings for bucket in Config.POOL_ENERGY_BUCKETS]
+        keys = [key for key in keys if counts.get(key, 0) < Config.POOL_CLIPS_PER_KEY]
+        if not keys:
+            return None
+        mood, bucket = min(keys, key=lambda key: (counts.get(key, 0), -misses.get(key, 0)))
+        return self._submit(mood, bucket)
+
+    def _submit(self, mood, bucket):
+        music_params = MusicParameters().get_music_parameters({"mood": mood, "energy_level": bucket})
+        job_id = self.queue.submit(music_params.musicgen_prompt, duration=Config.MUSICGEN_DURATION, priority="bulk")
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO audio_pool (mood, energy_level, prompt, model, duration, job_id) VALUES (?, ?, ?, ?, ?, ?)",
+            (mood, bucket, music_params.musicgen_prompt, Config.MUSICGEN_MODEL, Config.MUSICGEN_DURATION, job_id)
+        )
+        conn.close()
+        return job_id
+
+    def _collect(self):
+        """Move the audio of finished refill jobs into the pool directory"""
+        conn = self._connect()
+        rows = conn.execute("SELECT id, job_id FROM audio_pool WHERE status = 'pending'").fetchall()
+        for pool_id, job_id in rows:
+            job = self.queue.get_job(job_id)
+            if job is not None and job["status"] in ("queued", "running"):
+                continue
+            if job is None or job["status"] != "done" or not os.path.exists(job["wav_path"]):
+                conn.execute("DELETE FROM audio_pool WHERE id = ?", (pool_id,))
+                continue
+            os.makedirs(pool_dir(), exist_ok=True)
+            wav_path = os.path.join(pool_dir(), f"{pool_id}.wav")
+            shutil.move(job["wav_path"], wav_path)
+            mp3_path = None
+            if job["mp3_path"] and os.path.exists(job["mp3_path"]):
+                mp3_path = os.path.join(pool_dir(), f"{pool_id}.mp3")
+                shutil.move(job["mp3_path"], mp3_path)
+            scratch_space.release(job_id)
+            # Freshness counts from when the clip became available
+            conn.execute(
+                "UPDATE audio_pool SET status = 'ready', wav_path = ?, mp3_path = ?, generation_time = ?, "
+                "created_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (wav_path, mp3_path, job["generation_time"], pool_id)
+            )
+        conn.close()
+
+    def _expire(self):
+        """Discard ready clips that are too old or no longer match the model/prompt"""
+        music_parameters = MusicParameters()
+        prompts = {
+            (mood, bucket): music_parameters.get_music_parameters({"mood": mood, "energy_level": bucket}).musicgen_prompt
+            for mood in MusicParameters.mood_mappings for bucket in Config.POOL_ENERGY_BUCKETS
+        }
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT id, mood, energy_level, prompt, model, duration, wav_path, mp3_path, "
+            "created_at < datetime('now', ?) FROM audio_pool WHERE status = 'ready'",
+            (f"-{Config.POOL_MAX_AGE_HOURS} hours",)
+        ).fetchall()
+        expired = 0
+        for pool_id, mood, energy_level, prompt, model, duration, wav_path, mp3_path, stale in rows:
+            if (not stale and model == Config.MUSICGEN_MODEL and duration == Config.MUSICGEN_DURATION
+                    and prompts.get((mood, energy_level)) == prompt):
+                continue
+            conn.execute("DELETE FROM audio_pool WHERE id = ?", (pool_id,))
+            for path in (wav_path, mp3_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            expired += 1
+        conn.close()
+        if expired:
+            tracing.metrics.inc("pool_expired", expired)
+        return expired
+
+    def stats(self):
+        """Per (mood, energy bucket): ready and pending clips, hits, misses and hit rate"""
+        conn = self._connect()
+        clips = {}
+        for mood, energy_level, status, count in conn.execute(
+            "SELECT mood, energy_level, status, COUNT(*) FROM audio_pool GROUP BY mood, energy_level, status"
+        ):
+            clips.setdefault((mood, energy_level), {})[status] = count
+        usage = {(mood, energy_level): (hits, misses) for mood, energy_level, hits, misses in conn.execute(
+            "SELECT mood, energy_level, hits, misses FROM audio_pool_stats"
+        )}
+        conn.close()
+
+        rows = []
+        for key in sorted(set(clips) | set(usage)):
+            hits, misses = usage.get(key, (0, 0))
+            rows.append({
+                "mood": key[0],
+                "energy_level": key[1],
+                "ready": clips.get(key, {}).get("ready", 0),
+                "pending": clips.get(key, {}).get("pending", 0),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            })
+        return rows
+
+    def export_metrics(self):
+        """Publish pool size and hit rate as gauges (a tracing.metrics collector)"""
+        rows = self.stats()
+        hits = sum(row["hits"] for row in rows)
+        requests = hits + sum(row["misses"] for row in rows)
+        tracing.metrics.set_gauge("pool_clips_ready", sum(row["ready"] for row in rows))
+        tracing.metrics.set_gauge("pool_hit_rate", hits / requests if requests else 0.0)
@@ -0,0 +1,244 @@
+# audio_postprocess.py
+"""
+Allocation-light post-processing for generated audio.
+
+Everything works in place on float32 NumPy buffers: the model output tensor
+is viewed (not copied) as an array, optionally mixed down to mono inside
+that buffer and scaled with in-place multiplies. Multi-channel audio is a
+(samples, channels) view of the model's (channels, samples) output, the
+layout soundfile writes. By default clips are peak-normalized to
+PEAK_TARGET. Optionally (Config.LOUDNESS_TARGET_LUFS) loudness is measured
+per ITU-R BS.1770 (K-weighted, gated) so tracks land at the same perceived
+level, and a true-peak limiter (Config.TRUE_PEAK_CEILING_DB) keeps
+inter-sample peaks under the ceiling after the gain change.
+
+Functions ending in an underscore modify their argument.
+"""
+import numpy as np
+from config import Config
+
+PEAK_TARGET = 0.95              # sample peak used when loudness normalization is off
+MAX_LOUDNESS_GAIN_DB = 24.0     # do not blow up near-silent clips
+TRUE_PEAK_OVERSAMPLING = 4
+LIMITER_LOOKAHEAD_SECONDS = 0.005
+LIMITER_CHUNK_SAMPLES = 1 << 16
+
+
+def to_mono(audio_tensor):
+    """
+    float32 mono view of a model output tensor.
+
+    Handles shapes (batch, channels, samples) or (channels, samples). For a
+    CPU float32 tensor no audio data is copied; multi-channel audio is
+    summed into the first channel's buffer.
+    """
+    arr = audio_tensor.detach().cpu().numpy()
+    if arr.dtype != np.float32:
+        arr = arr.astype(np.float32)
+
+    if arr.ndim == 3:  # (batch, channels, samples)
+        arr = arr[0]
+    if arr.ndim == 2:  # (channels, samples)
+        for channel in arr[1:]:
+            arr[0] += channel
+        if arr.shape[0] > 1:
+            arr[0] *= 1.0 / arr.shape[0]
+        arr = arr[0]
+    return arr
+
+
+def to_channels(audio_tensor, layout=None):
+    """
+    Model output in the Config.OUTPUT_CHANNELS layout.
+
+    "mono" downmixes (see to_mono); "native" keeps the model's channels and
+    returns a zero-copy (samples, channels) view, or 1-D for mono models.
+    """
+    layout = layout or Config.OUTPUT_CHANNELS
+    if layout == "mono":
+        return to_mono(audio_tensor)
+    if layout != "native":
+        raise ValueError(f"Unknown channel layout {layout!r}; expected 'mono' or 'native'")
+    arr = audio_tensor.detach().cpu().numpy()
+    if arr.dtype != np.float32:
+        arr = arr.astype(np.float32)
+    if arr.ndim == 3:
+        arr = arr[0]
+    if arr.ndim == 2:
+        arr = arr[0] if arr.shape[0] == 1 else arr.T
+    return arr
+
+
+def downmix(arr):
+    """Mono copy of a (samples, channels) array; 1-D input is returned as is"""
+    if arr.ndim == 1:
+        return arr
+    return arr.mean(axis=1, dtype=np.float32)
+
+
+def resample(arr, sr_from, sr_to):
+    """
+    Polyphase resampling along the time axis.
+
+    Returns `arr` itself (no copy) when the rates match. 32 kHz -> 24 kHz is
+    a 3/4 polyphase filter, much cheaper than FFT resampling.
+    """
+    if not sr_to or sr_to == sr_from:
+        return arr
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    step = gcd(int(sr_from), int(sr_to))
+    resampled = resample_poly(arr, int(sr_to) // step, int(sr_from) // step, axis=0)
+    return resampled.astype(np.float32, copy=False)
+
+
+def peak(arr):
+    """Absolute sample peak without an np.abs() temporary"""
+    if arr.size == 0:
+        return 0.0
+    return float(max(arr.max(), -arr.min()))
+
+
+def peak_normalize_(arr, target=PEAK_TARGET):
+    maxv = peak(arr) or 1e-8
+    arr *= target / maxv
+    return arr
+
+
+def _k_weighting_sos(sr):
+    """BS.1770 K-weighting (high shelf + high pass) as second-order sections for any sample rate"""
+    # High shelf
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = np.tan(np.pi * f0 / sr)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    # High pass
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * f0 / sr)
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, highpass], dtype=np.float32)
+
+
+def integrated_loudness(arr, sr):
+    """
+    Integrated loudness in LUFS (BS.1770-4 gating; channel energies summed
+    with unit weights, as for left/right).
+
+    Allocates one float32 filtered copy of the clip. Gating blocks are
+    400 ms with 75% overlap, i.e. four consecutive 100 ms hops, so block
+    energies are sums of per-hop energies.
+    """
+    from scipy.signal import sosfilt
+
+    hop = int(round(0.1 * sr))
+    hops = len(arr) // hop
+    if hops < 4:
+        return float("-inf")
+
+    weighted = sosfilt(_k_weighting_sos(sr), arr, axis=0)  # float32 in, float32 out
+    np.square(weighted, out=weighted)
+    hop_energy = weighted[:hops * hop].reshape(hops, -1).sum(axis=1, dtype=np.float64)
+    block_power = (hop_energy[:-3] + hop_energy[1:-2] + hop_energy[2:-1] + hop_energy[3:]) / (4 * hop)
+
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+    gated = block_power[block_loudness > -70.0]  # absolute gate
+    if gated.size == 0:
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    with np.errstate(divide="ignore"):
+        gated = gated[-0.691 + 10 * np.log10(gated) > relative_gate]
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def loudness_normalize_(arr, sr, target_lufs):
+    """Scale in place to `target_lufs`. Returns the measured loudness before scaling."""
+    loudness = integrated_loudness(arr, sr)
+    if np.isfinite(loudness):
+        gain_db = min(target_lufs - loudness, MAX_LOUDNESS_GAIN_DB)
+        arr *= 10 ** (gain_db / 20)
+    return loudness
+
+
+def true_peak_envelope(arr, oversampling=TRUE_PEAK_OVERSAMPLING, chunk=LIMITER_CHUNK_SAMPLES):
+    """
+    Per-sample true peak (max |x| of the oversampled signal around each
+    sample, across all channels).
+
+    Oversamples in chunks so the temporary stays at `chunk * oversampling`
+    samples however long the clip is.
+    """
+    from scipy.signal import resample_poly
+
+    envelope = np.empty(len(arr), dtype=np.float32)
+    pad = 64  # resample_poly filter reach, in input samples
+    for start in range(0, len(arr), chunk):
+        stop = min(start + chunk, len(arr))
+        lo, hi = max(0, start - pad), min(len(arr), stop + pad)
+        segment = arr[lo:hi]
+        upsampled = resample_poly(segment, oversampling, 1, axis=0)
+        np.abs(upsampled, out=upsampled)
+        peaks = upsampled[:(hi - lo) * oversampling].reshape(hi - lo, -1).max(axis=1)
+        np.maximum(peaks, np.abs(segment).reshape(hi - lo, -1).max(axis=1), out=peaks)
+        envelope[start:stop] = peaks[start - lo:stop - lo]
+    return envelope
+
+
+def true_peak(arr):
+    return float(true_peak_envelope(arr).max()) if len(arr) else 0.0
+
+
+def true_peak_limit_(arr, sr, ceiling_db):
+    """
+    Look-ahead limiter: keep the true peak at or under `ceiling_db` dBTP.
+    Channels share one gain curve, so the stereo image does not shift.
+
+    The gain needed at each sample is spread over a short look-ahead window
+    (a running minimum, then a shorter moving average), so gain reduction
+    ramps in before a peak and out after it instead of clipping it.
+    Returns the applied peak gain reduction in dB (0 when nothing was done).
+    """
+    from scipy.ndimage import minimum_filter1d, uniform_filter1d
+
+    ceiling = 10 ** (ceiling_db / 20)
+    if peak(arr) <= ceiling / 2:
+        # Inter-sample peaks stay well within 6 dB of the sample peak; skip the oversampling
+        return 0.0
+    gain = true_peak_envelope(arr)
+    if len(gain) == 0 or gain.max() <= ceiling:
+        return 0.0
+    # gain = min(1, ceiling / envelope), in place
+    np.maximum(gain, ceiling, out=gain)
+    np.divide(ceiling, gain, out=gain)
+
+    lookahead = max(1, int(LIMITER_LOOKAHEAD_SECONDS * sr))
+    # A moving average no wider than the minimum filter never exceeds the gain a peak needs
+    gain = minimum_filter1d(gain, size=2 * lookahead + 1)
+    uniform_filter1d(gain, size=lookahead + 1, output=gain)
+    reduction_db = float(-20 * np.log10(gain.min()))
+    arr *= gain if arr.ndim == 1 else gain[:, None]
+    return reduction_db
+
+
+def finalize_(arr, sr, target_lufs=None, ceiling_db=None):
+    """
+    Level a float32 clip (mono or (samples, channels)) in place for playback and storage.
+
+    Loudness-normalizes to Config.LOUDNESS_TARGET_LUFS (or peak-normalizes
+    when that is None), then applies the true-peak limiter at
+    Config.TRUE_PEAK_CEILING_DB (skipped when None).
+    """
+    target_lufs = Config.LOUDNESS_TARGET_LUFS if target_lufs is None else target_lufs
+    ceiling_db = Config.TRUE_PEAK_CEILING_DB if ceiling_db is None else ceiling_db
+    if target_lufs is None:
+        peak_normalize_(arr)
+    else:
+        loudness_normalize_(arr, sr, target_lufs)
+    if ceiling_db is not None:
+        true_peak_limit_(arr, sr, ceiling_db)
+    return arr
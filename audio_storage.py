@@ -0,0 +1,291 @@
+# audio_storage.py
+"""
+Storage policy for the audio kept in user_history.
+
+New entries are encoded with Config.STORAGE_CODEC (Opus by default, a
+fraction of the size of the 128 kbps MP3 or PCM WAV rows stored before).
+StorageCompactor can re-encode old non-favorite entries to
+Config.COMPACT_CODEC and, if a user is still over a quota of
+Config.USER_STORAGE_QUOTA_MB, prune their oldest non-favorite entries.
+Both steps change or delete existing history, so they are opt-in: set
+Config.COMPACT_AFTER_DAYS and/or Config.USER_STORAGE_QUOTA_MB to enable
+them (they default to None, which leaves history untouched). Favorites
+are never re-encoded or pruned.
+
+Encoding goes through libsndfile (soundfile), so no ffmpeg is needed.
+Each stored row records a codec label such as "opus@48k" or "flac".
+
+Run a compaction pass by hand with:
+    python audio_storage.py compact [--user EMAIL] [--vacuum]
+    python audio_storage.py usage
+"""
+import argparse
+import io
+import sqlite3
+import threading
+import time
+import soundfile as sf
+from config import Config
+import tracing
+
+# name -> libsndfile container/subtype and the MIME type served to browsers
+CODECS = {
+    "opus": {"format": "OGG", "subtype": "OPUS", "mime": "audio/ogg", "ext": "ogg", "bitrate": True},
+    "vorbis": {"format": "OGG", "subtype": "VORBIS", "mime": "audio/ogg", "ext": "ogg", "bitrate": False},
+    "mp3": {"format": "MP3", "subtype": "MPEG_LAYER_III", "mime": "audio/mpeg", "ext": "mp3", "bitrate": False},
+    "flac": {"format": "FLAC", "subtype": "PCM_16", "mime": "audio/flac", "ext": "flac", "bitrate": False},
+    "wav": {"format": "WAV", "subtype": "PCM_16", "mime": "audio/wav", "ext": "wav", "bitrate": False},
+}
+
+OPUS_SAMPLE_RATES = (48000, 24000, 16000, 12000, 8000)
+# libsndfile maps compression_level 0..1 linearly onto these Opus bitrates
+OPUS_MAX_KBPS = 256.0
+OPUS_MIN_KBPS = 6.0
+
+
+def codec_label(codec, bitrate_kbps=None):
+    """Label stored with each entry, e.g. 'opus@48k'; the bitrate only applies to Opus"""
+    if CODECS[codec]["bitrate"] and bitrate_kbps:
+        return f"{codec}@{int(bitrate_kbps)}k"
+    return codec
+
+
+def detect_codec(audio_data):
+    """Codec of stored audio bytes from their magic number (rows saved before codec labels)"""
+    head = bytes(audio_data[:36]) if audio_data else b""
+    if head.startswith(b"RIFF"):
+        return "wav"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head.startswith(b"OggS"):
+        return "opus" if b"OpusHead" in head else "vorbis"
+    return "mp3"
+
+
+def mime_type(label, audio_data=None):
+    """MIME type for a stored codec label; unlabeled rows are sniffed"""
+    codec = label.split("@")[0] if label else detect_codec(audio_data)
+    return CODECS.get(codec, CODECS["mp3"])["mime"]
+
+
+def file_extension(label, audio_data=None):
+    codec = label.split("@")[0] if label else detect_codec(audio_data)
+    return CODECS.get(codec, CODECS["mp3"])["ext"]
+
+
+def _supported(codec):
+    spec = CODECS[codec]
+    return sf.check_format(spec["format"], spec["subtype"])
+
+
+def encode(audio, sr, codec=None, bitrate_kbps=None):
+    """
+    Encode float audio (mono or (samples, channels)) to bytes.
+
+    Returns (audio_bytes, codec_label). Opus only runs at 8-48 kHz, so the
+    audio is resampled to the highest Opus rate not above `sr`. Codecs
+    this libsndfile build cannot write fall back to WAV.
+    """
+    import audio_postprocess
+
+    codec = codec or Config.STORAGE_CODEC
+    bitrate_kbps = Config.STORAGE_BITRATE_KBPS if bitrate_kbps is None else bitrate_kbps
+    if codec not in CODECS:
+        raise ValueError(f"Unknown storage codec {codec!r}; expected one of {sorted(CODECS)}")
+    if not _supported(codec):
+        print(f"⚠️ libsndfile cannot write {codec}; storing WAV instead")
+        codec = "wav"
+
+    spec = CODECS[codec]
+    kwargs = {}
+    if codec == "opus":
+        rate = next((r for r in OPUS_SAMPLE_RATES if r <= sr), OPUS_SAMPLE_RATES[-1])
+        audio = audio_postprocess.resample(audio, sr, rate)
+        sr = rate
+        if bitrate_kbps:
+            kbps = min(max(float(bitrate_kbps), OPUS_MIN_KBPS), OPUS_MAX_KBPS)
+            kwargs["compression_level"] = (OPUS_MAX_KBPS - kbps) / (OPUS_MAX_KBPS - OPUS_MIN_KBPS)
+
+    buffer = io.BytesIO()
+    with tracing.span("audio_encode"):
+        sf.write(buffer, audio, sr, format=spec["format"], subtype=spec["subtype"], **kwargs)
+    return buffer.getvalue(), codec_label(codec, bitrate_kbps)
+
+
+def encode_file(path, codec=None, bitrate_kbps=None):
+    """Encode an audio file on disk (e.g. the generated WAV) for storage"""
+    audio, sr = sf.read(path, dtype="float32")
+    return encode(audio, sr, codec, bitrate_kbps)
+
+
+def transcode(audio_data, codec=None, bitrate_kbps=None):
+    """Re-encode stored audio bytes; returns (audio_bytes, codec_label)"""
+    audio, sr = sf.read(io.BytesIO(audio_data), dtype="float32")
+    return encode(audio, sr, codec, bitrate_kbps)
+
+
+def quota_bytes():
+    return int(Config.USER_STORAGE_QUOTA_MB * 1024 * 1024) if Config.USER_STORAGE_QUOTA_MB else None
+
+
+class StorageCompactor:
+    """
+    Re-encodes and prunes history audio per the storage policy.
+
+    start() runs a pass over every user each Config.COMPACT_INTERVAL
+    seconds in a daemon thread; request(user_email) wakes it for one user
+    right away, e.g. after a new entry was saved.
+    """
+
+    def __init__(self, db_path="users.db"):
+        from auth import UserHistory
+
+        self.db_path = db_path
+        self.history = UserHistory(db_path)
+        self.last_result = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background compaction thread (no-op if already started)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="storage-compactor", daemon=True)
+                self._thread.start()
+        return self
+
+    def request(self, user_email):
+        """Compact one user's entries on the background thread as soon as possible"""
+        with self._lock:
+            self._pending.add(user_email)
+        self._wake.set()
+
+    def _run(self):
+        next_full_pass = time.time()
+        while True:
+            self._wake.wait(max(0.0, next_full_pass - time.time()))
+            self._wake.clear()
+            with self._lock:
+                users, self._pending = self._pending, set()
+            try:
+                if time.time() >= next_full_pass:
+                    self.compact()
+                    next_full_pass = time.time() + Config.COMPACT_INTERVAL
+                else:
+                    for user_email in users:
+                        self.compact_user(user_email)
+            except Exception as e:
+                print(f"⚠️ Storage compaction failed: {e}")
+
+    def compact_user(self, user_email):
+        """
+        Apply the storage policy to one user's history.
+
+        1. Non-favorite entries older than Config.COMPACT_AFTER_DAYS are
+           re-encoded to Config.COMPACT_CODEC (kept only if smaller).
+        2. While the user is over quota, their oldest non-favorite entries
+           are deleted.
+        """
+        target = codec_label(Config.COMPACT_CODEC, Config.COMPACT_BITRATE_KBPS)
+        result = {"user_email": user_email, "reencoded": 0, "pruned": 0,
+                  "bytes_before": self.history.storage_usage(user_email)}
+
+        with tracing.span("storage_compact"):
+            if Config.COMPACT_AFTER_DAYS is not None:
+                for entry_id, _, codec, _ in self.history.get_storage_candidates(user_email, Config.COMPACT_AFTER_DAYS):
+                    if codec == target:
+                        continue
+                    audio_data = self.history.get_audio(entry_id)
+                    if not audio_data:
+                        continue
+                    try:
+                        data, label = transcode(audio_data, Config.COMPACT_CODEC, Config.COMPACT_BITRATE_KBPS)
+                    except RuntimeError as e:  # libsndfile errors
+                        print(f"⚠️ Could not re-encode history entry {entry_id}: {e}")
+                        continue
+                    if len(data) < len(audio_data):
+                        self.history.replace_audio(entry_id, data, label)
+                        result["reencoded"] += 1
+
+            quota = quota_bytes()
+            usage = self.history.storage_usage(user_email)
+            if quota is not None and usage > quota:
+                prune = []
+                for entry_id, _, _, size in self.history.get_storage_candidates(user_email):
+                    if usage <= quota:
+                        break
+                    prune.append(entry_id)
+                    usage -= size or 0
+                self.history.delete_entries(prune)
+                result["pruned"] = len(prune)
+
+        result["bytes_after"] = self.history.storage_usage(user_email)
+        freed = result["bytes_before"] - result["bytes_after"]
+        if freed > 0:
+            tracing.metrics.inc("storage_compacted_bytes", freed)
+            self._release_free_pages()
+        return result
+
+    def compact(self):
+        """Compact every user's history; returns the per-user results"""
+        results = [self.compact_user(user_email) for user_email in self.history.storage_users()]
+        self.last_result = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "users": results}
+        return results
+
+    def _release_free_pages(self):
+        """Return freed pages to the filesystem (only in auto_vacuum=INCREMENTAL databases)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+
+    def vacuum(self):
+        """
+        Rewrite the database file at its compacted size and switch it to
+        auto_vacuum=INCREMENTAL so later passes can release pages cheaply.
+        Locks the database while it runs; meant for maintenance windows.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MelodAI history audio storage")
+    parser.add_argument("--db", default="users.db", help="SQLite database holding user_history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact = sub.add_parser("compact", help="Re-encode old entries and enforce quotas")
+    compact.add_argument("--user", help="Only compact this user's history")
+    compact.add_argument("--vacuum", action="store_true", help="Rewrite the database file afterwards")
+    sub.add_parser("usage", help="Stored audio per user")
+    args = parser.parse_args(argv)
+
+    compactor = StorageCompactor(args.db)
+    if args.command == "usage":
+        quota = quota_bytes()
+        for user_email in compactor.history.storage_users():
+            usage = compactor.history.storage_usage(user_email)
+            limit = f" of {quota / 2**20:.1f} MB" if quota else ""
+            print(f"{user_email}: {usage / 2**20:.1f} MB{limit}")
+        return 0
+
+    results = [compactor.compact_user(args.user)] if args.user else compactor.compact()
+    for result in results:
+        print(f"🗜️ {result['user_email']}: {result['bytes_before'] / 2**20:.1f} MB -> "
+              f"{result['bytes_after'] / 2**20:.1f} MB ({result['reencoded']} re-encoded, {result['pruned']} pruned)")
+    if args.vacuum:
+        compactor.vacuum()
+        print("✅ Database vacuumed")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -247,6 +247,9 @@ class AudioVisualizer:
         if audio_array is None:
             st.warning("No audio data available for visualization")
             return
+        if audio_array.ndim == 2:
+            # Stereo (samples, channels): the plots show the mono mix
+            audio_array = audio_array.mean(axis=1)
         
         # Create tabs for different visualizations
         tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -6,6 +6,7 @@ import base64
 from datetime import datetime
 import streamlit as st
 import sqlite3
+import tracing
 
 class AuthSystem:
     def __init__(self, db_path="users.db"):
@@ -219,56 +220,89 @@ class UserHistory:
             play_count INTEGER DEFAULT 0,
             last_played DATETIME,
             tags TEXT,
+            audio_codec TEXT,
+            audio_size INTEGER,
             FOREIGN KEY (user_email) REFERENCES users (email)
         )
         ''')
         
+        # Storage accounting columns (see audio_storage.py), added after the table was first created
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(user_history)")}
+        if "audio_codec" not in columns:
+            cursor.execute("ALTER TABLE user_history ADD COLUMN audio_codec TEXT")
+        if "audio_size" not in columns:
+            cursor.execute("ALTER TABLE user_history ADD COLUMN audio_size INTEGER")
+            cursor.execute("UPDATE user_history SET audio_size = COALESCE(LENGTH(audio_data), 0)")
+        # Label rows saved before codec labels from their first bytes, so pages never need the audio to pick a MIME type
+        unlabeled = cursor.execute(
+            "SELECT id, substr(audio_data, 1, 36) FROM user_history WHERE audio_codec IS NULL AND audio_size > 0"
+        ).fetchall()
+        if unlabeled:
+            from audio_storage import detect_codec
+            cursor.executemany("UPDATE user_history SET audio_codec = ? WHERE id = ?",
+                               [(detect_codec(head), entry_id) for entry_id, head in unlabeled])
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_user_history_user ON user_history (user_email, timestamp)"
+        )
+        
         conn.commit()
         conn.close()
     
-    def save_generation(self, user_email, input_text, mood_analysis, music_params, audio_data, generation_time, tags=None):
+    def save_generation(self, user_email, input_text, mood_analysis, music_params, audio_data, generation_time, tags=None,
+                        audio_codec=None):
         """Save generation with enhanced metadata"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            INSERT INTO user_history (user_email, input_text, mood_analysis, music_params, audio_data, generation_time, tags)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_email,
-                input_text,
-                json.dumps(mood_analysis),
-                json.dumps(music_params),
-                audio_data,
-                generation_time,
-                json.dumps(tags) if tags else None
-            ))
-            
-            conn.commit()
-            conn.close()
+            with tracing.span("db_insert"):
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                INSERT INTO user_history (user_email, input_text, mood_analysis, music_params, audio_data, generation_time, tags,
+                                          audio_codec, audio_size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    user_email,
+                    input_text,
+                    json.dumps(mood_analysis),
+                    json.dumps(music_params),
+                    audio_data,
+                    generation_time,
+                    json.dumps(tags) if tags else None,
+                    audio_codec,
+                    len(audio_data) if audio_data else 0
+                ))
+                
+                conn.commit()
+                conn.close()
             return True
             
         except sqlite3.Error as e:
             st.error(f"Error saving history: {str(e)}")
             return False
     
-    def get_user_history(self, user_email, limit=100):
-        """Get user history with enhanced data"""
+    def get_user_history(self, user_email, limit=100, include_audio=True):
+        """
+        Get user history with enhanced data.
+        
+        include_audio=False leaves 'audio_data' as None (fetch it with
+        get_audio when an entry is opened); 'audio_size' is always set.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            SELECT input_text, mood_analysis, music_params, audio_data, generation_time, timestamp, favorite, play_count, tags
-            FROM user_history 
-            WHERE user_email = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-            ''', (user_email, limit))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            with tracing.span("db_history_read"):
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute(f'''
+                SELECT input_text, mood_analysis, music_params, {"audio_data" if include_audio else "NULL"},
+                       generation_time, timestamp, favorite, play_count, tags, audio_codec, id, audio_size
+                FROM user_history 
+                WHERE user_email = ? 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+                ''', (user_email, -1 if limit is None else limit))
+                
+                rows = cursor.fetchall()
+                conn.close()
             
             history = []
             for row in rows:
@@ -281,7 +315,10 @@ class UserHistory:
                     'timestamp': row[5],
                     'favorite': bool(row[6]),
                     'play_count': row[7],
-                    'tags': json.loads(row[8]) if row[8] else []
+                    'tags': json.loads(row[8]) if row[8] else [],
+                    'audio_codec': row[9],
+                    'id': row[10],
+                    'audio_size': row[11]
                 })
             
             return history
@@ -369,5 +406,100 @@ class UserHistory:
             conn.close()
             return True
             
+        except sqlite3.Error:
+            return False
+
+    def storage_usage(self, user_email):
+        """Bytes of audio stored for a user"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(SUM(audio_size), 0) FROM user_history WHERE user_email = ?', (user_email,))
+            usage = cursor.fetchone()[0]
+            conn.close()
+            return usage
+        except sqlite3.Error:
+            return 0
+    
+    def storage_users(self):
+        """Emails of every user with stored audio"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT DISTINCT user_email FROM user_history WHERE audio_size > 0')
+            users = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            return users
+        except sqlite3.Error:
+            return []
+    
+    def get_storage_candidates(self, user_email, older_than_days=None):
+        """
+        Non-favorite entries with audio, oldest first: (id, timestamp, audio_codec, audio_size).
+        The user's newest entry is never a candidate.
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            query = '''
+            SELECT id, timestamp, audio_codec, audio_size
+            FROM user_history
+            WHERE user_email = ? AND favorite = 0 AND audio_size > 0
+              AND id != (SELECT MAX(id) FROM user_history WHERE user_email = ?)
+            '''
+            args = [user_email, user_email]
+            if older_than_days is not None:
+                query += " AND timestamp < datetime('now', ?)"
+                args.append(f"-{older_than_days} days")
+            cursor.execute(query + " ORDER BY timestamp ASC", args)
+            rows = cursor.fetchall()
+            conn.close()
+            return rows
+        except sqlite3.Error:
+            return []
+    
+    def get_audio(self, entry_id, user_email=None):
+        """Audio bytes of one entry (only if it belongs to `user_email`, when given)"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            if user_email is None:
+                cursor.execute('SELECT audio_data FROM user_history WHERE id = ?', (entry_id,))
+            else:
+                cursor.execute('SELECT audio_data FROM user_history WHERE id = ? AND user_email = ?',
+                               (entry_id, user_email))
+            row = cursor.fetchone()
+            conn.close()
+            return row[0] if row else None
+        except sqlite3.Error:
+            return None
+    
+    def replace_audio(self, entry_id, audio_data, audio_codec):
+        """Store re-encoded audio for an entry"""
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            cursor = conn.cursor()
+            cursor.execute('''
+            UPDATE user_history
+            SET audio_data = ?, audio_codec = ?, audio_size = ?
+            WHERE id = ?
+            ''', (audio_data, audio_codec, len(audio_data), entry_id))
+            conn.commit()
+            conn.close()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def delete_entries(self, entry_ids):
+        """Delete entries by id (used by the storage compactor)"""
+        if not entry_ids:
+            return True
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            cursor = conn.cursor()
+            cursor.executemany('DELETE FROM user_history WHERE id = ?', [(entry_id,) for entry_id in entry_ids])
+            conn.commit()
+            conn.close()
+            return True
         except sqlite3.Error:
             return False
\ No newline at end of file
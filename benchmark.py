@@ -0,0 +1,799 @@
+# benchmark.py
+"""
+Performance checks for MelodAI.
+
+Usage:
+    python benchmark.py imports [--module app] [--top 15] [--json]
+    python benchmark.py threads [--threads 1 2 4] [--concurrency 1 2] [--duration 4] [--tiny] [--json]
+    python benchmark.py pipeline [--durations 2 4 8] [--repeat 3] [--tiny] [--output results.json]
+    python benchmark.py cfg [--strategies off first_n:25 first_n:100 full] [--duration 8] [--seeds 3] [--tiny] [--json]
+    python benchmark.py postprocess [--duration 30] [--repeat 5] [--json]
+    python benchmark.py history [--entries 10 100 1000] [--repeat 3] [--json]
+    python benchmark.py mood [--data labeled.csv] [--tiny] [--json]
+    python benchmark.py scheduler [--json]
+
+--tiny swaps in the randomly-initialized models from tiny_models.py, so the
+model benchmarks run offline without downloading checkpoints.
+
+Exits with a non-zero status when a check fails, so it can be used as a
+regression gate in CI. The repository has no CI yet, so these are manual
+gates: run `python benchmark.py imports` (cold-start budget,
+Config.STARTUP_IMPORT_BUDGET) before merging changes to app.py's imports.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from config import Config
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PROMPT = "peaceful relaxing ambient soothing tranquil, 80 bpm, G major, with harp, flute, strings"
+
+
+def profile_imports(module="app"):
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+
+    Returns a list of (module_name, depth, self_us, cumulative_us) in import
+    order, where depth 0 marks an import made directly by `module`'s caller.
+    The import runs from a scratch directory so app.py's users.db is not
+    created in the repository.
+    """
+    code = f"import sys; sys.path.insert(0, {REPO_DIR!r}); import {module}"
+    with tempfile.TemporaryDirectory() as scratch:
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=scratch, capture_output=True, text=True
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            # importtime prints one space before the name, plus two per nesting level
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def run_imports(args):
+    rows = profile_imports(args.module)
+    loaded = {name for name, _, _, _ in rows}
+    total_s = sum(cum for _, depth, _, cum in rows if depth == 0) / 1e6
+    deferred = [m for m in Config.STARTUP_DEFERRED_MODULES if m in loaded]
+    slowest = sorted(rows, key=lambda r: r[3], reverse=True)[:args.top]
+
+    report = {
+        "module": args.module,
+        "total_import_s": round(total_s, 3),
+        "budget_s": Config.STARTUP_IMPORT_BUDGET,
+        "deferred_modules_loaded": deferred,
+        "slowest": [
+            {"module": name, "self_ms": round(s / 1000, 2), "cumulative_ms": round(c / 1000, 2)}
+            for name, _, s, c in slowest
+        ],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"⏱️ Cold import of {args.module}: {total_s:.3f}s (budget {Config.STARTUP_IMPORT_BUDGET:.1f}s)")
+        print(f"{'cumulative ms':>14} {'self ms':>10}  module")
+        for entry in report["slowest"]:
+            print(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>10.1f}  {entry['module']}")
+
+    ok = True
+    if deferred:
+        print(f"❌ Heavy modules loaded at import time: {', '.join(deferred)}", file=sys.stderr)
+        ok = False
+    if total_s > Config.STARTUP_IMPORT_BUDGET:
+        print(f"❌ Cold import exceeded budget ({total_s:.3f}s > {Config.STARTUP_IMPORT_BUDGET:.1f}s)", file=sys.stderr)
+        ok = False
+    return 0 if ok else 1
+
+
+def _throughput_worker(worker_index, num_threads, duration, requests, barrier, results, tiny_store=None):
+    """One concurrent 'session': load the model, warm up, then generate back to back"""
+    if tiny_store:
+        from tiny_models import use_tiny_models
+        use_tiny_models(tiny_store)
+    from cpu_profile import apply_cpu_profile
+    apply_cpu_profile(worker_index, num_threads)
+    from music_generator import MusicGenerator
+
+    generator = MusicGenerator()
+    generator.generate_music(Config.WARMUP_PROMPT, duration=Config.WARMUP_DURATION, seed=0)
+    barrier.wait()
+    start = time.time()
+    for i in range(requests):
+        generator.generate_music(BENCH_PROMPT, duration=duration, seed=i)
+    results.put(time.time() - start)
+
+
+def run_threads(args):
+    """Sweep torch thread counts against concurrent generate_music throughput"""
+    ctx = multiprocessing.get_context("spawn")
+    tiny_store = None
+    if args.tiny:
+        from tiny_models import use_tiny_models
+        tiny_store = use_tiny_models()
+    rows = []
+    for concurrency in args.concurrency:
+        for num_threads in args.threads:
+            barrier = ctx.Barrier(concurrency + 1)
+            results = ctx.Queue()
+            processes = [
+                ctx.Process(target=_throughput_worker,
+                            args=(i, num_threads, args.duration, args.requests, barrier, results, tiny_store))
+                for i in range(concurrency)
+            ]
+            for process in processes:
+                process.start()
+            barrier.wait()
+            start = time.time()
+            worker_times = [results.get() for _ in processes]
+            wall = time.time() - start
+            for process in processes:
+                process.join()
+
+            total_requests = concurrency * args.requests
+            rows.append({
+                "concurrency": concurrency,
+                "threads": num_threads,
+                "cores_requested": concurrency * num_threads,
+                "requests_per_s": round(total_requests / wall, 3),
+                "audio_s_per_s": round(total_requests * args.duration / wall, 3),
+                "mean_latency_s": round(sum(worker_times) / total_requests, 3),
+            })
+            print(f"🧵 concurrency={concurrency} threads={num_threads}: "
+                  f"{rows[-1]['audio_s_per_s']:.2f}s audio/s, {rows[-1]['mean_latency_s']:.2f}s per request",
+                  file=sys.stderr)
+
+    report = {"cpu_count": os.cpu_count(), "duration": args.duration, "requests": args.requests,
+              "tiny": args.tiny, "results": rows}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'concurrency':>11} {'threads':>7} {'cores':>5} {'req/s':>7} {'audio s/s':>9} {'latency s':>9}")
+        for row in rows:
+            print(f"{row['concurrency']:>11} {row['threads']:>7} {row['cores_requested']:>5} "
+                  f"{row['requests_per_s']:>7.3f} {row['audio_s_per_s']:>9.2f} {row['mean_latency_s']:>9.2f}")
+    return 0
+
+
+def time_stage(name, fn, repeat, results):
+    """Run fn() `repeat` times and append timing stats (ms) to results"""
+    times = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        times.append((time.perf_counter() - start) * 1000)
+    results.append({
+        "name": name,
+        "repeat": repeat,
+        "mean_ms": round(statistics.mean(times), 3),
+        "p50_ms": round(statistics.median(times), 3),
+        "min_ms": round(min(times), 3),
+        "max_ms": round(max(times), 3),
+    })
+    print(f"⏱️ {name}: {results[-1]['mean_ms']:.1f} ms", file=sys.stderr)
+    return value
+
+
+def run_pipeline(args):
+    """Time every stage of the compose pipeline and emit a JSON report"""
+    if args.tiny:
+        from tiny_models import use_tiny_models
+        use_tiny_models()
+
+    from mood_analyzer import MoodAnalyzer
+    from music_parameters import MusicParameters
+    from music_generator import MusicGenerator
+    from audio_visualizer import AudioVisualizer
+    from auth import UserHistory
+    import torch
+
+    results = []
+    texts = [
+        "I'm so happy and excited for the weekend!",
+        "I feel sad and lonely today...",
+        "This mystery novel has me intrigued and curious",
+        "Just another ordinary afternoon",  # no keywords: sentiment fallback
+    ]
+    scratch = tempfile.mkdtemp(prefix="melodai_bench_")
+
+    # The models print per call; keep stdout clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        analyzer = MoodAnalyzer()
+        music_params = MusicParameters()
+        generator = MusicGenerator()
+        visualizer = AudioVisualizer()
+        history = UserHistory(os.path.join(scratch, "bench.db"))
+
+        for i, text in enumerate(texts):
+            time_stage(f"analyze_mood[{i}]", lambda: analyzer.analyze_mood(text), args.repeat, results)
+        analysis = analyzer.analyze_mood(texts[0])
+        params = time_stage("get_music_parameters", lambda: music_params.get_music_parameters(analysis),
+                            args.repeat * 100, results)
+
+        generator.generate_music(Config.WARMUP_PROMPT, duration=Config.WARMUP_DURATION, seed=0)
+        audio = None
+        for duration in args.durations:
+            audio = time_stage(f"generate_music[{duration}s]",
+                               lambda: generator.generate_music(params["musicgen_prompt"], duration=duration, seed=0),
+                               args.repeat, results)
+
+        out_path = os.path.join(scratch, "bench.wav")
+        wav_path, mp3_path = time_stage("save_audio", lambda: generator.save_audio(audio, out_path),
+                                        args.repeat, results)
+
+        plots = ["create_waveform_plot", "create_spectrogram", "create_mel_spectrogram",
+                 "create_combined_visualization", "create_real_time_visualizer"]
+        for plot in plots:
+            render = getattr(visualizer, plot)
+            time_stage(f"visualizer.{plot}",
+                       lambda: visualizer.plot_to_streamlit(render(audio, generator.sr, analysis["mood"])),
+                       args.repeat, results)
+
+        with open(mp3_path or wav_path, "rb") as f:
+            audio_bytes = f.read()
+        time_stage("history.save_generation",
+                   lambda: history.save_generation("bench@melodai", texts[0], analysis, params.to_dict(), audio_bytes, 1.0),
+                   args.repeat * 10, results)
+        time_stage("history.get_user_history", lambda: history.get_user_history("bench@melodai"),
+                   args.repeat * 10, results)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "musicgen_model": Config.MUSICGEN_MODEL,
+        "sentiment_model": Config.SENTIMENT_MODEL,
+        "tiny": args.tiny,
+        "audio_bytes": len(audio_bytes),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"📄 Wrote {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    return 0
+
+
+CFG_BENCH_PROMPTS = [
+    BENCH_PROMPT,
+    "upbeat cheerful joyful positive uplifting, 128 bpm, C major, with piano, guitar, drums",
+    "mysterious suspenseful enigmatic atmospheric, 90 bpm, D minor, with cello, strings",
+]
+
+
+def parse_cfg_strategy(value):
+    """'off', 'full' or 'first_n:<steps>' -> generate_music sampling overrides"""
+    name, _, steps = value.partition(":")
+    if name == "first_n":
+        return {"cfg_strategy": name, "cfg_steps": int(steps or Config.CFG_STEPS)}
+    return {"cfg_strategy": name}
+
+
+class ClapScorer:
+    """Prompt adherence: cosine similarity of CLAP text and audio embeddings"""
+
+    def __init__(self, model_name=None):
+        import model_store
+        from transformers import ClapModel, ClapProcessor
+        model_name = model_name or Config.CLAP_MODEL
+        self.processor = model_store.from_pretrained(ClapProcessor, model_name)
+        self.model = model_store.from_pretrained(ClapModel, model_name).eval()
+        self.sr = self.processor.feature_extractor.sampling_rate
+
+    def score(self, prompt, audio, sr):
+        import torch
+        from math import gcd
+        from scipy.signal import resample_poly
+        step = gcd(self.sr, sr)
+        audio = resample_poly(audio, self.sr // step, sr // step).astype("float32")
+        inputs = self.processor(text=[prompt], audio=[audio], sampling_rate=self.sr,
+                                return_tensors="pt", padding=True)
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+        return float(torch.nn.functional.cosine_similarity(outputs.text_embeds, outputs.audio_embeds)[0])
+
+
+def run_cfg(args):
+    """Latency vs. prompt adherence (CLAP score) for each CFG strategy"""
+    if args.tiny:
+        from tiny_models import use_tiny_models
+        use_tiny_models()
+
+    from music_generator import MusicGenerator
+
+    with contextlib.redirect_stdout(sys.stderr):
+        generator = MusicGenerator()
+        try:
+            scorer = ClapScorer()
+        except Exception as e:
+            print(f"⚠️ CLAP model unavailable, reporting latency only: {e}")
+            scorer = None
+        generator.generate_music(Config.WARMUP_PROMPT, duration=Config.WARMUP_DURATION, seed=0)
+
+        rows = []
+        for strategy in args.strategies:
+            overrides = parse_cfg_strategy(strategy)
+            latencies, scores = [], []
+            for prompt in CFG_BENCH_PROMPTS:
+                for seed in range(args.seeds):
+                    start = time.perf_counter()
+                    audio = generator.generate_music(prompt, duration=args.duration, seed=seed, **overrides)
+                    latencies.append(time.perf_counter() - start)
+                    if scorer:
+                        scores.append(scorer.score(prompt, audio, generator.sr))
+            rows.append({
+                "strategy": strategy,
+                "runs": len(latencies),
+                "mean_latency_s": round(statistics.mean(latencies), 3),
+                "audio_s_per_s": round(args.duration / statistics.mean(latencies), 3),
+                "clap_score": round(statistics.mean(scores), 4) if scores else None,
+                "clap_score_stdev": round(statistics.stdev(scores), 4) if len(scores) > 1 else None,
+            })
+
+    baseline = next((row for row in rows if row["strategy"] == "full"), None)
+    for row in rows:
+        if baseline:
+            row["speedup_vs_full"] = round(baseline["mean_latency_s"] / row["mean_latency_s"], 3)
+            if row["clap_score"] is not None:
+                row["clap_delta_vs_full"] = round(row["clap_score"] - baseline["clap_score"], 4)
+
+    report = {"duration": args.duration, "seeds": args.seeds, "prompts": len(CFG_BENCH_PROMPTS),
+              "guidance_scale": Config.CLASSIFIER_FREE_GUIDANCE, "musicgen_model": Config.MUSICGEN_MODEL,
+              "clap_model": Config.CLAP_MODEL if scorer else None, "tiny": args.tiny, "results": rows}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'strategy':>14} {'latency s':>9} {'audio s/s':>9} {'speedup':>7} {'CLAP':>7} {'Δ CLAP':>7}")
+        for row in rows:
+            clap = f"{row['clap_score']:.4f}" if row["clap_score"] is not None else "n/a"
+            delta = f"{row['clap_delta_vs_full']:+.4f}" if "clap_delta_vs_full" in row else "n/a"
+            print(f"{row['strategy']:>14} {row['mean_latency_s']:>9.2f} {row['audio_s_per_s']:>9.2f} "
+                  f"{row.get('speedup_vs_full', 1.0):>7.2f} {clap:>7} {delta:>7}")
+    return 0
+
+
+def _legacy_postprocess(audio_tensor):
+    """MusicGenerator._postprocess before the in-place rewrite, for comparison"""
+    import numpy as np
+    arr = audio_tensor.detach().cpu().numpy()
+    if arr.ndim == 3:
+        arr = arr[0]
+    if arr.ndim == 2:
+        arr = np.mean(arr, axis=0)
+    maxv = np.max(np.abs(arr)) or 1e-8
+    return (arr / maxv * 0.95).astype(np.float32)
+
+
+def run_postprocess(args):
+    """Peak memory allocated and time per clip for each post-processing variant"""
+    import tracemalloc
+    import numpy as np
+    import torch
+    import audio_postprocess
+
+    sr = Config.MUSICGEN_SAMPLING_RATE
+    samples = int(args.duration * sr)
+    rng = np.random.default_rng(0)
+    t = np.arange(samples, dtype=np.float32) / sr
+    source = (0.2 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(samples)).astype(np.float32)
+    clip_bytes = source.nbytes
+
+    def peak_only(tensor):
+        return audio_postprocess.peak_normalize_(audio_postprocess.to_mono(tensor))
+
+    def loudness(tensor):
+        arr = audio_postprocess.to_mono(tensor)
+        audio_postprocess.loudness_normalize_(arr, sr, Config.LOUDNESS_TARGET_LUFS or -14.0)
+        return arr
+
+    def full(tensor):
+        return audio_postprocess.finalize_(audio_postprocess.to_mono(tensor), sr,
+                                           Config.LOUDNESS_TARGET_LUFS or -14.0, Config.TRUE_PEAK_CEILING_DB or -1.0)
+
+    variants = [("legacy", _legacy_postprocess), ("peak_in_place", peak_only),
+                ("lufs", loudness), ("lufs_limiter", full)]
+    # Warm up scipy imports and filter setup outside the measurement
+    full(torch.from_numpy(source[:sr].copy())[None, None])
+
+    rows = []
+    for name, fn in variants:
+        times, peaks = [], []
+        for _ in range(args.repeat):
+            tensor = torch.from_numpy(source.copy())[None, None]  # model output shape (batch, channels, samples)
+            tracemalloc.start()
+            start = time.perf_counter()
+            fn(tensor)
+            times.append(time.perf_counter() - start)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        peak_bytes = max(peaks)
+        rows.append({
+            "variant": name,
+            "mean_ms": round(statistics.mean(times) * 1000, 2),
+            "peak_alloc_mb": round(peak_bytes / 1e6, 2),
+            "clip_buffers": round(peak_bytes / clip_bytes, 2),
+        })
+
+    report = {"duration": args.duration, "sample_rate": sr, "clip_mb": round(clip_bytes / 1e6, 2),
+              "repeat": args.repeat, "results": rows}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.duration:g}s clip = {report['clip_mb']} MB float32")
+        print(f"{'variant':>14} {'ms':>8} {'peak MB':>8} {'buffers':>8}")
+        for row in rows:
+            print(f"{row['variant']:>14} {row['mean_ms']:>8.2f} {row['peak_alloc_mb']:>8.2f} {row['clip_buffers']:>8.2f}")
+    return 0
+
+
+# Labeled texts for `mood`; about half contain none of MoodAnalyzer's keywords
+MOOD_BENCH_SAMPLE = [
+    ("I'm so happy and excited for the weekend!", "happy"),
+    ("Best day ever, we won the championship", "happy"),
+    ("My sister just had a baby and the whole family is celebrating", "happy"),
+    ("Sunshine, ice cream and good friends at the beach", "happy"),
+    ("I feel cheerful and glad this morning", "happy"),
+    ("I got the job!!", "happy"),
+    ("I feel sad and lonely today...", "sad"),
+    ("My dog passed away last night", "sad"),
+    ("Nobody showed up to my birthday", "sad"),
+    ("It's been raining for weeks and I miss home", "sad"),
+    ("I'm heartbroken and miserable", "sad"),
+    ("We said goodbye at the airport and I couldn't stop crying", "sad"),
+    ("I need calm music for studying and focus", "calm"),
+    ("Lying in a hammock listening to the waves", "calm"),
+    ("A quiet cup of tea before everyone wakes up", "calm"),
+    ("Something to fall asleep to", "calm"),
+    ("A peaceful, relaxed Sunday afternoon", "calm"),
+    ("Yoga and deep breathing after work", "calm"),
+    ("I'm pumped and energetic for the gym", "energetic"),
+    ("Hit the dance floor, turn it up!", "energetic"),
+    ("Sprinting the last mile of the marathon", "energetic"),
+    ("Race day, engines roaring", "energetic"),
+    ("Lively, vibrant street festival", "energetic"),
+    ("Let's party all night long", "energetic"),
+    ("This mystery novel has me intrigued and curious", "mysterious"),
+    ("Footsteps in the attic but nobody lives upstairs", "mysterious"),
+    ("An old map leading to a hidden cave", "mysterious"),
+    ("Fog rolling over the graveyard at midnight", "mysterious"),
+    ("A cryptic message arrived with no sender", "mysterious"),
+    ("Detective searching for clues in the rain", "mysterious"),
+    ("I love you so much my darling", "romantic"),
+    ("Our first dance at the wedding", "romantic"),
+    ("Dinner by candlelight with my partner", "romantic"),
+    ("Watching the sunset together on our anniversary", "romantic"),
+    ("A tender, passionate kiss", "romantic"),
+    ("Writing a letter to the girl I can't stop thinking about", "romantic"),
+]
+
+
+def run_mood(args):
+    """Latency and accuracy of keyword+sentiment, embedding-only and tiered mood classification"""
+    if args.tiny:
+        from tiny_models import use_tiny_models
+        use_tiny_models()
+
+    if args.data:
+        import csv
+        with open(args.data, newline="", encoding="utf-8") as f:
+            sample = [(row["text"], row["mood"]) for row in csv.DictReader(f)]
+    else:
+        sample = MOOD_BENCH_SAMPLE
+
+    from mood_analyzer import MoodAnalyzer
+    from mood_embeddings import EmbeddingMoodClassifier
+
+    with contextlib.redirect_stdout(sys.stderr):
+        use_embedding = Config.USE_EMBEDDING_CLASSIFIER
+        Config.USE_EMBEDDING_CLASSIFIER = False
+        try:
+            analyzer = MoodAnalyzer()
+        finally:
+            Config.USE_EMBEDDING_CLASSIFIER = use_embedding
+        classifier = EmbeddingMoodClassifier()
+
+        sentiment_calls = [0]
+        analyze_sentiment = analyzer.analyze_sentiment
+
+        def counted_sentiment(text):
+            sentiment_calls[0] += 1
+            return analyze_sentiment(text)
+        analyzer.analyze_sentiment = counted_sentiment
+
+        def tiered(text):
+            analyzer.embedding_classifier = classifier
+            try:
+                return analyzer.analyze_mood(text)
+            finally:
+                analyzer.embedding_classifier = None
+
+        methods = [
+            ("keywords+sentiment", analyzer.analyze_mood),
+            ("embedding", classifier.classify),
+            ("tiered", tiered),
+        ]
+        # Warm both models outside the measurement
+        analyzer.analyze_mood(sample[0][0])
+        classifier.classify(sample[0][0])
+
+        rows = []
+        for name, classify in methods:
+            sentiment_calls[0] = 0
+            latencies, correct = [], 0
+            for text, label in sample:
+                start = time.perf_counter()
+                result = classify(text)
+                latencies.append(time.perf_counter() - start)
+                correct += result["mood"] == label
+            latencies.sort()
+            rows.append({
+                "method": name,
+                "accuracy": round(correct / len(sample), 3),
+                "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] * 1000, 2),
+                "sentiment_model_calls": sentiment_calls[0],
+            })
+
+        start = time.perf_counter()
+        classifier.classify_batch([text for text, _ in sample])
+        batch_ms = (time.perf_counter() - start) * 1000 / len(sample)
+
+    report = {"texts": len(sample), "sentiment_model": Config.SENTIMENT_MODEL,
+              "embedding_model": classifier.model_name, "min_confidence": Config.EMBEDDING_MIN_CONFIDENCE,
+              "embedding_batch_ms_per_text": round(batch_ms, 2), "tiny": args.tiny, "results": rows}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{len(sample)} labeled texts · embedding batch {batch_ms:.2f} ms/text")
+        print(f"{'method':>20} {'accuracy':>8} {'mean ms':>8} {'p95 ms':>8} {'sentiment calls':>15}")
+        for row in rows:
+            print(f"{row['method']:>20} {row['accuracy']:>8.3f} {row['mean_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                  f"{row['sentiment_model_calls']:>15}")
+    return 0
+
+
+def _claim_order(queue, jobs):
+    """Submit (name, duration, priority, age in seconds) jobs and return the names in claim order"""
+    import sqlite3
+
+    names = {}
+    for name, duration, priority, age in jobs:
+        job_id = queue.submit(f"scheduler check {name}", duration=duration, priority=priority)
+        conn = sqlite3.connect(queue.db_path)
+        conn.execute("UPDATE generation_jobs SET created_at = datetime('now', ?) WHERE id = ?", (f"-{age} seconds", job_id))
+        conn.commit()
+        conn.close()
+        names[job_id] = name
+    order = []
+    while (job := queue.claim_next(os.getpid())) is not None:
+        order.append(names[job["id"]])
+        queue.complete(job["id"], None, None, 0.0)
+    return order
+
+
+def run_scheduler(args):
+    """Check JobQueue.claim_next ordering: class first, then cost, with whole-class aging"""
+    from generation_worker import JobQueue
+
+    aging = Config.SCHEDULER_AGING_SECONDS
+    cases = [
+        ("cheaper job queued later in the same class runs first",
+         [("long", 30, "interactive", 1), ("short", 5, "interactive", 0)], ["short", "long"]),
+        ("higher class runs before a cheaper lower class",
+         [("interactive", 1, "interactive", 0), ("preview", None, "preview", 0)], ["preview", "interactive"]),
+    ]
+    if aging:
+        cases += [
+            ("aging below a full step keeps the class",
+             [("bulk", 1, "bulk", aging // 2), ("interactive", 30, "interactive", 0)], ["interactive", "bulk"]),
+            ("a bulk job waiting two aging steps runs before new interactive work",
+             [("bulk", 30, "bulk", 2 * aging + 1), ("interactive", 5, "interactive", 0)], ["bulk", "interactive"]),
+        ]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for description, jobs, expected in cases:
+            queue = JobQueue(os.path.join(tmp, f"jobs-{len(results)}.db"))
+            jobs = [(name, Config.PREVIEW_DURATION if duration is None else duration, priority, age)
+                    for name, duration, priority, age in jobs]
+            order = _claim_order(queue, jobs)
+            results.append({"case": description, "expected": expected, "claimed": order, "ok": order == expected})
+
+    if args.json:
+        print(json.dumps({"aging_seconds": aging, "results": results}, indent=2))
+    else:
+        for result in results:
+            print(f"{'✅' if result['ok'] else '❌'} {result['case']}: {' -> '.join(result['claimed'])}")
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+def _history_page():
+    """AppTest script: the History page with every entry listed ("Show all")"""
+    import app
+    app.show_history()
+
+
+def _tree_bytes(node):
+    """Serialized size of every element proto under an AppTest node"""
+    size = node.proto.ByteSize() if getattr(node, "proto", None) is not None else 0
+    for child in getattr(node, "children", {}).values():
+        size += _tree_bytes(child)
+    return size
+
+
+def run_history(args):
+    """Page payload and render time of the History page per history size and rendering mode"""
+    import sqlite3
+    import numpy as np
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1 import AppTest
+    import audio_storage
+    import media_server
+    from auth import UserHistory
+
+    sr = Config.MUSICGEN_SAMPLING_RATE
+    t = np.arange(Config.MUSICGEN_DURATION * sr, dtype=np.float32) / sr
+    audio_data, audio_codec = audio_storage.encode(0.2 * np.sin(2 * np.pi * 220 * t), sr)
+    # (lazy entries, audio by URL): eager + inline is how the page rendered before lazy entries
+    modes = {"eager_inline": (False, False), "lazy_inline": (True, False), "lazy_url": (True, True)}
+
+    # Bytes st.audio / st.download_button hand to Streamlit's media endpoint
+    media_bytes = []
+    load_media = MemoryMediaFileStorage.load_and_get_id
+
+    def counting_load(self, path_or_data, *a, **kw):
+        if isinstance(path_or_data, bytes):
+            media_bytes.append(len(path_or_data))
+        return load_media(self, path_or_data, *a, **kw)
+
+    MemoryMediaFileStorage.load_and_get_id = counting_load
+    rows = []
+    saved = (Config.HISTORY_LAZY_ENTRIES, Config.TRACE_LOG_PATH, media_server._server)
+    cwd = os.getcwd()
+    Config.TRACE_LOG_PATH = None
+    try:
+        for entries in args.entries:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)  # app.py opens users.db relative to the working directory
+                history = UserHistory()
+                conn = sqlite3.connect("users.db")
+                conn.executemany(
+                    "INSERT INTO user_history (user_email, input_text, mood_analysis, music_params, audio_data, "
+                    "generation_time, timestamp, audio_codec, audio_size) "
+                    "VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?), ?, ?)",
+                    [("bench@melodai", f"{BENCH_PROMPT} #{i}", json.dumps({"mood": "calm", "sentiment": "positive"}),
+                      json.dumps({"tempo": 80, "key": "G", "scale": "major", "instruments": ["harp"]}),
+                      audio_data, 12.0, f"-{i} minutes", audio_codec, len(audio_data)) for i in range(entries)]
+                )
+                conn.commit()
+                conn.close()
+
+                for mode, (lazy, by_url) in modes.items():
+                    Config.HISTORY_LAZY_ENTRIES = lazy
+                    media_server._server = saved[2]
+                    if by_url and media_server._server is None:
+                        media_server.start_media_server(port=0, db_path=history.db_path)
+                    elif not by_url:
+                        media_server._server = None
+                    times, payload = [], 0
+                    for _ in range(args.repeat):
+                        media_bytes.clear()
+                        at = AppTest.from_function(_history_page, default_timeout=600)
+                        at.session_state["user_email"] = "bench@melodai"
+                        at.session_state["history_pages_shown"] = entries
+                        start = time.perf_counter()
+                        at.run()
+                        times.append(time.perf_counter() - start)
+                        if at.exception:
+                            raise RuntimeError(at.exception[0].message)
+                        payload = _tree_bytes(at._tree)
+                    rows.append({"entries": entries, "mode": mode,
+                                 "render_ms": round(statistics.median(times) * 1000, 1),
+                                 "page_kb": round(payload / 1024, 1), "media_kb": round(sum(media_bytes) / 1024, 1)})
+                os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        MemoryMediaFileStorage.load_and_get_id = load_media
+        Config.HISTORY_LAZY_ENTRIES, Config.TRACE_LOG_PATH, _ = saved
+
+    if args.json:
+        print(json.dumps({"audio_kb": round(len(audio_data) / 1024, 1), "results": rows}, indent=2))
+    else:
+        print(f"{len(audio_data) / 1024:.0f} KB of {audio_codec} audio per entry")
+        print(f"{'entries':>8} {'mode':>13} {'render ms':>10} {'page KB':>9} {'media KB':>10}")
+        for row in rows:
+            print(f"{row['entries']:>8} {row['mode']:>13} {row['render_ms']:>10.1f} "
+                  f"{row['page_kb']:>9.1f} {row['media_kb']:>10.1f}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MelodAI performance checks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    imports_parser = subparsers.add_parser("imports", help="Profile cold import time (-X importtime)")
+    imports_parser.add_argument("--module", default="app", help="Module to import (default: app)")
+    imports_parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    imports_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    imports_parser.set_defaults(func=run_imports)
+
+    threads_parser = subparsers.add_parser("threads", help="Sweep torch threads vs concurrent generation throughput")
+    threads_parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4], help="Intra-op thread counts to try")
+    threads_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2], help="Concurrent worker processes")
+    threads_parser.add_argument("--duration", type=float, default=4, help="Seconds of audio per request")
+    threads_parser.add_argument("--requests", type=int, default=2, help="Requests per worker")
+    threads_parser.add_argument("--tiny", action="store_true", help="Use tiny random models (no downloads)")
+    threads_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    threads_parser.set_defaults(func=run_threads)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="Time every compose pipeline stage (JSON output)")
+    pipeline_parser.add_argument("--durations", type=float, nargs="+", default=[2, 4, 8],
+                                 help="generate_music durations in seconds")
+    pipeline_parser.add_argument("--repeat", type=int, default=3, help="Runs per stage")
+    pipeline_parser.add_argument("--tiny", action="store_true", help="Use tiny random models (no downloads)")
+    pipeline_parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    pipeline_parser.set_defaults(func=run_pipeline)
+
+    cfg_parser = subparsers.add_parser("cfg", help="Latency vs. CLAP prompt adherence per CFG strategy")
+    cfg_parser.add_argument("--strategies", nargs="+", default=["off", "first_n:25", "first_n:100", "full"],
+                            help="off, full or first_n:<guided steps>")
+    cfg_parser.add_argument("--duration", type=float, default=8, help="Seconds of audio per run")
+    cfg_parser.add_argument("--seeds", type=int, default=3, help="Seeds per prompt")
+    cfg_parser.add_argument("--tiny", action="store_true", help="Use tiny random models (no downloads)")
+    cfg_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    cfg_parser.set_defaults(func=run_cfg)
+
+    postprocess_parser = subparsers.add_parser("postprocess", help="Memory allocated per clip by audio post-processing")
+    postprocess_parser.add_argument("--duration", type=float, default=30, help="Clip length in seconds")
+    postprocess_parser.add_argument("--repeat", type=int, default=5, help="Runs per variant")
+    postprocess_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    postprocess_parser.set_defaults(func=run_postprocess)
+
+    history_parser = subparsers.add_parser("history", help="History page payload and render time vs. history size")
+    history_parser.add_argument("--entries", type=int, nargs="+", default=[10, 100, 1000], help="History sizes")
+    history_parser.add_argument("--repeat", type=int, default=3, help="Renders per size and mode")
+    history_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    history_parser.set_defaults(func=run_history)
+
+    mood_parser = subparsers.add_parser("mood", help="Latency and accuracy of the mood classification tiers")
+    mood_parser.add_argument("--data", help="CSV with text and mood columns (default: built-in labeled sample)")
+    mood_parser.add_argument("--tiny", action="store_true", help="Use tiny random models (no downloads)")
+    mood_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    mood_parser.set_defaults(func=run_mood)
+
+    scheduler_parser = subparsers.add_parser("scheduler", help="Check job claim order (priority, cost, aging)")
+    scheduler_parser.add_argument("--json", action="store_true", help="Print a machine-readable report")
+    scheduler_parser.set_defaults(func=run_scheduler)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
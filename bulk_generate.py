@@ -0,0 +1,270 @@
+# bulk_generate.py
+"""
+Offline bulk generation for prompt catalogs.
+
+    python bulk_generate.py catalog.csv --out bulk_output [--workers auto] [--duration 30]
+    python bulk_generate.py --moods [--energies 3 5 8] --out backgrounds
+
+Input rows (a CSV file with a header row, or JSON lines) need either a
+"text", which goes through MoodAnalyzer and MusicParameters like the
+composer, or a ready-made "prompt". Optional columns are "id",
+"duration" and "seed". --moods generates every mood in
+MusicParameters.mood_mappings at each --energies level instead.
+
+Rows are submitted to the generation job queue at "bulk" priority, so the
+queue can be shared with a running app without delaying its users. They
+are run by a WorkerPool of --workers processes (0 = use the workers that
+already serve the queue). Finished audio is moved to --out and recorded
+in manifest.jsonl. Rerunning the same command skips rows already in the
+manifest and re-attaches to the jobs listed in checkpoint.json, so an
+interrupted run resumes where it stopped.
+
+Throughput is reported as seconds of audio per wall-clock second.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import time
+from config import Config
+from generation_worker import AdmissionRejected, JobQueue, WorkerPool, resolve_worker_count
+import scratch_space
+
+DEFAULT_ENERGIES = (3.0, 5.0, 8.0)
+
+
+def read_rows(path):
+    """Rows of a CSV (with header) or JSON-lines catalog as dicts"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+
+def mood_rows(energies=DEFAULT_ENERGIES):
+    """One row per mood in MusicParameters.mood_mappings and energy level"""
+    from music_parameters import MusicParameters
+
+    return [
+        {"id": f"{mood}-e{energy:g}", "mood": mood, "energy_level": energy}
+        for mood in MusicParameters().mood_mappings
+        for energy in energies
+    ]
+
+
+def plan_items(rows, duration=Config.MUSICGEN_DURATION, skip=()):
+    """
+    Resolve every row to a MusicGen prompt. Texts are analyzed with
+    MoodAnalyzer, which is only loaded when some row needs it; rows whose
+    id is in `skip` (already generated) are left out.
+    """
+    from music_parameters import MusicParameters
+
+    music_parameters = MusicParameters()
+    mood_analyzer = None
+    items, seen = [], set()
+    for index, row in enumerate(rows):
+        item_id = str(row.get("id") or f"row-{index:05d}")
+        if item_id in seen:
+            raise ValueError(f"Duplicate catalog id {item_id!r}")
+        seen.add(item_id)
+        if item_id in skip:
+            continue
+
+        item = {
+            "id": item_id,
+            "text": row.get("text") or None,
+            "duration": float(row.get("duration") or duration),
+            "seed": int(row["seed"]) if row.get("seed") not in (None, "") else None,
+        }
+        if row.get("prompt"):
+            item["prompt"] = row["prompt"]
+        else:
+            if row.get("mood"):
+                mood_analysis = {"mood": row["mood"], "energy_level": float(row.get("energy_level") or 5.0)}
+            elif item["text"]:
+                if mood_analyzer is None:
+                    from mood_analyzer import MoodAnalyzer
+                    mood_analyzer = MoodAnalyzer()
+                mood_analysis = mood_analyzer.analyze_mood(item["text"])
+            else:
+                raise ValueError(f"Catalog row {item_id!r} needs a 'text', 'prompt' or 'mood'")
+            item["mood"] = mood_analysis["mood"]
+            item["energy_level"] = mood_analysis["energy_level"]
+            item["prompt"] = music_parameters.get_music_parameters(mood_analysis)["musicgen_prompt"]
+        items.append(item)
+    return items
+
+
+class BulkRun:
+    """
+    Submits catalog items to a JobQueue, keeping at most `max_pending` in
+    flight, and collects their audio into `out_dir`.
+
+    manifest.jsonl gets one line per finished item; checkpoint.json maps
+    items still in flight to their job ids. Both are rewritten as jobs
+    finish, so the run can be interrupted at any point.
+    """
+
+    def __init__(self, out_dir, queue, max_pending=4, codec="wav", poll_interval=Config.JOB_POLL_INTERVAL):
+        self.out_dir = out_dir
+        self.queue = queue
+        self.max_pending = max(1, max_pending)
+        self.codec = codec
+        self.poll_interval = poll_interval
+        self.manifest_path = os.path.join(out_dir, "manifest.jsonl")
+        self.checkpoint_path = os.path.join(out_dir, "checkpoint.json")
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.done = set()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.done = {entry["id"] for entry in map(json.loads, f) if entry.get("status") == "done"}
+        self.pending = {}
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                self.pending = {item_id: int(job_id) for item_id, job_id in json.load(f).items()}
+
+    def _save_checkpoint(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.pending, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _record(self, entry):
+        with open(self.manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _write_audio(self, item, wav_path):
+        """Copy a finished job's WAV (or its re-encoding) to the output directory"""
+        if self.codec == "wav":
+            file_name = f"{item['id']}.wav"
+            shutil.copyfile(wav_path, os.path.join(self.out_dir, file_name))
+            return file_name
+        import audio_storage
+
+        audio_data, label = audio_storage.encode_file(wav_path, self.codec)
+        file_name = f"{item['id']}.{audio_storage.file_extension(label)}"
+        with open(os.path.join(self.out_dir, file_name), "wb") as f:
+            f.write(audio_data)
+        return file_name
+
+    def _submit(self, item):
+        return self.queue.submit(item["prompt"], duration=item["duration"], seed=item["seed"], priority="bulk")
+
+    def run(self, items):
+        """Generate every item not yet in the manifest. Returns a throughput summary."""
+        items_by_id = {item["id"]: item for item in items}
+        # Drop checkpointed jobs for items no longer in the catalog
+        self.pending = {item_id: job_id for item_id, job_id in self.pending.items()
+                        if item_id in items_by_id and item_id not in self.done}
+        todo = [item for item in items if item["id"] not in self.done and item["id"] not in self.pending]
+        total = len(todo) + len(self.pending)
+        print(f"📋 {len(todo)} item(s) to submit, {len(self.pending)} resumed from the checkpoint, "
+              f"{len(self.done)} already done")
+
+        start_time = time.time()
+        audio_seconds, finished, failed = 0.0, 0, 0
+        retry_at = 0.0
+        while todo or self.pending:
+            # Keep the workers fed without flooding the shared queue
+            while todo and len(self.pending) < self.max_pending and time.time() >= retry_at:
+                item = todo[0]
+                try:
+                    self.pending[item["id"]] = self._submit(item)
+                except AdmissionRejected as e:
+                    retry_at = time.time() + (e.retry_after or self.poll_interval)
+                    break
+                todo.pop(0)
+                self._save_checkpoint()
+
+            for job_id in sorted(set(self.pending.values())):
+                job = self.queue.get_job(job_id)
+                status = job["status"] if job else "failed"
+                if status in ("queued", "running"):
+                    continue
+                if status == "done" and not os.path.exists(job["wav_path"]):
+                    # Swept from the scratch space before this run collected it
+                    status, job["error"] = "failed", "audio expired before it was collected; rerun to regenerate"
+
+                # Identical rows are merged into one job by JobQueue.submit
+                item_ids = [item_id for item_id, pending_id in self.pending.items() if pending_id == job_id]
+                for item_id in item_ids:
+                    item = items_by_id[item_id]
+                    entry = {**item, "job_id": job_id, "status": status}
+                    if status == "done":
+                        entry["file"] = self._write_audio(item, job["wav_path"])
+                        entry["generation_time"] = job["generation_time"]
+                        audio_seconds += item["duration"]
+                        finished += 1
+                    else:
+                        entry["error"] = job["error"] if job else "job not found"
+                        failed += 1
+                    self._record(entry)
+                    del self.pending[item_id]
+                    elapsed = time.time() - start_time
+                    print(f"{'✅' if status == 'done' else '❌'} [{finished + failed}/{total}] {item_id} "
+                          f"({status}) · {audio_seconds / elapsed:.2f} s audio/s")
+                if status == "done":
+                    scratch_space.release(job_id)
+                self._save_checkpoint()
+            if todo or self.pending:
+                time.sleep(self.poll_interval)
+
+        elapsed = time.time() - start_time
+        return {
+            "finished": finished,
+            "failed": failed,
+            "audio_seconds": audio_seconds,
+            "wall_seconds": elapsed,
+            "audio_seconds_per_second": audio_seconds / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MelodAI offline bulk generation")
+    parser.add_argument("catalog", nargs="?", help="CSV or JSONL file with text/prompt rows")
+    parser.add_argument("--moods", action="store_true", help="Generate every mood at each --energies level")
+    parser.add_argument("--energies", type=float, nargs="+", default=list(DEFAULT_ENERGIES),
+                        help="Energy levels (0-10) for --moods")
+    parser.add_argument("--out", default="bulk_output", help="Directory for audio, manifest.jsonl and checkpoint.json")
+    parser.add_argument("--duration", type=float, default=Config.MUSICGEN_DURATION,
+                        help="Seconds per track when a row has no duration")
+    parser.add_argument("--codec", default="wav", help="Output codec: wav or an audio_storage codec (opus, flac, ...)")
+    parser.add_argument("--workers", default=str(Config.GENERATION_WORKERS),
+                        help="Worker processes to start, 'auto', or 0 to use workers already serving --db")
+    parser.add_argument("--max-pending", type=int, help="Jobs in flight at once (default: 2 per worker)")
+    parser.add_argument("--db", default=Config.JOBS_DB_PATH, help="SQLite database holding the job queue")
+    args = parser.parse_args(argv)
+
+    if args.catalog:
+        rows = read_rows(args.catalog)
+    elif args.moods:
+        rows = mood_rows(args.energies)
+    else:
+        parser.error("give a catalog file or --moods")
+
+    num_workers = resolve_worker_count(None if args.workers == "0" else args.workers)
+    run = BulkRun(args.out, JobQueue(args.db), args.max_pending or 2 * num_workers, args.codec)
+    items = plan_items(rows, args.duration, skip=run.done)
+
+    pool = None
+    if args.workers != "0":
+        pool = WorkerPool(num_workers, args.db).start()
+    try:
+        summary = run.run(items)
+    except KeyboardInterrupt:
+        print(f"⏸️ Interrupted; rerun the same command to resume ({len(run.pending)} job(s) left in the queue)")
+        return 130
+    finally:
+        if pool:
+            pool.stop()
+
+    print(f"🏁 {summary['finished']} done, {summary['failed']} failed: {summary['audio_seconds']:.0f}s of audio "
+          f"in {summary['wall_seconds']:.0f}s ({summary['audio_seconds_per_second']:.2f} s audio/s)")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,7 +1,10 @@
 class Config:
     # Mood analysis models
     SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
-    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"    # first-tier mood classifier (see mood_embeddings.py)
+    USE_EMBEDDING_CLASSIFIER = False    # ask the embedding classifier before the sentiment model
+    EMBEDDING_MIN_CONFIDENCE = 0.6      # softmax confidence needed to skip the sentiment model
+    EMBEDDING_TEMPERATURE = 0.05        # softmax temperature over cosine similarities
     MAX_LENGTH = 128
     DEVICE = "cpu"   # ✅ Force CPU mode
     
@@ -10,6 +13,13 @@ class Config:
     # Music generation models
     MUSICGEN_MODEL = "facebook/musicgen-small"
 
+    # Local model store (see model_store.py)
+    MODEL_CACHE_DIR = "models"
+    MODEL_LOCK_FILE = "models/models.lock.json"   # pinned commit hashes, written by `model_store.py fetch`
+    MODEL_REVISIONS = {}            # model id -> branch/tag/commit used before a lock entry exists
+    MODEL_OFFLINE = False           # True: never download, fail if a model is missing locally
+    MODEL_PREFER_SAFETENSORS = True # mmap'd weights shared through the page cache
+
     MUSICGEN_DURATION = 16 # seconds
     MUSICGEN_SAMPLING_RATE = 32000
 
@@ -17,17 +27,109 @@ class Config:
     AUDIO_FORMAT = "mp3"
     AUDIO_BITRATE = "128k"
     DEFAULT_TEMPO = 120  # BPM
+    LOUDNESS_TARGET_LUFS = None     # e.g. -14.0 to level every clip by loudness; None = peak-normalize to 0.95
+    TRUE_PEAK_CEILING_DB = None     # e.g. -1.0 for a true-peak limiter ceiling in dBTP; None disables the limiter
+    OUTPUT_CHANNELS = "mono"        # "mono" downmixes; "native" keeps the model's channels (stereo models)
+    OUTPUT_SAMPLE_RATE = None       # rate of saved files; None = MUSICGEN_SAMPLING_RATE
+    PREVIEW_SAMPLE_RATE = 24000     # previews are stored and served at this rate
+
+    # History audio storage (see audio_storage.py)
+    STORAGE_CODEC = "opus"          # "opus", "vorbis", "mp3", "flac" (lossless archive) or "wav"
+    STORAGE_BITRATE_KBPS = 48       # Opus bitrate of new history entries
+    USER_STORAGE_QUOTA_MB = None    # e.g. 100: per user; oldest non-favorite entries are DELETED past it. None = unlimited
+    COMPACT_AFTER_DAYS = None       # e.g. 30: non-favorite entries older than this are re-encoded (lossy); None disables
+    COMPACT_CODEC = "opus"
+    COMPACT_BITRATE_KBPS = 24
+    COMPACT_INTERVAL = 6 * 3600     # seconds between background compaction passes
 
     # File paths
     TEMP_AUDIO_DIR = "temp_audio"
     OUTPUT_FILENAME = "generated_music"
 
+    # Scratch space for job audio (see scratch_space.py)
+    SCRATCH_PREFER_TMPFS = True     # keep job audio on /dev/shm instead of TEMP_AUDIO_DIR when it is a tmpfs
+    SCRATCH_MAX_MB = 1024           # oldest finished job directories are deleted beyond this; None = unbounded
+    SCRATCH_RETENTION_SECONDS = 3600    # finished jobs' files are kept this long (playback, preview continuation)
+    SCRATCH_SWEEP_INTERVAL = 300    # seconds between sweeps
+
     # Generation parameters
     TOP_K = 250
     TOP_P = 0.8
     TEMPERATURE = 1.0
     CLASSIFIER_FREE_GUIDANCE = 3.0  # CFG scale
+    CFG_STRATEGY = "full"           # "off", "full" or "first_n" (guidance on the first CFG_STEPS tokens)
+    CFG_STEPS = 50
+    TEXT_ENCODER_CACHE_MB = 32      # LRU cache of T5 states per prompt; 0 disables
     TOKENS_PER_SECOND = 50          # controls how long audio is
 
+    # Long-form generation (see MusicGenerator.generate_long_music)
+    LONGFORM_WINDOW_SECONDS = 30    # longer durations are generated in windows; None disables
+    LONGFORM_OVERLAP_SECONDS = 10   # audio tail each window is conditioned on
+    LONGFORM_CROSSFADE_SECONDS = 1.0
+
+    # Preview tier (see MusicGenerator.generate_preview)
+    PREVIEW_DURATION = 8            # seconds; can be continued to MUSICGEN_DURATION
+    PREVIEW_CFG_STRATEGY = "first_n"    # cheaper guidance for previews; see CFG_STRATEGY
+
     # UI settings
     MAX_TEXT_INPUT_LENGTH = 500
+    HISTORY_MAX_ENTRIES = 1000      # history rows listed (metadata only; audio loads per opened entry)
+    HISTORY_LAZY_ENTRIES = True     # False renders every entry's body (audio, actions, tag form) even when collapsed
+
+    # Model preloading (see model_warmup.py)
+    PRELOAD_MODELS = True
+    WARMUP_TEXT = "I feel calm and happy"
+    WARMUP_PROMPT = "calm piano"
+    WARMUP_DURATION = 1             # seconds of audio for the warm-up generation
+
+    # Generation workers (see generation_worker.py)
+    USE_GENERATION_WORKERS = True   # False: run jobs on a thread of the Streamlit process (InlineWorker)
+    SPAWN_WORKERS_WITH_APP = True   # False when workers run as `python generation_worker.py`
+    GENERATION_WORKERS = "auto"     # number of worker processes, or "auto"
+    WORKER_THREADS = 4              # cores per worker; "auto" runs cpu_count // WORKER_THREADS workers
+    JOBS_DB_PATH = "users.db"
+    JOB_POLL_INTERVAL = 1.0         # seconds between queue/status polls
+    JOB_CANCEL_CHECK_INTERVAL = 0.5 # seconds between cancel checks during decoding
+    PROGRESS_UPDATE_INTERVAL = 0.5  # seconds between decoding progress reports
+
+    # Admission control (see JobQueue.submit); identical in-flight requests are always merged
+    MAX_QUEUE_DEPTH = 20            # queued jobs across all users before new ones are refused; None = unlimited
+    MAX_JOBS_PER_USER = 2           # queued + running jobs per user; None = unlimited
+    USER_RATE_LIMIT_PER_HOUR = 30   # token-bucket refill per user; None disables
+    USER_RATE_LIMIT_BURST = 5       # token-bucket size
+
+    # Job scheduling (see JobQueue.claim_next): priority class, then estimated cost, then age
+    SCHEDULER_AGING_SECONDS = 120   # waiting this long raises a job one priority class; None = strict priority
+
+    # Pre-generated audio pool (see audio_pool.py)
+    POOL_CLIPS_PER_KEY = 2          # clips kept per (mood, energy bucket); 0 disables the pool
+    POOL_ENERGY_BUCKETS = (3.0, 5.5, 8.0)   # energy levels clips are made at; requests use the nearest
+    POOL_MAX_AGE_HOURS = 24         # unused clips older than this are regenerated
+    POOL_REFILL_INTERVAL = 15       # seconds between refill passes; a refill only starts when no job is queued
+
+    # CPU execution profile (see cpu_profile.py)
+    TORCH_NUM_THREADS = None        # intra-op threads per process; None = WORKER_THREADS
+    TORCH_INTEROP_THREADS = 1
+    PIN_WORKER_CPUS = False         # pin each worker to its own block of cores
+    WORKER_CPU_SETS = None          # explicit core sets, e.g. [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+    # History audio endpoint (see media_server.py)
+    MEDIA_PORT = None               # e.g. 8502 to serve /audio/<id> with Range/ETag support; None inlines audio in the page
+    MEDIA_HOST = "127.0.0.1"        # "0.0.0.0" when browsers connect from other machines
+    MEDIA_PUBLIC_URL = None         # base URL browsers use, e.g. "https://music.example.com/media"; None = http://localhost:MEDIA_PORT
+    MEDIA_URL_SECRET = None         # signs audio URLs; None = random per process (URLs expire on restart)
+    MEDIA_CACHE_SECONDS = 86400
+
+    # Tracing and metrics (see tracing.py)
+    TRACE_LOG_PATH = "logs/traces.jsonl"   # None disables the JSONL trace log
+    TRACE_LOG_MAX_BYTES = 10 * 1024 * 1024
+    METRICS_PORT = None             # e.g. 9464 to serve Prometheus text at /metrics
+    METRICS_PUBLISH_INTERVAL = 10   # seconds between worker metric snapshots in the job database
+    ADMIN_EMAILS = []               # users who see the Admin page
+
+    # Startup settings (a manual gate: run `python benchmark.py imports` before merging import changes)
+    STARTUP_IMPORT_BUDGET = 3.0     # seconds for a cold `import app`
+    STARTUP_DEFERRED_MODULES = ["torch", "transformers", "librosa", "matplotlib", "scipy", "sentence_transformers"]
+
+    # Quality scoring for `python benchmark.py cfg` (text-audio similarity)
+    CLAP_MODEL = "laion/clap-htsat-unfused"
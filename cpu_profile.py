@@ -0,0 +1,63 @@
+# cpu_profile.py
+"""
+Per-process CPU execution profile for torch.
+
+Every worker process gets Config.TORCH_NUM_THREADS intra-op threads (default
+Config.WORKER_THREADS) and Config.TORCH_INTEROP_THREADS inter-op threads, and
+can be pinned to its own core set, so concurrent workers do not oversubscribe
+the machine. Call apply_cpu_profile() before the first model is loaded.
+"""
+import os
+from config import Config
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def worker_cpu_set(worker_index, num_threads):
+    """Cores for worker `worker_index`: from Config.WORKER_CPU_SETS or contiguous blocks"""
+    if Config.WORKER_CPU_SETS:
+        return list(Config.WORKER_CPU_SETS[worker_index % len(Config.WORKER_CPU_SETS)])
+    cpus = available_cpus()
+    blocks = [cpus[i:i + num_threads] for i in range(0, len(cpus) - num_threads + 1, num_threads)]
+    return blocks[worker_index % len(blocks)] if blocks else cpus
+
+
+def apply_cpu_profile(worker_index=None, num_threads=None):
+    """
+    Configure torch threading (and optionally CPU affinity) for this process.
+
+    Args:
+        worker_index: index of the worker in its pool; enables pinning when
+            Config.PIN_WORKER_CPUS is set
+        num_threads: intra-op thread count overriding the Config default
+
+    Returns:
+        dict describing the applied profile
+    """
+    num_threads = num_threads or Config.TORCH_NUM_THREADS or Config.WORKER_THREADS
+    profile = {"num_threads": num_threads, "interop_threads": Config.TORCH_INTEROP_THREADS, "cpus": None}
+
+    if worker_index is not None and Config.PIN_WORKER_CPUS and hasattr(os, "sched_setaffinity"):
+        cpus = worker_cpu_set(worker_index, num_threads)
+        os.sched_setaffinity(0, cpus)
+        profile["cpus"] = cpus
+
+    # Only honoured by OpenMP/MKL if torch has not been imported yet
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+
+    import torch
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(Config.TORCH_INTEROP_THREADS)
+    except RuntimeError:
+        # Can only be set once, before any inter-op parallel work has started
+        profile["interop_threads"] = torch.get_num_interop_threads()
+
+    print(f"🧵 CPU profile: {num_threads} intra-op / {profile['interop_threads']} inter-op threads"
+          + (f", pinned to cores {profile['cpus']}" if profile["cpus"] else ""))
+    return profile
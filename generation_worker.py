@@ -0,0 +1,720 @@
+# generation_worker.py
+"""
+Out-of-process music generation.
+
+The Streamlit app submits jobs to a SQLite-backed queue (the same users.db
+used for history) and polls them; one or more worker processes claim jobs,
+run MusicGenerator and write the audio to a per-job scratch directory
+(scratch_space.py). Keeping
+model.generate out of the web process means a long CPU-bound generation no
+longer blocks a session, and torch threads from different sessions stop
+fighting over the GIL.
+
+Run workers as a separate service with:
+    python generation_worker.py --workers auto
+or let app.py spawn them (Config.SPAWN_WORKERS_WITH_APP). With
+Config.USE_GENERATION_WORKERS off, InlineWorker runs the same jobs on a
+thread of the app process instead.
+
+Jobs submitted with history metadata are saved to UserHistory by whoever
+runs them, so a finished track lands in the user's history even if the
+page that submitted it was closed or rerun.
+"""
+import argparse
+import calendar
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from config import Config
+import scratch_space
+import tracing
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+# Scheduling classes, most urgent first (see JobQueue.claim_next)
+JOB_PRIORITIES = {"preview": 0, "interactive": 1, "bulk": 2}
+
+
+def estimate_cost(params):
+    """
+    Decoder work of a job in token-steps, the unit JobQueue.claim_next
+    sorts by within a priority class.
+
+    Counts the tokens the job decodes (only the new ones for a preview
+    continuation, plus the re-decoded overlap of long-form windows) and
+    doubles the steps that run with classifier-free guidance, which
+    batches the unconditional pass alongside the conditional one.
+    """
+    duration = params.get("duration", Config.MUSICGEN_DURATION)
+    preview = params.get("preview", False)
+    if params.get("continue_from") is not None:
+        duration = max(0.0, duration - Config.PREVIEW_DURATION)
+    tokens = duration * Config.TOKENS_PER_SECOND
+
+    window = Config.LONGFORM_WINDOW_SECONDS
+    overlap = Config.LONGFORM_OVERLAP_SECONDS
+    if window and duration > window and window > overlap:
+        extra_windows = -(-(duration - window) // (window - overlap))
+        tokens += extra_windows * overlap * Config.TOKENS_PER_SECOND
+
+    strategy = Config.PREVIEW_CFG_STRATEGY if preview else Config.CFG_STRATEGY
+    if strategy == "full":
+        guided = tokens
+    elif strategy == "first_n":
+        guided = min(tokens, Config.CFG_STEPS)
+    else:
+        guided = 0
+    return float(tokens + guided)
+
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised by JobQueue.submit when a job is not admitted.
+
+    `reason` is "queue_full", "user_concurrency" or "rate_limited";
+    `retry_after` is a suggested wait in seconds, when known.
+    """
+
+    def __init__(self, reason, message, retry_after=None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    def __init__(self, db_path=Config.JOBS_DB_PATH):
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        # Autocommit mode so claim_next() can take an explicit write lock
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _init_db(self):
+        """Initialize the generation job table"""
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email TEXT,
+            prompt TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            cancel_requested BOOLEAN DEFAULT 0,
+            worker_pid INTEGER,
+            wav_path TEXT,
+            mp3_path TEXT,
+            error TEXT,
+            generation_time REAL,
+            progress TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs (status, id)"
+        )
+        # Columns added after the table was first created
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(generation_jobs)")}
+        if "progress" not in columns:
+            cursor.execute("ALTER TABLE generation_jobs ADD COLUMN progress TEXT")
+        if "dedup_key" not in columns:
+            cursor.execute("ALTER TABLE generation_jobs ADD COLUMN dedup_key TEXT")
+        if "priority" not in columns:
+            cursor.execute("ALTER TABLE generation_jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1")
+        if "cost" not in columns:
+            cursor.execute("ALTER TABLE generation_jobs ADD COLUMN cost REAL NOT NULL DEFAULT 0")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_jobs_dedup ON generation_jobs (dedup_key, status)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_generation_jobs_user ON generation_jobs (user_email, status)"
+        )
+        # Per-user token buckets for USER_RATE_LIMIT_PER_HOUR
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_rate_limits (
+            user_email TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        ''')
+
+        conn.close()
+
+    def submit(self, prompt, user_email=None, duration=Config.MUSICGEN_DURATION,
+               temperature=Config.TEMPERATURE, seed=None, preview=False, continue_from=None, history=None,
+               priority=None):
+        """
+        Queue a generation job and return its id.
+
+        preview=True runs MusicGenerator.generate_preview and keeps the audio
+        codes; continue_from=<preview job id> extends that preview to
+        `duration` seconds instead of starting over. `history` (input_text,
+        mood_analysis, music_params) makes the worker save the result to
+        the user's history when it finishes.
+
+        `priority` is a JOB_PRIORITIES class: "preview" (the default for
+        previews), "interactive" (the default otherwise) or "bulk" for
+        offline batches, which only run when no one is waiting.
+
+        Admission control, checked atomically with the insert:
+        - a queued or running job with the same user, prompt and params
+          is reused (its id is returned), e.g. after a double click or
+          from a second tab;
+        - otherwise AdmissionRejected is raised when the queue holds
+          Config.MAX_QUEUE_DEPTH jobs, the user already has
+          Config.MAX_JOBS_PER_USER jobs in flight, or the user's token
+          bucket (Config.USER_RATE_LIMIT_PER_HOUR) is empty.
+        """
+        params = {"duration": duration, "temperature": temperature, "seed": seed}
+        if preview:
+            params["preview"] = True
+        if continue_from is not None:
+            params["continue_from"] = continue_from
+        if history is not None:
+            params["history"] = history
+        params_json = json.dumps(params, sort_keys=True)
+        priority = priority or ("preview" if preview else "interactive")
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Unknown job priority {priority!r}; expected one of {sorted(JOB_PRIORITIES)}")
+        dedup_key = hashlib.sha1(json.dumps([user_email, prompt, params_json]).encode()).hexdigest()
+
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            row = cursor.execute(
+                "SELECT id FROM generation_jobs WHERE dedup_key = ? AND status IN ('queued', 'running') "
+                "ORDER BY id LIMIT 1",
+                (dedup_key,)
+            ).fetchone()
+            if row is not None:
+                cursor.execute("COMMIT")
+                tracing.metrics.inc("jobs_merged")
+                return row[0]
+            self._admit(cursor, user_email)
+            cursor.execute(
+                "INSERT INTO generation_jobs (user_email, prompt, params, dedup_key, priority, cost) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_email, prompt, params_json, dedup_key, JOB_PRIORITIES[priority], estimate_cost(params))
+            )
+            job_id = cursor.lastrowid
+            cursor.execute("COMMIT")
+        except AdmissionRejected as e:
+            cursor.execute("ROLLBACK")
+            tracing.metrics.inc(f"jobs_rejected_{e.reason}")
+            raise
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return job_id
+
+    def _admit(self, cursor, user_email, check_queue_depth=True):
+        """Raise AdmissionRejected unless a new job fits the queue and the user's limits"""
+        if check_queue_depth and Config.MAX_QUEUE_DEPTH:
+            depth = cursor.execute("SELECT COUNT(*) FROM generation_jobs WHERE status = 'queued'").fetchone()[0]
+            if depth >= Config.MAX_QUEUE_DEPTH:
+                raise AdmissionRejected(
+                    "queue_full", "MelodAI is busy right now. Please try again in a minute.", retry_after=60
+                )
+        if user_email is None:
+            return
+
+        if Config.MAX_JOBS_PER_USER:
+            active = cursor.execute(
+                "SELECT COUNT(*) FROM generation_jobs WHERE user_email = ? AND status IN ('queued', 'running')",
+                (user_email,)
+            ).fetchone()[0]
+            if active >= Config.MAX_JOBS_PER_USER:
+                raise AdmissionRejected(
+                    "user_concurrency",
+                    f"You already have {active} generation(s) in progress. Wait for one to finish or cancel it."
+                )
+
+        if Config.USER_RATE_LIMIT_PER_HOUR:
+            rate = Config.USER_RATE_LIMIT_PER_HOUR / 3600.0
+            capacity = float(Config.USER_RATE_LIMIT_BURST)
+            now = time.time()
+            row = cursor.execute(
+                "SELECT tokens, updated FROM generation_rate_limits WHERE user_email = ?", (user_email,)
+            ).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            if tokens < 1.0:
+                wait = (1.0 - tokens) / rate
+                raise AdmissionRejected(
+                    "rate_limited", f"You're generating faster than the limit. Try again in {wait:.0f} seconds.",
+                    retry_after=wait
+                )
+            cursor.execute(
+                "INSERT OR REPLACE INTO generation_rate_limits (user_email, tokens, updated) VALUES (?, ?, ?)",
+                (user_email, tokens - 1.0, now)
+            )
+
+    def start_job(self, prompt, user_email, params, worker_pid=None, cursor=None):
+        """
+        Record a job that is handled outside the queue (e.g. served from the
+        audio pool) as already 'running', so it can be completed and polled
+        like any other job. Returns its id.
+
+        The user's concurrency cap and token bucket apply as in submit()
+        (AdmissionRejected); the queue depth does not, as nothing is queued.
+        Pass `cursor` to run inside the caller's transaction.
+        """
+        if cursor is None:
+            conn = self._connect()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                job_id = self.start_job(prompt, user_email, params, worker_pid, cursor)
+                cursor.execute("COMMIT")
+            except (AdmissionRejected, sqlite3.Error):
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+            return job_id
+
+        try:
+            self._admit(cursor, user_email, check_queue_depth=False)
+        except AdmissionRejected as e:
+            tracing.metrics.inc(f"jobs_rejected_{e.reason}")
+            raise
+        cursor.execute(
+            "INSERT INTO generation_jobs (user_email, prompt, params, status, worker_pid, started_at) "
+            "VALUES (?, ?, ?, 'running', ?, CURRENT_TIMESTAMP)",
+            (user_email, prompt, json.dumps(params, sort_keys=True), worker_pid or os.getpid())
+        )
+        return cursor.lastrowid
+
+    def get_job(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        return job
+
+    def active_job(self, user_email):
+        """The user's most recent queued or running job, or None (used to resume after a reconnect)"""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT id FROM generation_jobs WHERE user_email = ? AND status IN ('queued', 'running') "
+            "ORDER BY id DESC LIMIT 1",
+            (user_email,)
+        ).fetchone()
+        conn.close()
+        return self.get_job(row[0]) if row else None
+
+    def cancel(self, job_id):
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs are
+        flagged and stopped by their worker at the next decoding step.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE generation_jobs
+        SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'queued'
+        ''', (job_id,))
+        cancelled = cursor.rowcount > 0
+        if not cancelled:
+            cursor.execute(
+                "UPDATE generation_jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                (job_id,)
+            )
+            cancelled = cursor.rowcount > 0
+        conn.close()
+        return cancelled
+
+    def is_cancel_requested(self, job_id):
+        conn = self._connect()
+        row = conn.execute("SELECT cancel_requested FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        return bool(row and row[0])
+
+    def update_progress(self, job_id, progress):
+        """Store the latest decoding progress report of a running job"""
+        conn = self._connect()
+        conn.execute("UPDATE generation_jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+        conn.close()
+
+    def claim_next(self, worker_pid):
+        """
+        Atomically move the next queued job to 'running'. Returns the job or None.
+
+        Jobs run by priority class, then cheapest estimated cost first, then
+        submission order. Every full Config.SCHEDULER_AGING_SECONDS a job
+        has waited moves it up one whole class (never above "preview"), so
+        bulk jobs cannot starve and cost still decides within a class.
+        """
+        aging = Config.SCHEDULER_AGING_SECONDS
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            row = cursor.execute(
+                "SELECT id FROM generation_jobs WHERE status = 'queued' "
+                "ORDER BY MAX(0, priority - CAST((julianday('now') - julianday(created_at)) * 86400.0 / ? AS INTEGER)), "
+                "cost, id LIMIT 1",
+                (aging or float("inf"),)
+            ).fetchone()
+            if row is None:
+                cursor.execute("COMMIT")
+                return None
+            cursor.execute('''
+            UPDATE generation_jobs
+            SET status = 'running', worker_pid = ?, started_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            ''', (worker_pid, row[0]))
+            cursor.execute("COMMIT")
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get_job(row[0])
+
+    def _finish(self, job_id, status, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        conn.execute(
+            f"UPDATE generation_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP"
+            f"{', ' + columns if columns else ''} WHERE id = ?",
+            (status, *fields.values(), job_id)
+        )
+        conn.close()
+
+    def complete(self, job_id, wav_path, mp3_path, generation_time):
+        self._finish(job_id, "done", wav_path=wav_path, mp3_path=mp3_path, generation_time=generation_time)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, "failed", error=error)
+
+    def mark_cancelled(self, job_id):
+        self._finish(job_id, "cancelled")
+
+    def recover_orphaned_jobs(self):
+        """Re-queue 'running' jobs whose worker process no longer exists"""
+        conn = self._connect()
+        rows = conn.execute("SELECT id, worker_pid FROM generation_jobs WHERE status = 'running'").fetchall()
+        requeued = 0
+        for job_id, pid in rows:
+            if pid and _pid_alive(pid):
+                continue
+            conn.execute(
+                "UPDATE generation_jobs SET status = 'queued', worker_pid = NULL, started_at = NULL WHERE id = ?",
+                (job_id,)
+            )
+            requeued += 1
+        conn.close()
+        return requeued
+
+    def queue_depth(self):
+        conn = self._connect()
+        depth = conn.execute("SELECT COUNT(*) FROM generation_jobs WHERE status = 'queued'").fetchone()[0]
+        conn.close()
+        return depth
+
+    def queue_stats(self, since_seconds=3600):
+        """
+        Per priority class: jobs queued now and the queue wait (created ->
+        started) of jobs started in the last `since_seconds`.
+        """
+        conn = self._connect()
+        queued = dict(conn.execute(
+            "SELECT priority, COUNT(*) FROM generation_jobs WHERE status = 'queued' GROUP BY priority"
+        ).fetchall())
+        rows = conn.execute(
+            "SELECT priority, (julianday(started_at) - julianday(created_at)) * 86400.0 FROM generation_jobs "
+            "WHERE started_at IS NOT NULL AND started_at >= datetime('now', ?)",
+            (f"-{int(since_seconds)} seconds",)
+        ).fetchall()
+        conn.close()
+
+        stats = {}
+        for name, level in JOB_PRIORITIES.items():
+            waits = sorted(max(0.0, wait) for priority, wait in rows if priority == level)
+            stats[name] = {
+                "queued": queued.get(level, 0),
+                "started": len(waits),
+                "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else 0.0,
+            }
+        return stats
+
+    def export_metrics(self):
+        """Publish queue depth and wait per priority class as gauges (a tracing.metrics collector)"""
+        for name, stats in self.queue_stats().items():
+            tracing.metrics.set_gauge(f"queue_depth_{name}", stats["queued"])
+            tracing.metrics.set_gauge(f"queue_wait_seconds_mean_{name}", stats["mean_wait"])
+            tracing.metrics.set_gauge(f"queue_wait_seconds_p95_{name}", stats["p95_wait"])
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) terminates the process on Windows; assume it is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def resolve_worker_count(value=Config.GENERATION_WORKERS):
+    """Worker count from a number or 'auto' (one worker per Config.WORKER_THREADS cores)"""
+    if value in (None, "auto"):
+        return max(1, (os.cpu_count() or 1) // Config.WORKER_THREADS)
+    return int(value)
+
+
+def job_output_path(job_id):
+    return os.path.join(scratch_space.job_dir(job_id), f"{Config.OUTPUT_FILENAME}.wav")
+
+
+def job_codes_path(job_id):
+    """Audio codes of a preview job, reused by its continuation"""
+    return os.path.join(scratch_space.job_dir(job_id), "codes.npy")
+
+
+def run_job(queue, generator, job):
+    """Generate and save audio for one claimed job"""
+    from music_generator import GenerationCancelled
+
+    job_id = job["id"]
+    params = job["params"]
+    last_check = [0.0]
+
+    def stop_check():
+        # Throttle the cancel lookup; decoding calls this on every token
+        now = time.time()
+        if now - last_check[0] < Config.JOB_CANCEL_CHECK_INTERVAL:
+            return False
+        last_check[0] = now
+        return queue.is_cancel_requested(job_id)
+
+    start_time = time.time()
+    try:
+        with tracing.trace("generation_job", job_id=job_id, user=job["user_email"],
+                           duration=params.get("duration"), priority=job_priority_name(job)):
+            queue_wait = _queue_wait(job)
+            if queue_wait is not None:
+                tracing.record("queue_wait", queue_wait)
+            generate_kwargs = dict(
+                duration=params.get("duration", Config.MUSICGEN_DURATION),
+                temperature=params.get("temperature", Config.TEMPERATURE),
+                seed=params.get("seed"),
+                stop_check=stop_check,
+                progress_callback=lambda progress: queue.update_progress(job_id, progress)
+            )
+            if params.get("preview"):
+                audio, codes = generator.generate_preview(job["prompt"], **generate_kwargs)
+                scratch_space.allocate(job_id)
+                np.save(job_codes_path(job_id), codes)
+            else:
+                if params.get("continue_from") is not None:
+                    generate_kwargs["prefix_codes"] = np.load(job_codes_path(params["continue_from"]))
+                audio = generator.generate_music(job["prompt"], **generate_kwargs)
+            sample_rate = Config.PREVIEW_SAMPLE_RATE if params.get("preview") else None
+            wav_path, mp3_path = generator.save_audio(audio, job_output_path(job_id), sample_rate=sample_rate)
+    except GenerationCancelled:
+        queue.mark_cancelled(job_id)
+        scratch_space.release(job_id)
+        print(f"🛑 Job {job_id} cancelled")
+        return
+    except Exception as e:
+        queue.fail(job_id, str(e))
+        scratch_space.release(job_id)
+        print(f"❌ Job {job_id} failed: {e}")
+        return
+
+    generation_time = time.time() - start_time
+    if params.get("history") and job["user_email"]:
+        save_to_history(job, wav_path, generation_time)
+    queue.complete(job_id, wav_path, mp3_path, generation_time)
+    print(f"✅ Job {job_id} done in {generation_time:.1f}s")
+
+
+def job_priority_name(job):
+    return next((name for name, level in JOB_PRIORITIES.items() if level == job.get("priority")), None)
+
+
+def _queue_wait(job):
+    """Seconds a claimed job spent queued (SQLite CURRENT_TIMESTAMP is UTC, second resolution)"""
+    if not job.get("created_at") or not job.get("started_at"):
+        return None
+    created = time.strptime(job["created_at"], "%Y-%m-%d %H:%M:%S")
+    started = time.strptime(job["started_at"], "%Y-%m-%d %H:%M:%S")
+    return max(0.0, float(calendar.timegm(started) - calendar.timegm(created)))
+
+
+def save_to_history(job, wav_path, generation_time):
+    """Store a finished job's audio in UserHistory, encoded with Config.STORAGE_CODEC"""
+    import audio_storage
+    from auth import UserHistory
+
+    history = job["params"]["history"]
+    try:
+        audio_data, audio_codec = audio_storage.encode_file(wav_path)
+        saved = UserHistory().save_generation(
+            job["user_email"],
+            history["input_text"],
+            history["mood_analysis"],
+            history["music_params"],
+            audio_data,
+            generation_time,
+            audio_codec=audio_codec
+        )
+    except Exception as e:
+        saved = False
+        print(f"⚠️ Job {job['id']}: could not encode audio for history: {e}")
+    if not saved:
+        print(f"⚠️ Job {job['id']} finished but was not saved to history")
+
+
+def run_worker(db_path=Config.JOBS_DB_PATH, poll_interval=Config.JOB_POLL_INTERVAL, worker_index=None):
+    """Worker process main loop: load the model once, then claim jobs forever"""
+    from cpu_profile import apply_cpu_profile
+    from model_warmup import ModelWarmer
+
+    apply_cpu_profile(worker_index)
+    pid = os.getpid()
+    tracing.set_worker_name(f"worker-{worker_index if worker_index is not None else pid}")
+    if Config.METRICS_PORT:
+        # /metrics is served by the app process, which merges in what workers publish
+        tracing.start_metrics_publisher(db_path)
+    queue = JobQueue(db_path)
+    warmer = ModelWarmer(load_mood_analyzer=False, cpu_profile=False).start()
+    if not warmer.wait():
+        print(f"❌ Worker {pid} could not load the model: {warmer.error}")
+        return
+    print(f"👷 Worker {pid} ready")
+
+    while True:
+        job = queue.claim_next(pid)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, warmer.music_generator, job)
+
+
+class WorkerPool:
+    """A set of generation worker processes sharing one JobQueue"""
+
+    def __init__(self, num_workers=Config.GENERATION_WORKERS, db_path=Config.JOBS_DB_PATH):
+        self.num_workers = resolve_worker_count(num_workers)
+        self.db_path = db_path
+        self.processes = []
+
+    def start(self):
+        JobQueue(self.db_path).recover_orphaned_jobs()
+        # spawn: never fork a process that may already hold torch/OpenMP state
+        ctx = multiprocessing.get_context("spawn")
+        for i in range(self.num_workers):
+            process = ctx.Process(
+                target=run_worker, args=(self.db_path, Config.JOB_POLL_INTERVAL, i), name=f"generation-worker-{i}", daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        print(f"🚀 Started {self.num_workers} generation worker(s)")
+        return self
+
+    def alive_count(self):
+        return sum(1 for p in self.processes if p.is_alive())
+
+    def stop(self, timeout=5):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+        self.processes = []
+
+
+class InlineWorker:
+    """
+    Runs queued jobs on a daemon thread of this process, using the
+    MusicGenerator of an already started ModelWarmer. Used when
+    Config.USE_GENERATION_WORKERS is off, so the app still hands work to
+    the job queue instead of generating inside a script run.
+    """
+
+    def __init__(self, warmer, db_path=Config.JOBS_DB_PATH, poll_interval=Config.JOB_POLL_INTERVAL):
+        self.warmer = warmer
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                JobQueue(self.db_path).recover_orphaned_jobs()
+                self._thread = threading.Thread(target=self._run, name="generation-inline-worker", daemon=True)
+                self._thread.start()
+        return self
+
+    def alive_count(self):
+        return int(self._thread is not None and self._thread.is_alive())
+
+    def _run(self):
+        if self.warmer.wait():
+            generator = self.warmer.music_generator
+        else:
+            # Same fallback the composer used when preloading failed: load it here once
+            try:
+                from music_generator import MusicGenerator
+                generator = MusicGenerator()
+            except Exception as e:
+                print(f"❌ Inline worker could not load the model: {e}")
+                return
+        # Jobs are claimed under this process's pid; recover_orphaned_jobs only requeues dead pids
+        pid = os.getpid()
+        queue = JobQueue(self.db_path)
+        while True:
+            job = queue.claim_next(pid)
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+            run_job(queue, generator, job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MelodAI generation workers")
+    parser.add_argument("--workers", default=str(Config.GENERATION_WORKERS),
+                        help="Number of worker processes, or 'auto' (one per Config.WORKER_THREADS cores)")
+    parser.add_argument("--db", default=Config.JOBS_DB_PATH, help="SQLite database holding the job queue")
+    args = parser.parse_args()
+
+    pool = WorkerPool(args.workers, args.db).start()
+    try:
+        while pool.alive_count():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# media_server.py
+"""
+Local HTTP endpoint that streams history audio by entry id.
+
+    GET /audio/<id>?token=<signature>[&download=1]
+
+The history page hands st.audio a URL instead of the entry's bytes, so the
+audio no longer travels through the Streamlit websocket (or base64 in the
+page) on every rerun. The browser fetches it directly and can seek with
+Range requests; ETags (which change when the compactor re-encodes an
+entry) let it revalidate without downloading again.
+
+URLs are signed per user with a secret held by this process, so one user
+cannot fetch another user's tracks by guessing ids.
+
+The endpoint is opt-in (Config.MEDIA_PORT). Browsers on other machines
+need Config.MEDIA_HOST and Config.MEDIA_PUBLIC_URL set to an address they
+can reach; the default http://localhost URL only works on the server host.
+"""
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from config import Config
+import audio_storage
+import tracing
+
+_SECRET = (Config.MEDIA_URL_SECRET or "").encode() or os.urandom(32)
+_PATH = re.compile(r"^/audio/(\d+)$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_BYTES = 64 * 1024
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def sign(entry_id, user_email):
+    message = f"{entry_id}:{user_email}".encode()
+    return hmac.new(_SECRET, message, hashlib.sha256).hexdigest()[:32]
+
+
+def audio_url(entry_id, user_email, download=False):
+    """URL of a history entry's audio for the running server, or None when it is not serving"""
+    if _server is None:
+        return None
+    base = Config.MEDIA_PUBLIC_URL or f"http://localhost:{_server.server_address[1]}"
+    url = f"{base.rstrip('/')}/audio/{entry_id}?token={sign(entry_id, user_email)}"
+    return url + "&download=1" if download else url
+
+
+def _etag(entry_id, audio_codec, audio_size):
+    return '"' + hashlib.sha1(f"{entry_id}:{audio_codec}:{audio_size}".encode()).hexdigest()[:20] + '"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive byte range from a single-range Range header.
+    Returns None for no/unsupported ranges (serve everything) and
+    "unsatisfiable" when the range lies outside the content.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return "unsatisfiable"
+    return start, end
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    db_path = "users.db"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        url = urlsplit(self.path)
+        match = _PATH.match(url.path)
+        if match is None:
+            self.send_error(404)
+            return
+        entry_id = int(match.group(1))
+        query = parse_qs(url.query)
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            row = conn.execute(
+                "SELECT user_email, audio_codec, audio_size, timestamp FROM user_history WHERE id = ?", (entry_id,)
+            ).fetchone()
+            token = query.get("token", [""])[0]
+            if row is None or not row[2] or not hmac.compare_digest(token, sign(entry_id, row[0])):
+                self.send_error(404)
+                return
+            user_email, audio_codec, size, timestamp = row
+
+            head = None if audio_codec else conn.execute(
+                "SELECT substr(audio_data, 1, 36) FROM user_history WHERE id = ?", (entry_id,)
+            ).fetchone()[0]
+            etag = _etag(entry_id, audio_codec, size)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            byte_range = parse_range(self.headers.get("Range"), size)
+            if_range = self.headers.get("If-Range")
+            if if_range and if_range != etag:
+                byte_range = None  # the client's partial copy is stale: send the whole entry
+            if byte_range == "unsatisfiable":
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            start, end = byte_range or (0, size - 1)
+
+            self.send_response(206 if byte_range else 200)
+            self.send_header("Content-Type", audio_storage.mime_type(audio_codec, head))
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"private, max-age={Config.MEDIA_CACHE_SECONDS}")
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            if query.get("download"):
+                extension = audio_storage.file_extension(audio_codec, head)
+                name = f"melodai_{str(timestamp).replace(':', '-').replace(' ', '_')}.{extension}"
+                self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+            self.end_headers()
+            if send_body:
+                with tracing.span("media_serve"):
+                    self._send_bytes(conn, entry_id, start, end)
+                tracing.metrics.inc("media_bytes_served", end - start + 1)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the player closed the connection (e.g. after seeking)
+        finally:
+            conn.close()
+
+    def _send_bytes(self, conn, entry_id, start, end):
+        """Write audio_data[start:end + 1] without loading the whole BLOB when SQLite allows"""
+        if hasattr(conn, "blobopen"):  # Python 3.11+: incremental BLOB I/O
+            with conn.blobopen("user_history", "audio_data", entry_id, readonly=True) as blob:
+                blob.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = blob.read(min(CHUNK_BYTES, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+            return
+        data = conn.execute("SELECT substr(audio_data, ?, ?) FROM user_history WHERE id = ?",
+                            (start + 1, end - start + 1, entry_id)).fetchone()[0]
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_media_server(port=None, host=None, db_path="users.db"):
+    """Serve /audio/<id> on a daemon thread. Returns the server, or None if the port is taken."""
+    global _server
+    port = Config.MEDIA_PORT if port is None else port
+    host = host or Config.MEDIA_HOST
+    handler = type("MediaHandler", (_MediaHandler,), {"db_path": db_path})
+    with _server_lock:
+        if _server is not None:
+            return _server
+        try:
+            server = ThreadingHTTPServer((host, port), handler)
+        except OSError as e:
+            print(f"⚠️ Media endpoint not started on port {port}: {e}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="media-server", daemon=True).start()
+        _server = server
+    print(f"🎧 Serving history audio at http://{host}:{server.server_address[1]}/audio/")
+    return server
@@ -0,0 +1,183 @@
+# model_store.py
+"""
+Local model store for the Hugging Face checkpoints used by MelodAI.
+
+Snapshots live under Config.MODEL_CACHE_DIR and are pinned to exact commit
+hashes in Config.MODEL_LOCK_FILE, so every worker process loads the same
+weights without touching the network. Safetensors checkpoints are preferred:
+they are memory-mapped, so several workers share one page-cached copy.
+
+Usage:
+    python model_store.py fetch     # download and pin every configured model
+    python model_store.py report    # load each model and report time / peak RSS
+"""
+import json
+import os
+import resource
+import sys
+import time
+from config import Config
+
+# Framework weights we never load (we only run PyTorch)
+IGNORE_PATTERNS = ["*.msgpack", "*.h5", "*.ot", "*.onnx", "*.tflite", "flax_model*", "tf_model*"]
+
+# Stats for every from_pretrained() call made through this module
+LOAD_STATS = []
+
+
+def configured_models():
+    """Model ids the app needs, in load order."""
+    models = [Config.SENTIMENT_MODEL, Config.MUSICGEN_MODEL]
+    if Config.USE_EMBEDDING_CLASSIFIER:
+        from mood_embeddings import embedding_model_name
+        models.insert(1, embedding_model_name())
+    return models
+
+
+def _read_lock():
+    if not os.path.exists(Config.MODEL_LOCK_FILE):
+        return {}
+    with open(Config.MODEL_LOCK_FILE) as f:
+        return json.load(f)
+
+
+def _write_lock(lock):
+    os.makedirs(os.path.dirname(Config.MODEL_LOCK_FILE) or ".", exist_ok=True)
+    with open(Config.MODEL_LOCK_FILE, "w") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+
+
+def resolve_revision(model_name):
+    """Pinned commit hash from the lock file, else the configured revision."""
+    return _read_lock().get(model_name) or Config.MODEL_REVISIONS.get(model_name, "main")
+
+
+def _ignore_patterns(model_name, revision):
+    """Skip .bin weights when the repo also ships safetensors."""
+    from huggingface_hub import HfApi
+    files = HfApi().list_repo_files(model_name, revision=revision)
+    if Config.MODEL_PREFER_SAFETENSORS and any(f.endswith(".safetensors") for f in files):
+        return IGNORE_PATTERNS + ["*.bin"]
+    return IGNORE_PATTERNS
+
+
+def fetch_model(model_name):
+    """Download a snapshot into the store and pin its commit hash."""
+    from huggingface_hub import snapshot_download
+    revision = resolve_revision(model_name)
+    path = snapshot_download(
+        model_name,
+        revision=revision,
+        cache_dir=Config.MODEL_CACHE_DIR,
+        ignore_patterns=_ignore_patterns(model_name, revision),
+    )
+    lock = _read_lock()
+    lock[model_name] = os.path.basename(path)  # snapshots/<commit hash>
+    _write_lock(lock)
+    return path
+
+
+def model_path(model_name):
+    """
+    Local snapshot directory for `model_name`.
+
+    Falls back to downloading (and pinning) when the snapshot is missing,
+    unless Config.MODEL_OFFLINE is set.
+    """
+    from huggingface_hub import snapshot_download
+    try:
+        return snapshot_download(
+            model_name,
+            revision=resolve_revision(model_name),
+            cache_dir=Config.MODEL_CACHE_DIR,
+            local_files_only=True,
+        )
+    except Exception:
+        if Config.MODEL_OFFLINE:
+            raise RuntimeError(
+                f"{model_name} is not in the local model store ({Config.MODEL_CACHE_DIR}). "
+                "Run `python model_store.py fetch` first."
+            )
+        print(f"⬇️ Downloading {model_name} into {Config.MODEL_CACHE_DIR}...")
+        return fetch_model(model_name)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux), or None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def from_pretrained(loader_cls, model_name, **kwargs):
+    """
+    Load `loader_cls` (a transformers Auto*/model class) from the local store.
+
+    Model classes get safetensors + low_cpu_mem_usage so weights are mmap'd
+    instead of copied; tokenizers/processors ignore those options.
+    """
+    path = model_path(model_name)
+    is_model = hasattr(loader_cls, "config_class") or hasattr(loader_cls, "_model_mapping")
+    if is_model:
+        kwargs.setdefault("low_cpu_mem_usage", True)
+
+    start = time.time()
+    if is_model and Config.MODEL_PREFER_SAFETENSORS:
+        try:
+            obj = loader_cls.from_pretrained(path, use_safetensors=True, **kwargs)
+        except OSError:
+            # No safetensors in this snapshot, fall back to .bin weights
+            obj = loader_cls.from_pretrained(path, **kwargs)
+    else:
+        obj = loader_cls.from_pretrained(path, **kwargs)
+
+    stats = {
+        "model": model_name,
+        "loader": loader_cls.__name__,
+        "revision": os.path.basename(path),
+        "load_time": round(time.time() - start, 3),
+        "rss_mb": round(current_rss_mb() or 0, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    LOAD_STATS.append(stats)
+    print(f"📦 Loaded {loader_cls.__name__}({model_name}@{stats['revision'][:8]}) "
+          f"in {stats['load_time']:.2f}s, peak RSS {stats['peak_rss_mb']:.0f} MB")
+    return obj
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "report"
+
+    if command == "fetch":
+        for name in configured_models():
+            path = fetch_model(name)
+            print(f"✅ {name} pinned at {os.path.basename(path)}")
+        return 0
+
+    if command == "report":
+        from mood_analyzer import MoodAnalyzer
+        from music_generator import MusicGenerator
+        MoodAnalyzer()
+        MusicGenerator()
+        print(json.dumps(LOAD_STATS, indent=2))
+        return 0
+
+    print(__doc__)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
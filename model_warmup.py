@@ -0,0 +1,115 @@
+# model_warmup.py
+import threading
+import time
+from config import Config
+
+
+class ModelWarmer:
+    """
+    Loads MoodAnalyzer and MusicGenerator once per process in a background
+    thread and runs a short warm-up pass, so the first user request does not
+    pay for weight page-in, tokenizer init and first-call kernel selection.
+
+    The heavy modules are imported inside the worker thread to keep
+    `import model_warmup` cheap. That includes torch, so the default CPU
+    profile is applied there too (pass cpu_profile=False when the process
+    has already applied its own, like generation workers).
+    """
+
+    def __init__(self, warmup=True, load_mood_analyzer=True, load_music_generator=True, cpu_profile=True):
+        self.warmup = warmup
+        self.load_mood_analyzer = load_mood_analyzer
+        self.load_music_generator = load_music_generator
+        self.cpu_profile = cpu_profile
+        self.mood_analyzer = None
+        self.music_generator = None
+        self.status = "idle"   # idle -> loading -> warming -> ready | failed
+        self.message = "Waiting to start"
+        self.error = None
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = threading.Event()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    @property
+    def failed(self):
+        return self.status == "failed"
+
+    def start(self):
+        """Start loading in a daemon thread (no-op if already started)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Block until loading finishes. Returns True when the models are ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def _set_status(self, status, message):
+        self.status = status
+        self.message = message
+        print(f"🔥 Warm-up: {message}")
+
+    def _timed(self, name, fn, *args, **kwargs):
+        start = time.time()
+        result = fn(*args, **kwargs)
+        self.timings[name] = round(time.time() - start, 3)
+        return result
+
+    def _run(self):
+        try:
+            if self.cpu_profile:
+                from cpu_profile import apply_cpu_profile
+                self._timed("apply_cpu_profile", apply_cpu_profile)
+
+            if self.load_mood_analyzer:
+                self._set_status("loading", "Loading mood analysis model...")
+                from mood_analyzer import MoodAnalyzer
+                self.mood_analyzer = self._timed("load_mood_analyzer", MoodAnalyzer)
+
+            if self.load_music_generator:
+                self._set_status("loading", "Loading music generation model...")
+                from music_generator import MusicGenerator
+                self.music_generator = self._timed("load_music_generator", MusicGenerator)
+
+            if self.warmup:
+                self._set_status("warming", "Running warm-up pass...")
+                if self.mood_analyzer:
+                    self._timed("warmup_analyze_mood", self.mood_analyzer.analyze_mood, Config.WARMUP_TEXT)
+                if self.music_generator:
+                    self._timed(
+                        "warmup_generate_music",
+                        self.music_generator.generate_music,
+                        Config.WARMUP_PROMPT,
+                        duration=Config.WARMUP_DURATION,
+                        seed=0
+                    )
+
+            self._set_status("ready", "Models ready")
+        except Exception as e:
+            self.error = str(e)
+            self._set_status("failed", f"Model preload failed: {e}")
+        finally:
+            self._done.set()
+
+    def report(self):
+        """Readiness report suitable for logging or a health check."""
+        return {
+            "status": self.status,
+            "message": self.message,
+            "error": self.error,
+            "timings": dict(self.timings),
+        }
+
+
+if __name__ == "__main__":
+    warmer = ModelWarmer().start()
+    warmer.wait()
+    print(warmer.report())
@@ -4,13 +4,15 @@ from scipy.special import softmax
 import re
 from collections import defaultdict
 from config import Config
+import model_store
+import tracing
 
 class MoodAnalyzer:
     def __init__(self):
         # Sentiment analysis model
         self.sentiment_model_name = Config.SENTIMENT_MODEL
-        self.sentiment_tokenizer = AutoTokenizer.from_pretrained(self.sentiment_model_name)
-        self.sentiment_model = AutoModelForSequenceClassification.from_pretrained(self.sentiment_model_name)
+        self.sentiment_tokenizer = model_store.from_pretrained(AutoTokenizer, self.sentiment_model_name)
+        self.sentiment_model = model_store.from_pretrained(AutoModelForSequenceClassification, self.sentiment_model_name)
         
         # Enhanced mood keywords with energy profiles
         self.mood_keywords = {
@@ -56,12 +58,20 @@ class MoodAnalyzer:
             'romantic': 0.5, 'loving': 0.4, 'passionate': 0.7, 'intimate': 0.3
         }
         
+        # Cheaper first tier for mood and sentiment (see mood_embeddings.py)
+        self.embedding_classifier = None
+        if Config.USE_EMBEDDING_CLASSIFIER:
+            from mood_embeddings import EmbeddingMoodClassifier
+            self.embedding_classifier = EmbeddingMoodClassifier()
+
         print("✅ Mood Analyzer loaded successfully!")
 
     def analyze_sentiment(self, text):
         try:
-            encoded_text = self.sentiment_tokenizer(text, return_tensors='pt', truncation=True, max_length=512)
-            output = self.sentiment_model(**encoded_text)
+            with tracing.span("sentiment_tokenize"):
+                encoded_text = self.sentiment_tokenizer(text, return_tensors='pt', truncation=True, max_length=512)
+            with tracing.span("sentiment_model"), torch.no_grad():
+                output = self.sentiment_model(**encoded_text)
             scores = output.logits[0].detach().numpy()
             scores = softmax(scores)
             
@@ -75,7 +85,8 @@ class MoodAnalyzer:
             print(f"Sentiment analysis error: {e}")
             return "neutral", 0.5
 
-    def detect_mood(self, text):
+    def detect_mood(self, text, sentiment=None, embedding=None):
+        """Keyword match first, then a confident embedding result, then the sentiment (reused when given)"""
         text_lower = text.lower()
         mood_scores = defaultdict(float)
         
@@ -87,7 +98,10 @@ class MoodAnalyzer:
                     mood_scores[mood] += len(matches) * 1.5
         
         if not mood_scores:
-            sentiment, _ = self.analyze_sentiment(text)
+            if embedding and embedding['mood_confidence'] >= Config.EMBEDDING_MIN_CONFIDENCE:
+                return embedding['mood'], embedding['mood_confidence']
+            if sentiment is None:
+                sentiment, _ = self.analyze_sentiment(text)
             if sentiment == 'positive':
                 return 'happy', 0.6
             elif sentiment == 'negative':
@@ -156,9 +170,15 @@ class MoodAnalyzer:
             }
         
         try:
-            sentiment, sentiment_confidence = self.analyze_sentiment(text)
-            mood, mood_confidence = self.detect_mood(text)
-            energy_level = self.calculate_energy(text, sentiment, sentiment_confidence, mood)
+            embedding = self.embedding_classifier.classify(text) if self.embedding_classifier else None
+            if embedding and embedding['sentiment_confidence'] >= Config.EMBEDDING_MIN_CONFIDENCE:
+                sentiment, sentiment_confidence = embedding['sentiment'], embedding['sentiment_confidence']
+            else:
+                sentiment, sentiment_confidence = self.analyze_sentiment(text)
+            with tracing.span("detect_mood"):
+                mood, mood_confidence = self.detect_mood(text, sentiment, embedding)
+            with tracing.span("calculate_energy"):
+                energy_level = self.calculate_energy(text, sentiment, sentiment_confidence, mood)
             
             print(f"📝 Input: {text}")
             print(f"🎭 Sentiment: {sentiment} (confidence: {sentiment_confidence:.2f})")
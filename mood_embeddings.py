@@ -0,0 +1,161 @@
+# mood_embeddings.py
+"""
+Embedding-based mood classification with Config.EMBEDDING_MODEL.
+
+Each mood in Config.MOOD_CATEGORIES (and each sentiment) is described by a
+few prototype sentences. Their embeddings are averaged into one unit
+vector per label, computed once per model revision and cached as .npy
+under Config.MODEL_CACHE_DIR. Classifying a text is then one pass of the
+small MiniLM encoder plus a (labels x dim) matrix product of cosine
+similarities, several times cheaper than the RoBERTa sentiment model.
+
+MoodAnalyzer uses it as a first tier (Config.USE_EMBEDDING_CLASSIFIER):
+its answer is taken when the softmax confidence reaches
+Config.EMBEDDING_MIN_CONFIDENCE, otherwise the sentiment model decides.
+
+The checkpoint is loaded through model_store with transformers, using the
+model's own sentence-transformers pooling (attention-masked mean,
+L2-normalized), so it is pinned and served offline like the other models.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+from config import Config
+import model_store
+import tracing
+
+MOOD_PROTOTYPES = {
+    "happy": [
+        "I feel happy and cheerful today",
+        "Everything is going great and I can't stop smiling",
+        "What a wonderful, joyful day with my friends",
+        "I'm so glad, this made my whole week",
+    ],
+    "sad": [
+        "I feel sad and lonely",
+        "I miss them so much and it hurts",
+        "Nothing seems to go right and I just want to cry",
+        "I'm heartbroken and empty inside",
+    ],
+    "calm": [
+        "I want to relax and unwind quietly",
+        "A slow, peaceful evening with nothing to do",
+        "Soft rain outside while I read in silence",
+        "Music for studying, meditation and focus",
+    ],
+    "energetic": [
+        "Let's go, I'm pumped for the workout",
+        "I'm full of energy and ready to dance all night",
+        "Running fast with my heart racing",
+        "An intense, powerful party that never stops",
+    ],
+    "mysterious": [
+        "Something strange is hiding in the dark",
+        "A puzzling secret that nobody can explain",
+        "Walking alone through a foggy forest at midnight",
+        "I wonder what lies behind the locked door",
+    ],
+    "romantic": [
+        "I'm in love with you",
+        "A candlelit dinner with my sweetheart",
+        "Holding hands under the stars with the one I adore",
+        "You mean the world to me, my darling",
+    ],
+}
+
+SENTIMENT_PROTOTYPES = {
+    "positive": [
+        "This is great, I love it",
+        "I feel wonderful and grateful",
+        "What an amazing experience",
+    ],
+    "negative": [
+        "This is terrible, I hate it",
+        "I feel awful and disappointed",
+        "Everything went wrong today",
+    ],
+    "neutral": [
+        "Just another ordinary day",
+        "I went to the store and came back",
+        "The meeting is at three o'clock",
+    ],
+}
+
+
+def embedding_model_name(name=None):
+    """Hub id of the embedding model; bare sentence-transformers names get their organization"""
+    name = name or Config.EMBEDDING_MODEL
+    return name if "/" in name else f"sentence-transformers/{name}"
+
+
+def _softmax(scores, temperature):
+    scaled = scores / temperature
+    scaled -= scaled.max(axis=1, keepdims=True)
+    weights = np.exp(scaled)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+class EmbeddingMoodClassifier:
+    def __init__(self, model_name=None):
+        self.model_name = embedding_model_name(model_name)
+        self.revision = os.path.basename(model_store.model_path(self.model_name))
+        self.tokenizer = model_store.from_pretrained(AutoTokenizer, self.model_name)
+        self.model = model_store.from_pretrained(AutoModel, self.model_name).eval()
+
+        self.moods, self.mood_matrix = self._prototype_matrix(
+            {mood: MOOD_PROTOTYPES[mood] for mood in Config.MOOD_CATEGORIES}
+        )
+        self.sentiments, self.sentiment_matrix = self._prototype_matrix(SENTIMENT_PROTOTYPES)
+        print("✅ Embedding mood classifier loaded successfully!")
+
+    def embed(self, texts):
+        """Unit-length sentence embeddings, shape (len(texts), dim)"""
+        encoded = self.tokenizer(list(texts), padding=True, truncation=True,
+                                 max_length=Config.MAX_LENGTH, return_tensors="pt")
+        with torch.no_grad():
+            hidden = self.model(**encoded).last_hidden_state
+        mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, dim=1).numpy()
+
+    def _prototype_matrix(self, prototypes):
+        """(labels, matrix) of unit centroid embeddings, cached per model revision and prototype set"""
+        labels = list(prototypes)
+        digest = hashlib.sha1(json.dumps(prototypes, sort_keys=True).encode()).hexdigest()[:12]
+        cache_path = os.path.join(
+            Config.MODEL_CACHE_DIR, "mood_prototypes",
+            f"{self.model_name.replace('/', '--')}-{self.revision[:12]}-{digest}.npy"
+        )
+        if os.path.exists(cache_path):
+            return labels, np.load(cache_path)
+
+        centroids = np.stack([self.embed(prototypes[label]).mean(axis=0) for label in labels])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + f".{os.getpid()}.tmp.npy"
+        np.save(tmp_path, centroids)
+        os.replace(tmp_path, cache_path)
+        return labels, centroids
+
+    def classify_batch(self, texts):
+        """Mood and sentiment with softmax confidences for each text"""
+        with tracing.span("embedding_classify"):
+            embeddings = self.embed(texts)
+            mood_probs = _softmax(embeddings @ self.mood_matrix.T, Config.EMBEDDING_TEMPERATURE)
+            sentiment_probs = _softmax(embeddings @ self.sentiment_matrix.T, Config.EMBEDDING_TEMPERATURE)
+        results = []
+        for mood_row, sentiment_row in zip(mood_probs, sentiment_probs):
+            mood_idx, sentiment_idx = int(mood_row.argmax()), int(sentiment_row.argmax())
+            results.append({
+                "mood": self.moods[mood_idx],
+                "mood_confidence": float(mood_row[mood_idx]),
+                "sentiment": self.sentiments[sentiment_idx],
+                "sentiment_confidence": float(sentiment_row[sentiment_idx]),
+            })
+        return results
+
+    def classify(self, text):
+        return self.classify_batch([text])[0]
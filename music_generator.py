@@ -1,10 +1,17 @@
 # music_generator.py
 import os
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
 import torch
 import soundfile as sf
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
+from transformers import AutoProcessor, MusicgenForConditionalGeneration, StoppingCriteria, StoppingCriteriaList
+from transformers.modeling_outputs import BaseModelOutput
 from config import Config
+import audio_postprocess
+import model_store
+import tracing
 
 try:
     from pydub import AudioSegment
@@ -13,6 +20,132 @@ except ImportError:
     PydubAvailable = False
 
 
+class GenerationCancelled(Exception):
+    """Raised by generate_music when stop_check() aborted decoding."""
+
+
+class _StopCheckCriteria(StoppingCriteria):
+    """Stops decoding as soon as stop_check() returns True (e.g. a cancelled job)."""
+
+    def __init__(self, stop_check):
+        self.stop_check = stop_check
+        self.stopped = False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.stopped = self.stopped or bool(self.stop_check())
+        return torch.full((input_ids.shape[0],), self.stopped, dtype=torch.bool, device=input_ids.device)
+
+
+class _ProgressCriteria(StoppingCriteria):
+    """Counts decoding steps and reports progress; never stops generation."""
+
+    def __init__(self, total_tokens, callback=None, interval=Config.PROGRESS_UPDATE_INTERVAL):
+        self.total_tokens = total_tokens
+        self.callback = callback
+        self.interval = interval
+        self.tokens = 0
+        self.start = None
+        self.last_step = None
+        self.last_ids = None
+        self._last_report = 0.0
+
+    def report(self):
+        """Tokens decoded so far, live tokens/sec and estimated seconds remaining"""
+        elapsed = self.last_step - self.start if self.start else 0.0
+        # The clock starts at the first step, so it excludes prompt encoding
+        rate = (self.tokens - 1) / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total_tokens - self.tokens) / rate if rate else None
+        return {
+            "tokens": self.tokens,
+            "total_tokens": self.total_tokens,
+            "elapsed": round(elapsed, 3),
+            "tokens_per_second": round(rate, 2),
+            "eta_seconds": round(remaining, 1) if remaining is not None else None,
+        }
+
+    def __call__(self, input_ids, scores, **kwargs):
+        now = time.time()
+        if self.start is None:
+            self.start = now
+        self.last_step = now
+        self.last_ids = input_ids
+        self.tokens = min(self.tokens + 1, self.total_tokens)
+        if self.callback is not None and (now - self._last_report >= self.interval
+                                          or self.tokens == self.total_tokens):
+            self._last_report = now
+            self.callback(self.report())
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+
+def _offset_progress(callback, tokens_before, elapsed_before, total_tokens, **extra):
+    """Wrap a progress callback so one decode reports as part of a larger job"""
+    if callback is None:
+        return None
+
+    def report(progress):
+        done = tokens_before + progress["tokens"]
+        rate = progress["tokens_per_second"]
+        callback({
+            **progress,
+            "tokens": done,
+            "total_tokens": total_tokens,
+            "elapsed": round(elapsed_before + progress["elapsed"], 3),
+            "eta_seconds": round((total_tokens - done) / rate, 1) if rate else None,
+            **extra,
+        })
+    return report
+
+
+CFG_STRATEGIES = ("off", "full", "first_n")
+
+
+class TextEncoderCache:
+    """
+    LRU cache of T5 encoder hidden states keyed by tokenized prompt.
+
+    MusicParameters builds prompts from a small vocabulary, so the same
+    prompt is encoded over and over. Memory is bounded by
+    Config.TEXT_ENCODER_CACHE_MB; the least recently used entries go first.
+    """
+
+    def __init__(self, max_mb=Config.TEXT_ENCODER_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            hidden = self._entries.get(key)
+            if hidden is None:
+                self.misses += 1
+                tracing.metrics.inc("text_encoder_cache_misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            tracing.metrics.inc("text_encoder_cache_hits")
+            return hidden
+
+    def put(self, key, hidden):
+        size = hidden.element_size() * hidden.nelement()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = hidden
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.element_size() * evicted.nelement()
+            tracing.metrics.set_gauge("text_encoder_cache_bytes", self.bytes)
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
 class MusicGenerator:
     def __init__(self, device="cpu"):
         # Force CPU
@@ -21,85 +154,425 @@ class MusicGenerator:
         self.sr = Config.MUSICGEN_SAMPLING_RATE
         self.model = None
         self.processor = None
+        self.text_cache = TextEncoderCache() if Config.TEXT_ENCODER_CACHE_MB else None
         self._load_model()
 
     def _load_model(self):
         """Load Hugging Face processor and model into memory (CPU only)."""
         if self.model is None:
-            self.processor = AutoProcessor.from_pretrained(self.model_name)
-            self.model = MusicgenForConditionalGeneration.from_pretrained(
-                self.model_name
+            self.processor = model_store.from_pretrained(AutoProcessor, self.model_name)
+            self.model = model_store.from_pretrained(
+                MusicgenForConditionalGeneration, self.model_name
             ).to(self.device)
             self.model.eval()
+            # Stage spans inside model.generate
+            tracing.trace_module(self.model.text_encoder, "text_encode")
+            tracing.trace_module(self.model.audio_encoder.decoder, "encodec_decode")
 
-    def _postprocess(self, audio_tensor):
+    def _postprocess(self, audio_tensor, normalize=True, layout=None):
         """
-        Convert model output tensor to float32 numpy array in [-1,1].
+        Convert model output tensor to a float32 numpy array, in place.
         Handles shapes (batch, channels, samples) or (channels, samples).
+        The result is mono, or (samples, channels) when `layout` (default
+        Config.OUTPUT_CHANNELS) is "native" and the model is stereo.
+        normalize=True applies loudness normalization and the true-peak
+        limiter (see audio_postprocess.finalize_).
         """
-        arr = audio_tensor.detach().cpu().numpy()
-
-        if arr.ndim == 3:  # (batch, channels, samples)
-            arr = arr[0]
-        if arr.ndim == 2:  # (channels, samples)
-            arr = np.mean(arr, axis=0)  # convert to mono
-
-        # Normalize
-        maxv = np.max(np.abs(arr)) or 1e-8
-        return (arr / maxv * 0.95).astype(np.float32)
+        arr = audio_postprocess.to_channels(audio_tensor, layout)
+        if normalize:
+            audio_postprocess.finalize_(arr, self.sr)
+        return arr
 
     def generate_music(self, prompt: str, duration: int = Config.MUSICGEN_DURATION,
-                       temperature: float = Config.TEMPERATURE, seed: int = None):
+                       temperature: float = Config.TEMPERATURE, seed: int = None,
+                       stop_check=None, progress_callback=None, prefix_codes=None, **sampling):
         """
         Generate music from a text prompt.
 
+        Durations longer than Config.LONGFORM_WINDOW_SECONDS are generated in
+        overlapping windows (see generate_long_music).
+
         Args:
             prompt: description of music
             duration: target length in seconds
             temperature: sampling temperature
             seed: RNG seed for reproducibility
+            stop_check: optional callable polled during decoding; returning
+                True aborts generation with GenerationCancelled
+            progress_callback: optional callable receiving a progress dict
+                (tokens, total_tokens, elapsed, tokens_per_second,
+                eta_seconds) every Config.PROGRESS_UPDATE_INTERVAL seconds
+            prefix_codes: audio codes from generate_preview(); the result
+                continues them (and starts with the preview) instead of
+                decoding from scratch
+            **sampling: top_k, top_p, guidance_scale, cfg_strategy and
+                cfg_steps overriding the Config defaults
 
         Returns:
             audio_arr: float32 numpy array at sampling rate self.sr
         """
+        if Config.LONGFORM_WINDOW_SECONDS and duration > Config.LONGFORM_WINDOW_SECONDS:
+            return self.generate_long_music(prompt, duration, temperature=temperature, seed=seed,
+                                            stop_check=stop_check, progress_callback=progress_callback,
+                                            prefix_codes=prefix_codes, **sampling)
+
+        if seed is not None:
+            torch.manual_seed(seed)
+            np.random.seed(seed)
+
+        with tracing.span("tokenize"):
+            inputs = self.processor(text=[prompt], return_tensors="pt").to(self.device)
+
+        max_new_tokens = self._tokens_for(duration)
+        if prefix_codes is not None:
+            inputs["decoder_input_ids"] = self._prefix_ids(prefix_codes)
+            max_new_tokens = max(1, max_new_tokens - prefix_codes.shape[-1])
+
+        audio_tensor, _, _ = self._generate(inputs, max_new_tokens, self._sampling(temperature, **sampling),
+                                            stop_check, progress_callback)
+        with tracing.span("postprocess"):
+            audio_arr = self._postprocess(audio_tensor)
+        return audio_arr
+
+    def generate_preview(self, prompt: str, duration: float = Config.PREVIEW_DURATION,
+                         temperature: float = Config.TEMPERATURE, seed: int = None,
+                         stop_check=None, progress_callback=None, **sampling):
+        """
+        Generate a short preview clip with a small token budget.
+
+        Uses Config.PREVIEW_CFG_STRATEGY unless cfg_strategy is given.
+        Returns (audio_arr, codes). Pass `codes` (an int16 array of shape
+        (num_codebooks, frames)) to generate_music(prefix_codes=...) to
+        extend the preview to full length without decoding it again.
+        """
         if seed is not None:
             torch.manual_seed(seed)
             np.random.seed(seed)
 
-        inputs = self.processor(text=[prompt], return_tensors="pt").to(self.device)
+        with tracing.span("tokenize"):
+            inputs = self.processor(text=[prompt], return_tensors="pt").to(self.device)
+
+        sampling.setdefault("cfg_strategy", Config.PREVIEW_CFG_STRATEGY)
+        audio_tensor, _, codes = self._generate(inputs, self._tokens_for(duration),
+                                                self._sampling(temperature, **sampling),
+                                                stop_check, progress_callback, return_codes=True)
+        with tracing.span("postprocess"):
+            audio_arr = self._postprocess(audio_tensor)
+        return audio_arr, codes
+
+    def generate_long_music(self, prompt: str, duration: float,
+                            window: float = Config.LONGFORM_WINDOW_SECONDS,
+                            overlap: float = Config.LONGFORM_OVERLAP_SECONDS,
+                            crossfade: float = Config.LONGFORM_CROSSFADE_SECONDS,
+                            temperature: float = Config.TEMPERATURE, seed: int = None,
+                            stop_check=None, progress_callback=None, prefix_codes=None, **sampling):
+        """
+        Generate a long track as a chain of fixed-size windows.
+
+        Each window after the first is conditioned on the last `overlap`
+        seconds of audio so far and adds `window - overlap` new seconds, so
+        attention cost and memory per window stay the same however long the
+        track is. MusicGen returns the conditioning audio re-decoded in front
+        of the continuation; windows are joined with an equal-power crossfade
+        over the last `crossfade` seconds of that shared region. With
+        `prefix_codes` the first window continues those codes. `sampling`
+        takes the same overrides as generate_music.
+
+        Returns:
+            audio_arr: float32 numpy array of `duration` seconds at self.sr
+        """
+        if not 0 < crossfade <= overlap < window:
+            raise ValueError("Long-form generation needs 0 < crossfade <= overlap < window")
 
+        if seed is not None:
+            torch.manual_seed(seed)
+            np.random.seed(seed)
+        sampling = self._sampling(temperature, **sampling)
+
+        step = window - overlap
+        window_seconds = [min(window, duration)]
+        while sum(window_seconds) - overlap * (len(window_seconds) - 1) < duration:
+            remaining = duration - (sum(window_seconds) - overlap * (len(window_seconds) - 1))
+            window_seconds.append(overlap + min(step, remaining))
+        # The codebook delay pattern drops a few frames at the end of every window
+        delay_tokens = self._delay_steps()
+        prefix_frames = prefix_codes.shape[-1] if prefix_codes is not None else 0
+        new_tokens = [max(1, self._tokens_for(window_seconds[0]) - prefix_frames) + delay_tokens] + [
+            self._tokens_for(seconds - overlap) + delay_tokens for seconds in window_seconds[1:]
+        ]
+        total_tokens = sum(self._planned_tokens(tokens, sampling) for tokens in new_tokens)
+
+        total_samples = int(round(duration * self.sr))
+        overlap_samples = int(round(overlap * self.sr))
+        fade_samples = int(round(crossfade * self.sr))
+        fade = np.linspace(0.0, np.pi / 2, fade_samples, dtype=np.float32)
+        fade_in, fade_out = np.sin(fade), np.cos(fade)
+
+        output = None  # (samples,) or (samples, channels), allocated from the first window
+        written = 0
+        tokens_done = 0
+        elapsed_done = 0.0
+
+        for index, max_new_tokens in enumerate(new_tokens):
+            with tracing.span("tokenize"):
+                if written == 0:
+                    inputs = self.processor(text=[prompt], return_tensors="pt")
+                    if prefix_codes is not None:
+                        inputs["decoder_input_ids"] = self._prefix_ids(prefix_codes)
+                else:
+                    # The feature extractor takes stereo as (channels, samples)
+                    inputs = self.processor(audio=output[written - overlap_samples:written].T,
+                                            sampling_rate=self.sr, text=[prompt], return_tensors="pt")
+                inputs = inputs.to(self.device)
+
+            window_progress = _offset_progress(progress_callback, tokens_done, elapsed_done, total_tokens,
+                                               window=index + 1, windows=len(new_tokens))
+            audio_tensor, report, _ = self._generate(inputs, max_new_tokens, sampling, stop_check, window_progress)
+            tokens_done += report["tokens"]
+            elapsed_done += report["elapsed"]
+            with tracing.span("postprocess"):
+                # Keep the model's channels so stereo windows can condition the next one
+                chunk = self._postprocess(audio_tensor, normalize=False, layout="native")
+
+                if written == 0:
+                    output = np.zeros((total_samples,) + chunk.shape[1:], dtype=np.float32)
+                    if chunk.ndim == 2:
+                        fade_in, fade_out = fade_in[:, None], fade_out[:, None]
+                    n = min(len(chunk), total_samples)
+                    output[:n] = chunk[:n]
+                    written = n
+                    continue
+
+                # chunk = re-decoded conditioning audio + continuation
+                shared = min(overlap_samples, len(chunk))
+                start = written - fade_samples
+                fade_chunk = chunk[shared - fade_samples:shared]
+                output[start:written] = output[start:written] * fade_out + fade_chunk * fade_in
+                continuation = chunk[shared:shared + total_samples - written]
+                output[written:written + len(continuation)] = continuation
+                written += len(continuation)
+
+        with tracing.span("postprocess"):
+            output = output[:written]
+            if Config.OUTPUT_CHANNELS == "mono":
+                output = audio_postprocess.downmix(output)
+            output = audio_postprocess.finalize_(output, self.sr)
+        return output
+
+    def _tokens_for(self, seconds):
         # Compute tokens based on duration
         tokens_per_second = getattr(Config, "TOKENS_PER_SECOND", 50)
-        max_new_tokens = int(tokens_per_second * duration)
-
-        with torch.no_grad():
-            audio_out = self.model.generate(
-                **inputs,
-                do_sample=True,
-                temperature=temperature,
-                max_new_tokens=max_new_tokens
+        return int(tokens_per_second * seconds)
+
+    def _prefix_ids(self, codes):
+        """Preview codes (num_codebooks, frames) as decoder_input_ids for a continuation"""
+        return torch.from_numpy(np.asarray(codes, dtype=np.int64)).to(self.device)
+
+    def _delay_steps(self):
+        """Codebooks per audio channel: the span of MusicGen's codebook delay pattern"""
+        num_codebooks = self.model.decoder.num_codebooks
+        return num_codebooks // 2 if self.model.decoder.config.audio_channels == 2 else num_codebooks
+
+    def _codes_from_ids(self, ids):
+        """
+        Undo MusicGen's delay pattern on the final decoder ids of batch item 0.
+
+        Codebook k of a channel is shifted right by k + 1 positions (start
+        token + delay; stereo interleaves left/right codebooks), so each
+        codebook holds len - codebooks-per-channel valid frames.
+        """
+        num_codebooks = self.model.decoder.num_codebooks
+        stereo = self.model.decoder.config.audio_channels == 2
+        ids = ids[:num_codebooks].cpu().numpy()
+        frames = ids.shape[-1] - self._delay_steps()
+        delays = [k // 2 if stereo else k for k in range(num_codebooks)]
+        return np.stack([ids[k, delays[k] + 1:delays[k] + 1 + frames] for k in range(num_codebooks)]).astype(np.int16)
+
+    def _sampling(self, temperature=Config.TEMPERATURE, top_k=None, top_p=None, guidance_scale=None,
+                  cfg_strategy=None, cfg_steps=None):
+        """Sampling settings with the Config defaults filled in"""
+        sampling = {
+            "temperature": temperature,
+            "top_k": Config.TOP_K if top_k is None else top_k,
+            "top_p": Config.TOP_P if top_p is None else top_p,
+            "guidance_scale": Config.CLASSIFIER_FREE_GUIDANCE if guidance_scale is None else guidance_scale,
+            "cfg_strategy": cfg_strategy or Config.CFG_STRATEGY,
+            "cfg_steps": Config.CFG_STEPS if cfg_steps is None else cfg_steps,
+        }
+        if sampling["cfg_strategy"] not in CFG_STRATEGIES:
+            raise ValueError(f"Unknown CFG strategy {sampling['cfg_strategy']!r}; expected one of {CFG_STRATEGIES}")
+        return sampling
+
+    def _generate(self, inputs, max_new_tokens, sampling, stop_check=None, progress_callback=None,
+                  return_codes=False):
+        """
+        Decode `max_new_tokens` with the configured CFG strategy.
+
+        Classifier-free guidance runs a conditional and an unconditional pass
+        on every step, doubling the decoder batch:
+            off      no guidance
+            full     guidance on every step
+            first_n  guidance for the first cfg_steps tokens only; decoding
+                     then continues those codes unguided at half the cost
+
+        Returns (audio_tensor, final progress report, codes or None).
+        """
+        strategy = sampling["cfg_strategy"]
+        total_tokens = self._planned_tokens(max_new_tokens, sampling)
+        if total_tokens != max_new_tokens:
+            guided_tokens = sampling["cfg_steps"]
+            unguided_tokens = total_tokens - guided_tokens
+
+            _, first, codes = self._decode(
+                inputs, guided_tokens, sampling, sampling["guidance_scale"], stop_check,
+                _offset_progress(progress_callback, 0, 0.0, total_tokens), return_codes=True
             )
+            rest_inputs = {name: value for name, value in inputs.items() if name in ("input_ids", "attention_mask")}
+            rest_inputs["decoder_input_ids"] = self._prefix_ids(codes)
+            audio_tensor, second, codes = self._decode(
+                rest_inputs, unguided_tokens, sampling, 1.0, stop_check,
+                _offset_progress(progress_callback, first["tokens"], first["elapsed"], total_tokens), return_codes
+            )
+            elapsed = first["elapsed"] + second["elapsed"]
+            report = {
+                "tokens": first["tokens"] + second["tokens"],
+                "total_tokens": total_tokens,
+                "elapsed": round(elapsed, 3),
+                "tokens_per_second": round((first["tokens"] + second["tokens"]) / elapsed, 2) if elapsed else 0.0,
+                "eta_seconds": 0.0,
+            }
+        else:
+            guidance_scale = 1.0 if strategy == "off" else sampling["guidance_scale"]
+            audio_tensor, report, codes = self._decode(inputs, max_new_tokens, sampling, guidance_scale,
+                                                       stop_check, progress_callback, return_codes)
+        self._log_throughput(report)
+        return audio_tensor, report, codes
 
-        audio_tensor = audio_out[0]  # first batch
-        audio_arr = self._postprocess(audio_tensor)
-        return audio_arr
+    def _planned_tokens(self, max_new_tokens, sampling):
+        """Decoding steps _generate will run for `max_new_tokens` under this sampling config"""
+        delay_steps = self._delay_steps()
+        if sampling["cfg_strategy"] == "first_n" and max_new_tokens > sampling["cfg_steps"] + delay_steps:
+            # The guided phase's last delay_steps - 1 steps are incomplete delayed frames, re-decoded later
+            return max_new_tokens + delay_steps - 1
+        return max_new_tokens
+
+    def _encoder_outputs(self, inputs, guidance_scale):
+        """
+        Replace text encoding inside model.generate with cached encoder states.
+
+        Each prompt in the batch is looked up by its token ids; misses are
+        encoded together and cached. Rows are right-padded to a common length,
+        and for classifier-free guidance the null (all-zero) conditioning
+        that generate() would add is appended here.
+        """
+        input_ids = inputs["input_ids"]
+        attention_mask = inputs.get("attention_mask")
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+
+        keys = [tuple(row[mask.bool()].tolist()) for row, mask in zip(input_ids, attention_mask)]
+        states = [self.text_cache.get(key) for key in keys]
+        missing = [i for i, state in enumerate(states) if state is None]
+        if missing:
+            with torch.no_grad():
+                hidden = self.model.text_encoder(
+                    input_ids=input_ids[missing], attention_mask=attention_mask[missing]
+                ).last_hidden_state
+            for row, i in enumerate(missing):
+                states[i] = hidden[row, :len(keys[i])].clone()
+                self.text_cache.put(keys[i], states[i])
 
-    def save_audio(self, audio_array: np.ndarray, out_path: str):
+        length = max(state.shape[0] for state in states)
+        last_hidden_state = states[0].new_zeros((len(states), length, states[0].shape[-1]))
+        mask = attention_mask.new_zeros((len(states), length))
+        for i, state in enumerate(states):
+            last_hidden_state[i, :state.shape[0]] = state
+            mask[i, :state.shape[0]] = 1
+
+        if guidance_scale is not None and guidance_scale > 1:
+            last_hidden_state = torch.cat([last_hidden_state, torch.zeros_like(last_hidden_state)], dim=0)
+            mask = torch.cat([mask, torch.zeros_like(mask)], dim=0)
+
+        inputs = dict(inputs)
+        inputs["encoder_outputs"] = BaseModelOutput(last_hidden_state=last_hidden_state)
+        inputs["attention_mask"] = mask
+        return inputs
+
+    def _decode(self, inputs, max_new_tokens, sampling, guidance_scale, stop_check=None, progress_callback=None,
+                return_codes=False):
+        """
+        Run model.generate on the first batch item.
+
+        Returns (audio_tensor, final progress report, codes or None).
+        """
+        if self.text_cache is not None:
+            inputs = self._encoder_outputs(inputs, guidance_scale)
+        progress = _ProgressCriteria(max_new_tokens, progress_callback)
+        criteria = [progress]
+        stop_criteria = None
+        if stop_check is not None:
+            stop_criteria = _StopCheckCriteria(stop_check)
+            criteria.append(stop_criteria)
+
+        span = tracing.begin_span("generate")
+        try:
+            with torch.no_grad():
+                audio_out = self.model.generate(
+                    **inputs,
+                    do_sample=True,
+                    temperature=sampling["temperature"],
+                    top_k=sampling["top_k"],
+                    top_p=sampling["top_p"],
+                    guidance_scale=guidance_scale,
+                    max_new_tokens=max_new_tokens,
+                    stopping_criteria=StoppingCriteriaList(criteria)
+                )
+        except RuntimeError:
+            # An early stop leaves MusicGen's codebook delay pattern incomplete,
+            # which can fail inside generate(); report it as a cancellation.
+            if stop_criteria is None or not stop_criteria.stopped:
+                raise
+        finally:
+            generate_seconds = tracing.end_span(span)
+        tracing.record_remainder(span, generate_seconds, "autoregressive_decode")
+        report = progress.report()
+        if stop_criteria is not None and stop_criteria.stopped:
+            raise GenerationCancelled("Generation stopped by stop_check")
+
+        codes = self._codes_from_ids(progress.last_ids) if return_codes else None
+        return audio_out[0], report, codes  # first batch
+
+    def _log_throughput(self, progress):
+        """Log decoding speed so a slow worker or degraded CPU shows up"""
+        rate = progress["tokens_per_second"]
+        print(f"⚡ Decoded {progress['tokens']}/{progress['total_tokens']} tokens in "
+              f"{progress['elapsed']:.1f}s ({rate:.1f} tokens/s, pid {os.getpid()})")
+        tracing.metrics.set_gauge("decode_tokens_per_second", rate, **tracing.process_labels())
+        tracing.set_attribute("tokens_per_second", rate)
+
+    def save_audio(self, audio_array: np.ndarray, out_path: str, sample_rate: int = None):
         """
         Save audio to WAV and optionally MP3.
+
+        The audio (mono or (samples, channels)) is resampled from self.sr
+        to `sample_rate`, default Config.OUTPUT_SAMPLE_RATE, before writing.
         Returns (wav_path, mp3_path or None).
         """
         os.makedirs(os.path.dirname(out_path), exist_ok=True)
         wav_path = out_path if out_path.endswith(".wav") else out_path + ".wav"
+        sample_rate = sample_rate or Config.OUTPUT_SAMPLE_RATE or self.sr
 
         # Save WAV
-        sf.write(wav_path, audio_array, self.sr, format="WAV", subtype="PCM_16")
+        with tracing.span("wav_write"):
+            audio_array = audio_postprocess.resample(audio_array, self.sr, sample_rate)
+            sf.write(wav_path, audio_array, sample_rate, format="WAV", subtype="PCM_16")
 
         # Save MP3 (if pydub + ffmpeg available)
         mp3_path = wav_path.replace(".wav", ".mp3")
         if PydubAvailable:
             try:
-                AudioSegment.from_wav(wav_path).export(mp3_path, format="mp3", bitrate=Config.AUDIO_BITRATE)
+                with tracing.span("mp3_export"):
+                    AudioSegment.from_wav(wav_path).export(mp3_path, format="mp3", bitrate=Config.AUDIO_BITRATE)
             except Exception:
                 mp3_path = None
         else:
@@ -1,88 +1,150 @@
 # music_parameters.py
+"""
+Mood -> MusicGen parameters.
+
+Mood analysis yields one of the moods below and an energy level rounded
+to 0.5 on a 0-10 scale, so there are only len(mood_mappings) x 21
+distinct parameter sets. They are computed once per process into a table
+of frozen MusicParams; get_music_parameters() is a dict lookup and every
+caller shares the same immutable objects, which also gives downstream
+caches and pre-generation a stable (mood, energy_level) key.
+"""
+from dataclasses import asdict, dataclass
+from functools import lru_cache
 from config import Config
 
+# Energy levels produced by MoodAnalyzer.calculate_energy
+ENERGY_STEP = 0.5
+ENERGY_LEVELS = tuple(i * ENERGY_STEP for i in range(int(10 / ENERGY_STEP) + 1))
+
+
+@dataclass(frozen=True)
+class MusicParams:
+    """Musical parameters for one (mood, energy_level) pair"""
+    mood: str
+    tempo: int
+    key: str
+    scale: str
+    dynamics: str
+    instruments: tuple
+    complexity: str
+    energy_level: float
+    description: str
+    musicgen_prompt: str
+
+    @property
+    def cache_key(self):
+        return (self.mood, self.energy_level)
+
+    # Read-only dict-style access, as returned before the table existed
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def to_dict(self):
+        """Plain dict for JSON (history rows, job params)"""
+        params = asdict(self)
+        params['instruments'] = list(self.instruments)
+        return params
+
+
 class MusicParameters:
-    def __init__(self):
-        # Mood to music parameter mappings
-        self.mood_mappings = {
-            'happy': {
-                'tempo': 120,
-                'key': 'C',
-                'scale': 'major',
-                'dynamics': 'mezzo-forte',
-                'instruments': ['piano', 'violin', 'flute', 'acoustic guitar', 'mandolin', 'celesta'],
-                'complexity': 'medium',
-                'energy_level': 8,
-                'description': 'upbeat cheerful joyful positive uplifting'
-            },
-            'sad': {
-                'tempo': 60,
-                'key': 'D',
-                'scale': 'minor',
-                'dynamics': 'piano',
-                'instruments': ['cello', 'piano', 'harp', 'viola', 'english horn', 'glass harmonica'],
-                'complexity': 'low',
-                'energy_level': 3,
-                'description': 'melancholic sorrowful emotional reflective'
-            },
-            'calm': {
-                'tempo': 80,
-                'key': 'G',
-                'scale': 'major',
-                'dynamics': 'piano',
-                'instruments': ['harp', 'flute', 'strings', 'piano', 'wind chimes', 'ambient pad'],
-                'complexity': 'low',
-                'energy_level': 4,
-                'description': 'peaceful relaxing ambient soothing tranquil'
-            },
-            'energetic': {
-                'tempo': 140,
-                'key': 'F',
-                'scale': 'major',
-                'dynamics': 'forte',
-                'instruments': ['drums', 'electric guitar', 'trumpet', 'saxophone', 'bass guitar', 'tambourine'],
-                'complexity': 'high',
-                'energy_level': 9,
-                'description': 'energetic powerful driving intense exciting'
-            },
-            'mysterious': {
-                'tempo': 90,
-                'key': 'E',
-                'scale': 'minor',
-                'dynamics': 'mezzo-piano',
-                'instruments': ['cello', 'bassoon', 'harp', 'theremin', 'vibraphone', 'waterphone'],
-                'complexity': 'medium',
-                'energy_level': 6,
-                'description': 'mysterious suspenseful enigmatic atmospheric'
-            },
-            'romantic': {
-                'tempo': 100,
-                'key': 'A',
-                'scale': 'major',
-                'dynamics': 'mezzo-piano',
-                'instruments': ['violin', 'piano', 'cello', 'french horn', 'clarinet', 'harp'],
-                'complexity': 'medium',
-                'energy_level': 7,
-                'description': 'romantic loving passionate emotional tender'
-            },
-            'neutral': {
-                'tempo': 100,
-                'key': 'C',
-                'scale': 'major',
-                'dynamics': 'mezzo-piano',
-                'instruments': ['piano', 'acoustic guitar', 'strings', 'flute', 'soft synth', 'xylophone'],
-                'complexity': 'medium',
-                'energy_level': 5,
-                'description': 'balanced neutral pleasant background'
-            }
+    # Mood to music parameter mappings
+    mood_mappings = {
+        'happy': {
+            'tempo': 120,
+            'key': 'C',
+            'scale': 'major',
+            'dynamics': 'mezzo-forte',
+            'instruments': ['piano', 'violin', 'flute', 'acoustic guitar', 'mandolin', 'celesta'],
+            'complexity': 'medium',
+            'energy_level': 8,
+            'description': 'upbeat cheerful joyful positive uplifting'
+        },
+        'sad': {
+            'tempo': 60,
+            'key': 'D',
+            'scale': 'minor',
+            'dynamics': 'piano',
+            'instruments': ['cello', 'piano', 'harp', 'viola', 'english horn', 'glass harmonica'],
+            'complexity': 'low',
+            'energy_level': 3,
+            'description': 'melancholic sorrowful emotional reflective'
+        },
+        'calm': {
+            'tempo': 80,
+            'key': 'G',
+            'scale': 'major',
+            'dynamics': 'piano',
+            'instruments': ['harp', 'flute', 'strings', 'piano', 'wind chimes', 'ambient pad'],
+            'complexity': 'low',
+            'energy_level': 4,
+            'description': 'peaceful relaxing ambient soothing tranquil'
+        },
+        'energetic': {
+            'tempo': 140,
+            'key': 'F',
+            'scale': 'major',
+            'dynamics': 'forte',
+            'instruments': ['drums', 'electric guitar', 'trumpet', 'saxophone', 'bass guitar', 'tambourine'],
+            'complexity': 'high',
+            'energy_level': 9,
+            'description': 'energetic powerful driving intense exciting'
+        },
+        'mysterious': {
+            'tempo': 90,
+            'key': 'E',
+            'scale': 'minor',
+            'dynamics': 'mezzo-piano',
+            'instruments': ['cello', 'bassoon', 'harp', 'theremin', 'vibraphone', 'waterphone'],
+            'complexity': 'medium',
+            'energy_level': 6,
+            'description': 'mysterious suspenseful enigmatic atmospheric'
+        },
+        'romantic': {
+            'tempo': 100,
+            'key': 'A',
+            'scale': 'major',
+            'dynamics': 'mezzo-piano',
+            'instruments': ['violin', 'piano', 'cello', 'french horn', 'clarinet', 'harp'],
+            'complexity': 'medium',
+            'energy_level': 7,
+            'description': 'romantic loving passionate emotional tender'
+        },
+        'neutral': {
+            'tempo': 100,
+            'key': 'C',
+            'scale': 'major',
+            'dynamics': 'mezzo-piano',
+            'instruments': ['piano', 'acoustic guitar', 'strings', 'flute', 'soft synth', 'xylophone'],
+            'complexity': 'medium',
+            'energy_level': 5,
+            'description': 'balanced neutral pleasant background'
         }
+    }
+
+    def __init__(self):
+        self.table = parameter_table()
 
     def get_music_parameters(self, mood_analysis):
+        """Frozen MusicParams for a mood analysis; off-grid energy levels are computed on demand"""
         mood = mood_analysis.get('mood', 'neutral')
-        energy_level = mood_analysis.get('energy_level', 5)
+        if mood not in self.mood_mappings:
+            mood = 'neutral'
+        energy_level = float(mood_analysis.get('energy_level', 5))
+        params = self.table.get((mood, energy_level))
+        if params is None:
+            params = self.build_parameters(mood, energy_level)
+        return params
 
-        # Get base parameters for the mood
-        params = self.mood_mappings.get(mood, self.mood_mappings['neutral']).copy()
+    @classmethod
+    def build_parameters(cls, mood, energy_level):
+        params = dict(cls.mood_mappings[mood])
 
         # Adjust tempo based on energy level
         energy_factor = energy_level / 10
@@ -100,13 +162,15 @@ class MusicParameters:
 
         # Update energy level in params
         params['energy_level'] = energy_level
+        params['instruments'] = tuple(params['instruments'])
 
         # Generate a text prompt for MusicGen based on parameters
-        params['musicgen_prompt'] = self._generate_musicgen_prompt(params)
+        params['musicgen_prompt'] = cls._generate_musicgen_prompt(params)
 
-        return params
+        return MusicParams(mood=mood, **params)
 
-    def _generate_musicgen_prompt(self, params):
+    @staticmethod
+    def _generate_musicgen_prompt(params):
         """Generate a text prompt for MusicGen based on musical parameters."""
         # Select top 2-3 instruments for the prompt
         instruments = params['instruments'][:3] if len(params['instruments']) > 2 else params['instruments']
@@ -120,3 +184,13 @@ class MusicParameters:
         ]
 
         return ", ".join(prompt_parts)
+
+
+@lru_cache(maxsize=None)
+def parameter_table():
+    """{(mood, energy_level): MusicParams} for every mood and ENERGY_LEVELS step, built once"""
+    return {
+        (mood, energy_level): MusicParameters.build_parameters(mood, energy_level)
+        for mood in MusicParameters.mood_mappings
+        for energy_level in ENERGY_LEVELS
+    }
@@ -0,0 +1,230 @@
+# scratch_space.py
+"""
+Scratch space for generated audio before (and shortly after) it is
+persisted.
+
+Every job writes into its own directory, jobs/<id>/, under scratch_root():
+Config.TEMP_AUDIO_DIR, or a directory on /dev/shm when
+Config.SCRATCH_PREFER_TMPFS is set and a large enough tmpfs is mounted
+there, so WAV round trips stay in memory. The audio pool keeps its clips
+in pool/.
+
+Callers release a job's directory once its bytes are stored elsewhere
+(bulk_generate.py, the audio pool). ScratchSweeper removes the rest:
+- directories of finished jobs after Config.SCRATCH_RETENTION_SECONDS,
+  which leaves time to play a result or continue a preview;
+- directories without a job;
+- the oldest finished jobs first whenever usage exceeds
+  Config.SCRATCH_MAX_MB.
+Queued and running jobs are never touched. Usage is exported as
+scratch_* gauges.
+
+    python scratch_space.py usage
+    python scratch_space.py sweep
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from config import Config
+import tracing
+
+_root = None
+_root_lock = threading.Lock()
+
+
+def _tmpfs_root():
+    """Directory on /dev/shm for this TEMP_AUDIO_DIR, or None if no suitable tmpfs is mounted"""
+    try:
+        with open("/proc/mounts") as f:
+            mounted = any(line.split()[1:3] == ["/dev/shm", "tmpfs"] for line in f)
+        stats = os.statvfs("/dev/shm")
+    except OSError:
+        return None
+    # Decided on the mount's total size, not free space, so every process picks the same root
+    size_mb = stats.f_blocks * stats.f_frsize / 2**20
+    if not mounted or size_mb < (Config.SCRATCH_MAX_MB or 0) or not os.access("/dev/shm", os.W_OK):
+        return None
+    digest = hashlib.sha1(os.path.abspath(Config.TEMP_AUDIO_DIR).encode()).hexdigest()[:10]
+    return os.path.join("/dev/shm", f"melodai-{digest}")
+
+
+def scratch_root():
+    """Root of the scratch space (resolved once per process)"""
+    global _root
+    with _root_lock:
+        if _root is None:
+            _root = (Config.SCRATCH_PREFER_TMPFS and _tmpfs_root()) or Config.TEMP_AUDIO_DIR
+        return _root
+
+
+def path(*parts):
+    return os.path.join(scratch_root(), *parts)
+
+
+def job_dir(job_id):
+    return path("jobs", str(job_id))
+
+
+def allocate(job_id):
+    """Create (if needed) and return a job's scratch directory"""
+    directory = job_dir(job_id)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def release(job_id):
+    """Delete a job's scratch directory once its audio is stored elsewhere"""
+    directory = job_dir(job_id)
+    freed = _tree_size(directory)[0]
+    shutil.rmtree(directory, ignore_errors=True)
+    if freed:
+        tracing.metrics.inc("scratch_released_bytes", freed)
+    return freed
+
+
+def _tree_size(directory):
+    """(bytes, files, newest mtime) of a directory tree"""
+    total, files, newest = 0, 0, 0.0
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue  # removed while walking
+            total += stat.st_size
+            files += 1
+            newest = max(newest, stat.st_mtime)
+    return total, files, newest
+
+
+def usage():
+    """Bytes and files under the scratch root, the number of job directories and the free space left"""
+    root = scratch_root()
+    total, files, _ = _tree_size(root)
+    jobs_root = os.path.join(root, "jobs")
+    job_dirs = len(os.listdir(jobs_root)) if os.path.isdir(jobs_root) else 0
+    free = shutil.disk_usage(root if os.path.isdir(root) else ".").free
+    return {"root": root, "bytes": total, "files": files, "job_dirs": job_dirs, "free_bytes": free}
+
+
+class ScratchSweeper:
+    """
+    Removes job directories that are no longer needed, every
+    Config.SCRATCH_SWEEP_INTERVAL seconds on a daemon thread.
+    """
+
+    def __init__(self, db_path=Config.JOBS_DB_PATH):
+        self.db_path = db_path
+        self.last_result = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background sweep thread (no-op if already started)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scratch-sweeper", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ Scratch sweep failed: {e}")
+            time.sleep(Config.SCRATCH_SWEEP_INTERVAL)
+
+    def _job_states(self, job_ids):
+        """{job_id: (status, seconds since it finished or None)} from the job table"""
+        if not job_ids:
+            return {}
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            rows = conn.execute(
+                f"SELECT id, status, (julianday('now') - julianday(finished_at)) * 86400.0 FROM generation_jobs "
+                f"WHERE id IN ({', '.join('?' * len(job_ids))})",
+                job_ids
+            ).fetchall()
+        except sqlite3.OperationalError:  # no job table yet
+            rows = []
+        finally:
+            conn.close()
+        return {job_id: (status, age) for job_id, status, age in rows}
+
+    def sweep(self):
+        """One pass: expire finished and orphaned job directories, then enforce the size bound"""
+        jobs_root = path("jobs")
+        entries = os.listdir(jobs_root) if os.path.isdir(jobs_root) else []
+        job_ids = [int(name) for name in entries if name.isdigit()]
+        states = self._job_states(job_ids)
+        now = time.time()
+        retention = Config.SCRATCH_RETENTION_SECONDS
+
+        removable = []  # (age, job_id, bytes) of directories that may go
+        result = {"expired": 0, "evicted": 0, "freed_bytes": 0}
+        with tracing.span("scratch_sweep"):
+            for job_id in job_ids:
+                size, _, newest = _tree_size(job_dir(job_id))
+                status, age = states.get(job_id, (None, None))
+                if status in ("queued", "running"):
+                    continue
+                if status is None:  # no job row: use the files' age
+                    age = now - newest if newest else retention
+                age = age or 0.0
+                if age >= retention:
+                    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+                    result["expired"] += 1
+                    result["freed_bytes"] += size
+                else:
+                    removable.append((age, job_id, size))
+
+            limit = Config.SCRATCH_MAX_MB * 2**20 if Config.SCRATCH_MAX_MB else None
+            current = usage()
+            if limit is not None and current["bytes"] > limit:
+                over = current["bytes"] - limit
+                for age, job_id, size in sorted(removable, reverse=True):
+                    if over <= 0:
+                        break
+                    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+                    result["evicted"] += 1
+                    result["freed_bytes"] += size
+                    over -= size
+                current = usage()
+
+        if result["freed_bytes"]:
+            tracing.metrics.inc("scratch_swept_bytes", result["freed_bytes"])
+        tracing.metrics.set_gauge("scratch_bytes", current["bytes"])
+        tracing.metrics.set_gauge("scratch_files", current["files"])
+        tracing.metrics.set_gauge("scratch_job_dirs", current["job_dirs"])
+        tracing.metrics.set_gauge("scratch_free_bytes", current["free_bytes"])
+        result.update(current)
+        self.last_result = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), **result}
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MelodAI scratch space for generated audio")
+    parser.add_argument("--db", default=Config.JOBS_DB_PATH, help="SQLite database holding the job queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("usage", help="Space used under the scratch root")
+    sub.add_parser("sweep", help="Remove expired job directories and enforce SCRATCH_MAX_MB")
+    args = parser.parse_args(argv)
+
+    if args.command == "usage":
+        current = usage()
+    else:
+        current = ScratchSweeper(args.db).sweep()
+        print(f"🧹 {current['expired']} expired, {current['evicted']} evicted, "
+              f"{current['freed_bytes'] / 2**20:.1f} MB freed")
+    print(f"📁 {current['root']}: {current['bytes'] / 2**20:.1f} MB in {current['files']} files, "
+          f"{current['job_dirs']} job directories, {current['free_bytes'] / 2**30:.1f} GB free")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,151 @@
+# tiny_models.py
+"""
+Tiny randomly-initialized stand-ins for the MelodAI models.
+
+They use the real architectures (MusicGen with T5 + EnCodec, a RoBERTa
+sequence classifier, a RoBERTa sentence encoder, CLAP for benchmark scoring) but only a few hundred thousand parameters, so the
+benchmarks run offline without downloading checkpoints. The output is noise;
+only the timings mean anything.
+
+    from tiny_models import use_tiny_models
+    use_tiny_models()   # before creating MusicGenerator / MoodAnalyzer
+"""
+import os
+import tempfile
+from config import Config
+
+TINY_MUSICGEN = "tiny-random/musicgen"
+TINY_SENTIMENT = "tiny-random/sentiment"
+TINY_EMBEDDING = "tiny-random/embedding"
+TINY_CLAP = "tiny-random/clap"
+TINY_REVISION = "tiny"
+
+# Enough vocabulary for the prompts MusicParameters builds
+TINY_WORDS = (
+    "upbeat cheerful joyful positive uplifting melancholic sorrowful emotional reflective "
+    "peaceful relaxing ambient soothing tranquil energetic powerful driving intense exciting "
+    "mysterious suspenseful enigmatic atmospheric romantic loving passionate tender balanced "
+    "neutral pleasant background bpm major minor with dynamics piano forte mezzo violin flute "
+    "cello harp drums guitar strings calm happy sad I feel love"
+).split()
+
+
+def _snapshot_dir(store_dir, model_name):
+    """Create the huggingface_hub cache layout so model_store can resolve it offline"""
+    repo_dir = os.path.join(store_dir, "models--" + model_name.replace("/", "--"))
+    os.makedirs(os.path.join(repo_dir, "refs"), exist_ok=True)
+    with open(os.path.join(repo_dir, "refs", "main"), "w") as f:
+        f.write(TINY_REVISION)
+    path = os.path.join(repo_dir, "snapshots", TINY_REVISION)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _build_tokenizer(special_tokens):
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    vocab = [(token, 0.0) for token in special_tokens] + [(word.lower(), -1.0) for word in TINY_WORDS]
+    tokenizer = Tokenizer(models.Unigram(vocab, unk_id=special_tokens.index("<unk>")))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return tokenizer, len(vocab)
+
+
+def _build_musicgen(path):
+    from transformers import (EncodecConfig, EncodecFeatureExtractor, MusicgenConfig,
+                              MusicgenDecoderConfig, MusicgenForConditionalGeneration,
+                              MusicgenProcessor, T5Config, T5TokenizerFast)
+
+    tokenizer, vocab_size = _build_tokenizer(["<pad>", "</s>", "<unk>"])
+    text_encoder = T5Config(vocab_size=vocab_size, d_model=32, d_kv=8, d_ff=64, num_layers=1, num_heads=2)
+    # Same frame rate (50 Hz) and codebook layout as musicgen-small, tiny widths
+    audio_encoder = EncodecConfig(
+        sampling_rate=Config.MUSICGEN_SAMPLING_RATE, audio_channels=1, num_filters=4,
+        codebook_size=2048, codebook_dim=8, hidden_size=8, upsampling_ratios=[8, 5, 4, 4],
+        target_bandwidths=[2.2], num_lstm_layers=1
+    )
+    decoder = MusicgenDecoderConfig(
+        vocab_size=2048, hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+        ffn_dim=64, num_codebooks=4, max_position_embeddings=4096
+    )
+    config = MusicgenConfig(
+        text_encoder=text_encoder.to_dict(), audio_encoder=audio_encoder.to_dict(), decoder=decoder.to_dict()
+    )
+    MusicgenForConditionalGeneration(config).save_pretrained(path)
+
+    processor = MusicgenProcessor(
+        feature_extractor=EncodecFeatureExtractor(feature_size=1, sampling_rate=Config.MUSICGEN_SAMPLING_RATE),
+        tokenizer=T5TokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>",
+                                  unk_token="<unk>", extra_ids=0)
+    )
+    processor.save_pretrained(path)
+
+
+def _build_sentiment(path):
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaForSequenceClassification
+
+    tokenizer, vocab_size = _build_tokenizer(["<s>", "<pad>", "</s>", "<unk>"])
+    config = RobertaConfig(
+        vocab_size=vocab_size, hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+        intermediate_size=64, num_labels=3, max_position_embeddings=Config.MAX_LENGTH * 4 + 2
+    )
+    RobertaForSequenceClassification(config).save_pretrained(path)
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", pad_token="<pad>", eos_token="</s>", unk_token="<unk>"
+    ).save_pretrained(path)
+
+
+def _build_embedding(path):
+    from transformers import PreTrainedTokenizerFast, RobertaConfig, RobertaModel
+
+    tokenizer, vocab_size = _build_tokenizer(["<s>", "<pad>", "</s>", "<unk>"])
+    config = RobertaConfig(
+        vocab_size=vocab_size, hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+        intermediate_size=64, max_position_embeddings=Config.MAX_LENGTH * 4 + 2
+    )
+    RobertaModel(config, add_pooling_layer=False).save_pretrained(path)
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<s>", pad_token="<pad>", eos_token="</s>", unk_token="<unk>"
+    ).save_pretrained(path)
+
+
+def _build_clap(path):
+    from transformers import ClapConfig, ClapFeatureExtractor, ClapModel, ClapProcessor, RobertaTokenizerFast
+
+    tokenizer, vocab_size = _build_tokenizer(["<s>", "<pad>", "</s>", "<unk>"])
+    config = ClapConfig(
+        text_config=dict(vocab_size=vocab_size, hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+                         intermediate_size=64, max_position_embeddings=Config.MAX_LENGTH + 2, projection_dim=16),
+        # HTSAT needs spec_size / num_mel_bins * spec_size >= the 1001 frames of a 10 s clip
+        audio_config=dict(hidden_size=32, patch_embeds_hidden_size=16, depths=[1, 1], num_attention_heads=[2, 2],
+                          window_size=8, spec_size=256, num_mel_bins=64, patch_size=4, patch_stride=[4, 4],
+                          projection_dim=16),
+        projection_dim=16
+    )
+    ClapModel(config).save_pretrained(path)
+    ClapProcessor(
+        feature_extractor=ClapFeatureExtractor(feature_size=64, sampling_rate=48000, truncation="rand_trunc"),
+        tokenizer=RobertaTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", pad_token="<pad>",
+                                       eos_token="</s>", unk_token="<unk>")
+    ).save_pretrained(path)
+
+
+def use_tiny_models(store_dir=None):
+    """
+    Build the tiny checkpoints (once) and point Config at them.
+
+    Returns the store directory, which child processes can pass back in.
+    """
+    store_dir = store_dir or os.path.join(tempfile.gettempdir(), "melodai_tiny_models")
+    for model_name, build in ((TINY_MUSICGEN, _build_musicgen), (TINY_SENTIMENT, _build_sentiment),
+                              (TINY_EMBEDDING, _build_embedding), (TINY_CLAP, _build_clap)):
+        path = _snapshot_dir(store_dir, model_name)
+        if not os.path.exists(os.path.join(path, "config.json")):
+            build(path)
+
+    Config.MODEL_CACHE_DIR = store_dir
+    Config.MODEL_LOCK_FILE = os.path.join(store_dir, "models.lock.json")
+    Config.MODEL_OFFLINE = True
+    Config.MUSICGEN_MODEL = TINY_MUSICGEN
+    Config.SENTIMENT_MODEL = TINY_SENTIMENT
+    Config.EMBEDDING_MODEL = TINY_EMBEDDING
+    Config.CLAP_MODEL = TINY_CLAP
+    return store_dir
@@ -0,0 +1,408 @@
+# tracing.py
+"""
+Lightweight per-request tracing and stage metrics.
+
+    with tracing.trace("compose", user="a@b.c"):
+        with tracing.span("tokenize"):
+            ...
+
+Spans nest per thread (contextvars), so the Streamlit session thread and
+each worker process keep their own request. Finished traces are appended
+to Config.TRACE_LOG_PATH as JSON lines (read by the admin page) and every
+span also feeds in-process stage histograms served in Prometheus text
+format by start_metrics_server().
+
+Only one process serves /metrics, but generation stages run in worker
+processes. Workers publish their histograms, counters and gauges to the
+shared job database (start_metrics_publisher()), and the serving process
+merges them in with the collect_process_metrics() collector. Gauges of
+other processes get a pid label; per-worker gauges such as decoding
+speed carry process_labels() themselves.
+"""
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+
+_current_trace = contextvars.ContextVar("melodai_trace", default=None)
+_worker_name = "main"
+
+# Histogram buckets (seconds) for stage durations
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float("inf"))
+
+
+class _StageMetrics:
+    """Thread-safe per-stage duration histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.sums = defaultdict(float)
+        self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+        self.counters = defaultdict(float)
+        self.gauges = {}   # (name, ((label, value), ...)) -> value
+        self.collectors = []
+        self.remote = {}   # pid -> snapshot() of another process
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.counts[stage] += 1
+            self.sums[stage] += seconds
+            buckets = self.buckets[stage]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+
+    def inc(self, name, value=1.0):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, tuple(sorted((k, str(v)) for k, v in labels.items())))] = value
+
+    def add_collector(self, collect):
+        """Register a callable run before each render, e.g. to refresh gauges from a database"""
+        with self._lock:
+            self.collectors.append(collect)
+
+    def snapshot(self):
+        """Histograms, counters and gauges as plain data, for publish_process_metrics()"""
+        with self._lock:
+            return {
+                "stages": {stage: {"count": self.counts[stage], "sum": self.sums[stage],
+                                   "buckets": list(self.buckets[stage])} for stage in self.counts},
+                "counters": dict(self.counters),
+                "gauges": [[name, dict(labels), value] for (name, labels), value in self.gauges.items()],
+            }
+
+    def set_remote(self, snapshots):
+        """Replace the snapshots of other processes merged into render()"""
+        with self._lock:
+            self.remote = dict(snapshots)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        for collect in list(self.collectors):
+            try:
+                collect()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+        with self._lock:
+            counts, sums = dict(self.counts), dict(self.sums)
+            buckets = {stage: list(self.buckets[stage]) for stage in self.counts}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            for pid, snapshot in self.remote.items():
+                for stage, histogram in snapshot["stages"].items():
+                    counts[stage] = counts.get(stage, 0) + histogram["count"]
+                    sums[stage] = sums.get(stage, 0.0) + histogram["sum"]
+                    buckets[stage] = [a + b for a, b in zip(buckets.get(stage, [0] * len(BUCKETS)),
+                                                            histogram["buckets"])]
+                for name, value in snapshot["counters"].items():
+                    counters[name] = counters.get(name, 0.0) + value
+                for name, labels, value in snapshot.get("gauges", []):
+                    labels.setdefault("pid", str(pid))
+                    gauges[(name, tuple(sorted(labels.items())))] = value
+
+            lines = [
+                "# HELP melodai_stage_seconds Duration of MelodAI pipeline stages",
+                "# TYPE melodai_stage_seconds histogram",
+            ]
+            for stage in sorted(counts):
+                for bound, count in zip(BUCKETS, buckets[stage]):
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'melodai_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'melodai_stage_seconds_sum{{stage="{stage}"}} {sums[stage]:.6f}')
+                lines.append(f'melodai_stage_seconds_count{{stage="{stage}"}} {counts[stage]}')
+            for name in sorted(counters):
+                lines.append(f"# TYPE melodai_{name} counter")
+                lines.append(f"melodai_{name} {counters[name]:g}")
+            typed = set()
+            for (name, labels), value in sorted(gauges.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE melodai_{name} gauge")
+                    typed.add(name)
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"melodai_{name}{{{label_text}}} {value:g}" if labels else f"melodai_{name} {value:g}")
+            return "\n".join(lines) + "\n"
+
+
+metrics = _StageMetrics()
+
+
+class Trace:
+    """One request: a name, attributes and a flat list of (possibly nested) spans"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.spans = []
+        self._stack = []
+
+    def begin(self, name):
+        span = {
+            "name": name,
+            "parent": self._stack[-1]["name"] if self._stack else None,
+            "offset_ms": round((time.time() - self.start) * 1000, 3),
+            "_t0": time.perf_counter(),
+            "_first_child": len(self.spans),
+        }
+        self._stack.append(span)
+        return span
+
+    def end(self, span):
+        seconds = time.perf_counter() - span.pop("_t0")
+        span["duration_ms"] = round(seconds * 1000, 3)
+        self._stack = [s for s in self._stack if s is not span]
+        self.spans.append(span)
+        return seconds
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.start)),
+            "pid": os.getpid(),
+            "duration_ms": round((time.time() - self.start) * 1000, 3),
+            "attributes": self.attributes,
+            "spans": [{k: v for k, v in s.items() if not k.startswith("_")} for s in self.spans],
+        }
+
+
+def set_worker_name(name):
+    """Name this process in process_labels(), e.g. worker-0"""
+    global _worker_name
+    _worker_name = name
+
+
+def process_labels():
+    """Labels identifying this process on per-worker gauges"""
+    return {"pid": os.getpid(), "worker": _worker_name}
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def set_attribute(key, value):
+    """Attach an attribute (e.g. job id) to the active trace, if any"""
+    active = _current_trace.get()
+    if active is not None:
+        active.attributes[key] = value
+
+
+def begin_span(name):
+    """Start a span on the active trace. Returns a token for end_span()."""
+    active = _current_trace.get()
+    if active is not None:
+        return active, active.begin(name)
+    return None, {"name": name, "_t0": time.perf_counter()}
+
+
+def end_span(token):
+    active, span = token
+    if active is not None:
+        seconds = active.end(span)
+    else:
+        seconds = time.perf_counter() - span["_t0"]
+    metrics.observe(span["name"], seconds)
+    return seconds
+
+
+@contextlib.contextmanager
+def span(name):
+    token = begin_span(name)
+    try:
+        yield
+    finally:
+        end_span(token)
+
+
+def record(name, seconds, parent=None):
+    """Record a stage whose duration was measured elsewhere (e.g. derived)"""
+    metrics.observe(name, seconds)
+    active = _current_trace.get()
+    if active is not None:
+        active.spans.append({"name": name, "parent": parent, "offset_ms": None,
+                             "duration_ms": round(seconds * 1000, 3)})
+
+
+def record_remainder(token, seconds, name):
+    """
+    Record the part of a finished span not covered by its child spans, e.g.
+    autoregressive decoding = generate - text encoding - EnCodec decoding.
+    """
+    active, parent = token
+    if active is None:
+        return
+    children_ms = sum(s["duration_ms"] for s in active.spans[parent["_first_child"]:]
+                      if s["parent"] == parent["name"])
+    record(name, max(0.0, seconds - children_ms / 1000), parent=parent["name"])
+
+
+@contextlib.contextmanager
+def trace(name, **attributes):
+    """Start a request trace; it is exported when the block exits"""
+    new_trace = Trace(name, **attributes)
+    reset = _current_trace.set(new_trace)
+    error = None
+    try:
+        with span(name):
+            yield new_trace
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_trace.reset(reset)
+        if error is not None:
+            new_trace.attributes["error"] = repr(error)
+        export(new_trace)
+
+
+def trace_module(module, name):
+    """Time every forward() of a torch module as a span called `name`"""
+    local = threading.local()  # a shared model may run in several session threads
+
+    def pre_hook(mod, args):
+        if not hasattr(local, "tokens"):
+            local.tokens = []
+        local.tokens.append(begin_span(name))
+
+    def post_hook(mod, args, output):
+        if getattr(local, "tokens", None):
+            end_span(local.tokens.pop())
+
+    module.register_forward_pre_hook(pre_hook)
+    module.register_forward_hook(post_hook)
+
+
+_export_lock = threading.Lock()
+
+
+def export(finished_trace):
+    """Append a finished trace to the JSONL log (rotating at TRACE_LOG_MAX_BYTES)"""
+    if not Config.TRACE_LOG_PATH:
+        return
+    line = json.dumps(finished_trace.to_dict()) + "\n"
+    try:
+        with _export_lock:
+            os.makedirs(os.path.dirname(Config.TRACE_LOG_PATH) or ".", exist_ok=True)
+            if (os.path.exists(Config.TRACE_LOG_PATH)
+                    and os.path.getsize(Config.TRACE_LOG_PATH) > Config.TRACE_LOG_MAX_BYTES):
+                os.replace(Config.TRACE_LOG_PATH, Config.TRACE_LOG_PATH + ".1")
+            with open(Config.TRACE_LOG_PATH, "a") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"⚠️ Could not write trace log: {e}")
+
+
+def read_recent_traces(limit=50, name=None):
+    """Most recent traces from the JSONL log, newest first"""
+    if not Config.TRACE_LOG_PATH or not os.path.exists(Config.TRACE_LOG_PATH):
+        return []
+    recent = deque(maxlen=limit)
+    with open(Config.TRACE_LOG_PATH) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if name is None or entry.get("name") == name:
+                recent.append(entry)
+    return list(reversed(recent))
+
+
+def _process_metrics_db(db_path=None):
+    conn = sqlite3.connect(db_path or Config.JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS process_metrics (
+        pid INTEGER PRIMARY KEY,
+        updated REAL NOT NULL,
+        snapshot TEXT NOT NULL
+    )
+    ''')
+    return conn
+
+
+def publish_process_metrics(db_path=None):
+    """Store this process's histograms and counters in the shared database"""
+    conn = _process_metrics_db(db_path)
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO process_metrics (pid, updated, snapshot) VALUES (?, ?, ?)",
+            (os.getpid(), time.time(), json.dumps(metrics.snapshot()))
+        )
+    finally:
+        conn.close()
+
+
+def start_metrics_publisher(db_path=None, interval=None):
+    """Publish this process's metrics every `interval` seconds on a daemon thread (worker processes)"""
+    interval = interval or Config.METRICS_PUBLISH_INTERVAL
+
+    def run():
+        while True:
+            try:
+                publish_process_metrics(db_path)
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not publish metrics: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-publisher", daemon=True)
+    thread.start()
+    return thread
+
+
+def collect_process_metrics(db_path=None):
+    """
+    Collector for the process serving /metrics: merge in the metrics other
+    processes published. Processes that stopped publishing (exited
+    workers) are dropped after three publish intervals.
+    """
+    conn = _process_metrics_db(db_path)
+    try:
+        conn.execute("DELETE FROM process_metrics WHERE updated < ?",
+                     (time.time() - 3 * Config.METRICS_PUBLISH_INTERVAL,))
+        rows = conn.execute("SELECT pid, snapshot FROM process_metrics WHERE pid != ?", (os.getpid(),)).fetchall()
+    finally:
+        conn.close()
+    metrics.set_remote({pid: json.loads(snapshot) for pid, snapshot in rows})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """Serve /metrics on a daemon thread. Returns the server, or None if the port is taken."""
+    port = port or Config.METRICS_PORT
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"⚠️ Metrics endpoint not started on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics at http://{host}:{port}/metrics")
+    return server